@@ -0,0 +1,312 @@
+import os
+import sys
+import json
+import time
+import struct
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+from azure_kinect_depth_codec import codec_for, make_codec
+from azure_kinect_manifest import config_hash, find_depth, list_shots
+
+
+CACHE_NAME = "batch_cache.json"
+STATS_NAME = "depth_stats.jsonl"
+# Outcome of a task on a shot, as returned by the pool
+DONE, UNCHANGED, FAILED = "done", "unchanged", "failed"
+# Seconds between two writes of the cache during a run
+CACHE_INTERVAL = 30.0
+# Start of frame markers of the JPEG formats
+JPEG_SOF = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(blob):
+    # (width, height) from the frame header of a JPEG file, None if not found
+    i = 2
+    while i + 9 <= len(blob):
+        if blob[i] != 0xFF:
+            return None
+        marker = blob[i + 1]
+        if marker == 0xFF:
+            # Fill byte
+            i += 1
+            continue
+        if marker in JPEG_SOF:
+            height, width = struct.unpack_from(">HH", blob, i + 5)
+            return width, height
+        i += 2 + struct.unpack_from(">H", blob, i + 2)[0]
+    return None
+
+
+class Thumbnails:
+    """thumbnails/<shot>.jpg, `width` pixels wide."""
+    name = "thumbnails"
+
+    def __init__(self, width=320):
+        self.width = width
+
+    def params(self):
+        return {"width": self.width}
+
+    def inputs(self, root, name, depth_streams):
+        return {"color": os.path.join(root, "color", name + ".jpg")}
+
+    def outputs(self, root, name, depth_streams):
+        return [os.path.join(root, "thumbnails", name + ".jpg")]
+
+    def run(self, root, name, inputs, data, depth_streams):
+        # The JPEG decoder scales by 1/2, 1/4 or 1/8 at a fraction of the
+        # cost of a full decode, as long as the result is still wide enough
+        size = jpeg_size(data["color"])
+        flags = cv2.IMREAD_COLOR
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if size is not None and size[0] // factor >= self.width:
+                flags = reduced
+                break
+        image = cv2.imdecode(np.frombuffer(data["color"], dtype=np.uint8), flags)
+        if image is None:
+            raise ValueError("Unable to decode " + inputs["color"])
+        height = max(1, round(image.shape[0] * self.width / image.shape[1]))
+        image = cv2.resize(image, (self.width, height), interpolation=cv2.INTER_AREA)
+        path = self.outputs(root, name, depth_streams)[0]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not cv2.imwrite(path, image):
+            raise OSError("Unable to write " + path)
+        return None
+
+
+class ConvertDepth:
+    """Depth frames re-encoded with another codec or png level, to converted/depth/<stream>/."""
+    name = "convert"
+
+    def __init__(self, depth_codec="rvl", png_level=None):
+        self.codec = make_codec(depth_codec, png_level)
+
+    def params(self):
+        return {"codec": self.codec.name, "png_level": getattr(self.codec, "level", None)}
+
+    def inputs(self, root, name, depth_streams):
+        return {stream: find_depth(root, stream, name) for stream in depth_streams}
+
+    def outputs(self, root, name, depth_streams):
+        return [os.path.join(root, "converted", "depth", stream, name + self.codec.extension) for stream in depth_streams]
+
+    def run(self, root, name, inputs, data, depth_streams):
+        for stream, path in zip(depth_streams, self.outputs(root, name, depth_streams)):
+            depth = codec_for(inputs[stream]).decode(data[stream])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(self.codec.encode(depth))
+        return None
+
+
+class DepthStats:
+    """Valid pixel ratio and range (mm) of every depth stream, kept in the
+    cache and written to depth_stats.jsonl."""
+    name = "stats"
+
+    def params(self):
+        return {}
+
+    def inputs(self, root, name, depth_streams):
+        return {stream: find_depth(root, stream, name) for stream in depth_streams}
+
+    def outputs(self, root, name, depth_streams):
+        return []
+
+    def run(self, root, name, inputs, data, depth_streams):
+        stats = {}
+        for stream in depth_streams:
+            depth = codec_for(inputs[stream]).decode(data[stream])
+            valid = depth[depth != 0]
+            stats[stream] = {"valid": round(valid.size / depth.size, 4),
+                             "min": int(valid.min()) if valid.size else None,
+                             "max": int(valid.max()) if valid.size else None,
+                             "mean": round(float(valid.mean()), 1) if valid.size else None}
+        return stats
+
+
+TASKS = {task.name: task for task in (Thumbnails, ConvertDepth, DepthStats)}
+
+
+def task_key(task):
+    # Cache section of a task, changing with its parameters
+    return "{}-{}".format(task.name, config_hash(task.params()))
+
+
+# Tasks of a pool process, see init_worker
+_tasks = {}
+
+
+def init_worker(tasks):
+    global _tasks
+    _tasks = {task_key(task): task for task in tasks}
+    # One process per core already, OpenCV threads would only compete
+    cv2.setNumThreads(1)
+
+
+def process_chunk(jobs, depth_streams):
+    """Run in a pool process: jobs are (root, name, inputs, {task key: cached hashes or None}).
+
+    Every input file is read and hashed once for all the tasks of its shot;
+    a task whose inputs hash as in the cache and whose outputs exist is not
+    run again (files copied or touched since the last run).
+    """
+    results = []
+    for root, name, inputs, pending in jobs:
+        outcomes = {}
+        try:
+            data, files = {}, {}
+            for stream, path in inputs.items():
+                with open(path, "rb") as f:
+                    data[stream] = f.read()
+                    stat = os.fstat(f.fileno())
+                files[stream] = [stat.st_size, stat.st_mtime_ns, hashlib.sha1(data[stream]).hexdigest()]
+        except OSError as e:
+            results.append((name, {key: (FAILED, None, str(e)) for key in pending}))
+            continue
+        for key, hashes in pending.items():
+            task = _tasks[key]
+            task_files = {stream: files[stream] for stream in task.inputs(root, name, depth_streams)}
+            if hashes is not None and hashes == {stream: entry[2] for stream, entry in task_files.items()} \
+                    and all(os.path.isfile(path) for path in task.outputs(root, name, depth_streams)):
+                outcomes[key] = (UNCHANGED, task_files, None)
+                continue
+            try:
+                outcomes[key] = (DONE, task_files, task.run(root, name, inputs, data, depth_streams))
+            except Exception as e:
+                outcomes[key] = (FAILED, None, "{}: {}".format(type(e).__name__, e))
+        results.append((name, outcomes))
+    return results
+
+
+def load_cache(folder):
+    path = os.path.join(folder, CACHE_NAME)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except ValueError:
+        print("Unreadable {}, processing every shot again".format(path))
+        return {}
+
+
+def save_cache(folder, cache):
+    # Replaced in one go, an interrupted run leaves the previous cache
+    path = os.path.join(folder, CACHE_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(cache, f)
+    os.replace(path + ".tmp", path)
+
+
+def is_cached(entry, task, root, name, inputs, depth_streams):
+    # Same size and modification time as when processed, outputs still there
+    if entry is None or set(entry["files"]) != set(inputs):
+        return False
+    for stream, path in inputs.items():
+        stat = os.stat(path)
+        if entry["files"][stream][:2] != [stat.st_size, stat.st_mtime_ns]:
+            return False
+    return all(os.path.isfile(path) for path in task.outputs(root, name, depth_streams))
+
+
+def run_batch(folder, tasks, depth_streams=None, workers=None, chunk_size=8, force=False):
+    """Run tasks over the shots of a capture folder in a process pool,
+    skipping the shots processed by an earlier run; returns
+    (processed, cached, unchanged, failed) shot counts."""
+    if depth_streams is None:
+        depth_streams = sorted(d for d in os.listdir(os.path.join(folder, "depth"))
+                               if os.path.isdir(os.path.join(folder, "depth", d)))
+    cache = {} if force else load_cache(folder)
+    keys = [task_key(task) for task in tasks]
+    for key in keys:
+        cache.setdefault(key, {})
+    jobs, cached, missing = [], 0, 0
+    for root, name in list_shots(folder):
+        inputs, pending, available = {}, {}, False
+        for task, key in zip(tasks, keys):
+            task_inputs = task.inputs(root, name, depth_streams)
+            if None in task_inputs.values() or not all(os.path.isfile(path) for path in task_inputs.values()):
+                continue
+            available = True
+            entry = cache[key].get(name)
+            if is_cached(entry, task, root, name, task_inputs, depth_streams):
+                continue
+            inputs.update(task_inputs)
+            pending[key] = {stream: value[2] for stream, value in entry["files"].items()} if entry else None
+        if pending:
+            jobs.append((root, name, inputs, pending))
+        elif available:
+            cached += 1
+        else:
+            missing += 1
+    print("{} shots to process, {} already processed, {} without the files of the tasks".format(len(jobs), cached, missing))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    start = saved_at = time.perf_counter()
+    done = reported = unchanged = failed = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(tasks,)) as executor:
+        futures = [executor.submit(process_chunk, chunk, depth_streams) for chunk in chunks]
+        for future in as_completed(futures):
+            results = future.result()
+            for name, outcomes in results:
+                errors = []
+                for key, (status, files, result) in outcomes.items():
+                    if status == FAILED:
+                        errors.append(result)
+                        cache[key].pop(name, None)
+                    else:
+                        cache[key][name] = {"files": files, "result": result if status == DONE else cache[key][name]["result"]}
+                if errors:
+                    failed += 1
+                    print("Unable to process {}: {}".format(name, "; ".join(errors)))
+                elif all(status == UNCHANGED for status, _, _ in outcomes.values()):
+                    unchanged += 1
+            done += len(results)
+            now = time.perf_counter()
+            if done - reported >= 100 or done == len(jobs):
+                reported = done
+                print("{}/{} shots, {:.1f} shots/s".format(done, len(jobs), done / (now - start)))
+            if now - saved_at > CACHE_INTERVAL:
+                save_cache(folder, cache)
+                saved_at = now
+    elapsed = time.perf_counter() - start
+    save_cache(folder, cache)
+    for task, key in zip(tasks, keys):
+        if isinstance(task, DepthStats):
+            write_stats(folder, cache[key])
+    if jobs:
+        print("{} shots in {:.1f} s, {:.1f} shots/s".format(len(jobs), elapsed, len(jobs) / elapsed))
+    return len(jobs) - failed, cached, unchanged, failed
+
+
+def write_stats(folder, entries):
+    # Every shot in the cache, also those of earlier runs, in shot order
+    with open(os.path.join(folder, STATS_NAME), "w") as f:
+        for root, name in list_shots(folder):
+            if name in entries:
+                f.write(json.dumps({"shot": name, "depth": entries[name]["result"]}) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Process the shots of a capture folder in parallel, skipping the shots processed by an earlier run.')
+    parser.add_argument('folder', type=str, help='output folder of a recorder, with color/ and depth/ (and the other volumes of its manifest)')
+    parser.add_argument('tasks', type=str, nargs='+', choices=list(TASKS), help='thumbnails: thumbnails/<shot>.jpg; convert: depth re-encoded to converted/depth/<stream>/; stats: valid ratio and range of the depth frames to ' + STATS_NAME)
+    parser.add_argument('--depth', type=str, nargs='+', default=None, help='depth/ subfolders of convert and stats,  Default: all')
+    parser.add_argument('--thumb_width', type=int, default=320, help='width of the thumbnails,  Default: 320')
+    parser.add_argument('--depth_codec', type=str, default="rvl", choices=["png", "rvl"], help='codec of convert,  Default: rvl')
+    parser.add_argument('--png_level', type=int, default=None, choices=range(10), metavar='[0-9]', help='png compression level of convert,  Default: OpenCV default')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes,  Default: number of CPUs')
+    parser.add_argument('--chunk', type=int, default=8, help='shots sent to a process at once,  Default: 8')
+    parser.add_argument('--force', action='store_true', help='process every shot again, ignoring ' + CACHE_NAME)
+    args = parser.parse_args()
+
+    options = {"thumbnails": lambda: Thumbnails(args.thumb_width),
+               "convert": lambda: ConvertDepth(args.depth_codec, args.png_level),
+               "stats": DepthStats}
+    tasks = [options[name]() for name in dict.fromkeys(args.tasks)]
+    processed, cached, unchanged, failed = run_batch(args.folder, tasks, args.depth, args.workers, max(1, args.chunk), args.force)
+    print("Processed {} shots ({} unchanged since the last run), {} already processed, {} failed".format(processed, unchanged, cached, failed))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,124 @@
+import json
+import math
+from collections import namedtuple
+
+
+# Nominal field of view of the Azure Kinect color camera (horizontal, vertical)
+# in degrees, per aspect ratio, from the hardware specification
+COLOR_FOV = {
+    (16, 9): (90.0, 59.0),
+    (4, 3): (90.0, 74.3),
+}
+# Same for the depth camera, per depth mode family: NFOV (640x576, 320x288)
+# and WFOV (1024x1024, 512x512)
+DEPTH_FOV = {
+    "nfov": (75.0, 65.0),
+    "wfov": (120.0, 120.0),
+}
+# The depth camera sits about 32 mm beside the color camera and is tilted 6
+# degrees downwards; only a starting point, calibrate for accurate registration
+NOMINAL_TILT_DEG = 6.0
+NOMINAL_TRANSLATION_MM = (-32.0, 0.0, 0.0)
+
+
+class Intrinsics(namedtuple("Intrinsics", ["width", "height", "fx", "fy", "cx", "cy"])):
+    """Pinhole intrinsics in pixels."""
+
+    def scaled(self, width, height):
+        # Same camera at another resolution of the same aspect ratio
+        sx, sy = width / self.width, height / self.height
+        return Intrinsics(width, height, self.fx * sx, self.fy * sy,
+                          (self.cx + 0.5) * sx - 0.5, (self.cy + 0.5) * sy - 0.5)
+
+
+def nominal_intrinsics(width, height):
+    """Intrinsics derived from the nominal field of view, for a camera without
+    calibration file; expect errors of a few percent on the point positions."""
+    ratio = (16, 9) if abs(width / height - 16 / 9) < abs(width / height - 4 / 3) else (4, 3)
+    fov_x, fov_y = COLOR_FOV[ratio]
+    fx = width / 2.0 / math.tan(math.radians(fov_x) / 2.0)
+    fy = height / 2.0 / math.tan(math.radians(fov_y) / 2.0)
+    return Intrinsics(width, height, fx, fy, (width - 1) / 2.0, (height - 1) / 2.0)
+
+
+def load_intrinsics(path):
+    """Read the JSON written by o3d.io.write_pinhole_camera_intrinsic
+    ({"width", "height", "intrinsic_matrix": column-major 3x3})."""
+    with open(path) as f:
+        data = json.load(f)
+    matrix = data["intrinsic_matrix"]
+    return Intrinsics(data["width"], data["height"], matrix[0], matrix[4], matrix[6], matrix[7])
+
+
+def save_intrinsics(path, intrinsics):
+    data = {"width": intrinsics.width,
+            "height": intrinsics.height,
+            "intrinsic_matrix": [intrinsics.fx, 0.0, 0.0, 0.0, intrinsics.fy, 0.0, intrinsics.cx, intrinsics.cy, 1.0]}
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+
+
+def intrinsics_for(width, height, path=None):
+    # Calibration of the file if any, scaled to the frame resolution
+    intrinsics = load_intrinsics(path) if path is not None else nominal_intrinsics(width, height)
+    if (intrinsics.width, intrinsics.height) != (width, height):
+        intrinsics = intrinsics.scaled(width, height)
+    return intrinsics
+
+
+class Calibration(namedtuple("Calibration", ["depth", "color", "rotation", "translation", "depth_distortion", "color_distortion"])):
+    """Depth and color intrinsics and the depth to color extrinsics:
+    p_color = rotation (3x3, row-major) @ p_depth + translation (mm).
+    Distortions are OpenCV coefficients (k1, k2, p1, p2[, k3[, k4, k5, k6]]),
+    empty for none."""
+
+    def scaled(self, depth_size, color_size):
+        # Same cameras at the resolution of the frames, e.g. binned depth
+        def fit(intrinsics, size, camera):
+            if (intrinsics.width, intrinsics.height) == tuple(size):
+                return intrinsics
+            if abs(intrinsics.width * size[1] - intrinsics.height * size[0]) > max(size):
+                raise ValueError("Calibration of a {}x{} {} camera doesn't fit {}x{} frames".format(
+                    intrinsics.width, intrinsics.height, camera, *size))
+            return intrinsics.scaled(*size)
+        return self._replace(depth=fit(self.depth, depth_size, "depth"), color=fit(self.color, color_size, "color"))
+
+
+def rotation_x(degrees):
+    a = math.radians(degrees)
+    return [1.0, 0.0, 0.0, 0.0, math.cos(a), -math.sin(a), 0.0, math.sin(a), math.cos(a)]
+
+
+def nominal_depth_intrinsics(width, height):
+    fov_x, fov_y = DEPTH_FOV["wfov" if width == height else "nfov"]
+    fx = width / 2.0 / math.tan(math.radians(fov_x) / 2.0)
+    fy = height / 2.0 / math.tan(math.radians(fov_y) / 2.0)
+    return Intrinsics(width, height, fx, fy, (width - 1) / 2.0, (height - 1) / 2.0)
+
+
+def nominal_calibration(depth_size, color_size):
+    """Calibration from the nominal fields of view and mounting of the cameras,
+    for a device without calibration file; expect registration errors of
+    several pixels."""
+    return Calibration(nominal_depth_intrinsics(*depth_size), nominal_intrinsics(*color_size),
+                       rotation_x(-NOMINAL_TILT_DEG), list(NOMINAL_TRANSLATION_MM), [], [])
+
+
+def load_calibration(path):
+    """Read a calibration JSON:
+    {"depth": {"width", "height", "fx", "fy", "cx", "cy"[, "distortion"]},
+     "color": {...}, "rotation": [9 values, row-major], "translation": [mm]}"""
+    with open(path) as f:
+        data = json.load(f)
+    cameras = [Intrinsics(*(data[camera][key] for key in Intrinsics._fields)) for camera in ("depth", "color")]
+    return Calibration(cameras[0], cameras[1], [float(v) for v in data["rotation"]], [float(v) for v in data["translation"]],
+                       data["depth"].get("distortion", []), data["color"].get("distortion", []))
+
+
+def save_calibration(path, calibration):
+    data = {"rotation": list(calibration.rotation), "translation": list(calibration.translation)}
+    for camera, intrinsics, distortion in (("depth", calibration.depth, calibration.depth_distortion),
+                                           ("color", calibration.color, calibration.color_distortion)):
+        data[camera] = dict(intrinsics._asdict(), distortion=list(distortion))
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
@@ -0,0 +1,381 @@
+import os
+import time
+import threading
+from dataclasses import dataclass, fields
+from datetime import datetime
+from azure_kinect_depth_window import RunningDepthWindow
+from azure_kinect_depth_filters import make_filters, apply_filters
+from azure_kinect_save_pool import write_shot
+from azure_kinect_pack import PackWriter, PACK_EXTENSION
+from azure_kinect_depth_codec import PngCodec, make_codec
+from azure_kinect_manifest import Manifest, config_hash, shot_files
+from azure_kinect_volumes import VolumeSet, volume_roots
+from azure_kinect_cloud_export import CloudExporter
+from azure_kinect_preview import PreviewStage
+from azure_kinect_shared_memory import SharedMemoryFrameSource
+from azure_kinect_file_source import FileFrameSource
+from azure_kinect_replay import ReplaySource
+from azure_kinect_pubsub import FrameSubscriber
+from azure_kinect_frame_ring import FrameRing
+from azure_kinect_metrics import CameraMetrics, Metrics
+from PySide6.QtCore import QThread, Signal, Slot
+from PySide6.QtGui import QImage
+
+
+@dataclass
+class RecorderSettings:
+    """Settings of the recorders, named like their command line options.
+
+    Each recorder reads the ones it has an option for; the capture processes
+    get a copy, so it only holds picklable values.
+    """
+    # Frame source of CameraRGBD.set_input, replay_options are the
+    # ReplaySource options (timing, fps, loop) of the replay transport
+    input: str = "camera_stream"
+    transport: str = "file"
+    replay_options: dict = None
+    # Sensor of azure_kinect_recorder.py, the config is a JSON file path
+    device: int = None
+    config: str = None
+    deferred_registration: bool = False
+    calibration: str = None
+    # Output
+    name: str = "camera"
+    output: str = "frames"
+    output_volumes: list = None
+    volume_policy: str = "round-robin"
+    min_free_mb: int = 1024
+    output_format: str = "folder"
+    depth_codec: str = "png"
+    png_level: int = None
+    save_workers: int = 2
+    save_queue: int = 8
+    # Depth filters and shot triggers
+    depth_filters: tuple = ("mean",)
+    depth_window: int = 30
+    outlier_mm: int = 30
+    pre_frames: int = 1
+    post_frames: int = 0
+    burst: bool = False
+    # Synchronized rigs
+    sync_tolerance_ms: float = 10.0
+    sync_history: int = 4
+    # Record mode
+    record_workers: int = 4
+    record_queue: int = 16
+    drop_policy: str = "drop-oldest"
+    # Point clouds
+    cloud_format: str = None
+    cloud_workers: int = 2
+    cloud_voxel: float = 0.0
+    intrinsics: str = None
+    depth_trunc: float = 3.0
+    # Preview and metrics
+    preview_fps: float = 15.0
+    preview_mode: str = "color"
+    preview_near_mm: int = 300
+    preview_far_mm: int = 4000
+    metrics_overlay: bool = False
+    metrics_file: str = None
+    metrics_port: int = None
+    metrics_interval: float = 5.0
+    capture_process: bool = False
+
+    @classmethod
+    def from_args(cls, args, **overrides):
+        """Settings of the parsed options of the same name, then `overrides`."""
+        values = {field.name: getattr(args, field.name) for field in fields(cls) if hasattr(args, field.name)}
+        values.update(overrides)
+        return cls(**values)
+
+
+def make_exporter(settings, parent=None):
+    # CloudExporter of the shots, None when disabled
+    if settings.cloud_format is None:
+        return None
+    return CloudExporter(settings.cloud_format, workers=settings.cloud_workers, max_pending=settings.save_queue,
+                         intrinsics_path=settings.intrinsics, voxel_size=settings.cloud_voxel,
+                         depth_trunc=settings.depth_trunc, parent=parent)
+
+
+class CameraRGBD(QThread):
+    """Capture thread of the recorders: frames of a source into the depth
+    window and the frame ring, shots written to the output directory.
+
+    The recorders reading a streamer use it as is, azure_kinect_recorder.py
+    replaces the source by the sensor.
+    """
+    updateFrame = Signal(QImage)
+
+    def __init__(self, parent=None):
+        QThread.__init__(self, parent)
+        self.status = True
+        self.input = None
+        self.color_frame = None
+        self.depth_queue = RunningDepthWindow(maxlen=30)
+        self.depth_filters = make_filters(["mean"])
+        self.output_dir = None
+        # Shot ids and index of the output directory, see set_output_dir
+        self.manifest = None
+        self.device = None
+        self.timestamp_usec = None
+        self.align_depth_to_color = True
+        self.transport = "file"
+        self.source = None
+        self.preview = PreviewStage(640, 480, fps=15.0, image_format=QImage.Format_BGR888)
+        # Number of recent frames by timestamp matched across devices when a shot is taken
+        self.history_length = 1
+        # Guards color_frame/depth_queue against snapshots from the save pool
+        self.lock = threading.Lock()
+        # Output folders and volume of each shot, see set_volumes
+        self.volumes = None
+        # One per output folder for the packed output formats
+        self.packs = []
+        self.depth_codec = PngCodec()
+        # CloudExporter of the shots, None when disabled
+        self.exporter = None
+        # Last frames and the shot triggers armed on them, see set_trigger
+        self.pre_frames = 1
+        self.post_frames = 0
+        self.burst = False
+        self.ring = FrameRing(self.pre_frames)
+        # Detached until set_metrics, the hot path never checks for None
+        self.metrics = CameraMetrics("camera", Metrics())
+        self.emitted_at = 0.0
+
+    def configure(self, settings):
+        # Everything but the source, see set_input
+        self.set_depth_filters(settings.depth_filters, settings.depth_window, settings.outlier_mm)
+        self.set_output_dir(settings.output)
+        self.set_volumes(settings.output_volumes, settings.volume_policy, settings.min_free_mb)
+        self.set_depth_codec(settings.depth_codec, settings.png_level)
+        self.set_output_format(settings.output_format)
+        self.set_trigger(settings.pre_frames, settings.post_frames, settings.burst)
+        self.set_metrics(settings.name)
+        self.preview.set_fps(settings.preview_fps)
+        self.preview.configure(settings.preview_mode, settings.preview_near_mm, settings.preview_far_mm)
+
+    def set_input(self, input, transport="file", replay=None):
+        # replay: ReplaySource options (timing, fps, loop) of the replay transport
+        self.input = input
+        self.transport = transport
+        if self.transport == "shm":
+            self.source = SharedMemoryFrameSource(self.input)
+        elif self.transport == "replay":
+            self.source = ReplaySource(self.input, **(replay or {}))
+        elif self.transport == "pubsub":
+            self.source = FrameSubscriber(self.input)
+        else:
+            # Created here, in the GUI thread, whose event loop delivers the file notifications
+            self.source = FileFrameSource(self.input)
+
+    def set_output_dir(self, output_dir):
+        self.output_dir = output_dir
+        if self.output_dir is None:
+            self.output_dir = "frames"
+
+        if (os.path.isdir(self.output_dir + "/color") and os.path.isdir(self.output_dir + "/depth")):
+            print('Output directory \'{}\' already existing, continue recording there'.format(self.output_dir))
+        else:
+            try:
+                os.mkdir(self.output_dir)
+                os.mkdir(self.output_dir + "/color")
+                os.mkdir(self.output_dir + "/depth/")
+                os.mkdir(self.output_dir + "/depth/raw")
+            except (PermissionError, FileExistsError):
+                print("Unable to mkdir: " + self.output_dir)
+        # One subfolder per depth filter, also for filters new to an existing directory
+        for depth_filter in self.depth_filters:
+            os.makedirs(self.output_dir + "/depth/" + depth_filter.subdir(self.depth_queue.maxlen), exist_ok=True)
+        # Shot ids continue from the tail of the manifest, however large the directory
+        self.manifest = Manifest(self.output_dir)
+        self.set_volumes(min_free_mb=0)
+
+    def set_volumes(self, volumes=None, policy="round-robin", min_free_mb=1024):
+        # Call after set_output_dir; shots are spread over the output directory and
+        # <volume>/<its name> on each other volume, the manifest stays in the output directory
+        if self.volumes is not None:
+            self.volumes.close()
+        self.volumes = VolumeSet(volume_roots(self.output_dir, volumes), policy, min_free_mb)
+        self.volumes.make_dirs(["color", "depth/raw"] + ["depth/" + f.subdir(self.depth_queue.maxlen) for f in self.depth_filters])
+
+    def set_history(self, length):
+        self.history_length = length
+        self.ring = FrameRing(max(self.history_length, self.pre_frames))
+
+    def set_metrics(self, name):
+        # Stage latencies, counters and queue depths exported under camera=name
+        self.metrics = CameraMetrics(name)
+        self.metrics.dropped(lambda: getattr(self.source, "dropped", 0))
+        self.metrics.queue("depth_window", lambda: len(self.depth_queue))
+        self.metrics.queue("triggers", lambda: len(self.ring.triggers))
+
+    def set_trigger(self, pre_frames=1, post_frames=0, burst=False):
+        # A shot holds the frames on screen when it was requested (pre_frames)
+        # and completes post_frames frames later, the burst saves them all
+        self.pre_frames = max(1, pre_frames)
+        self.post_frames = max(0, post_frames)
+        self.burst = burst
+        self.ring = FrameRing(max(self.history_length, self.pre_frames))
+
+    def set_depth_codec(self, name="png", png_level=None):
+        self.depth_codec = make_codec(name, png_level)
+
+    def set_output_format(self, output_format="folder"):
+        # Call after set_volumes and set_depth_codec; the packed formats append every shot of
+        # the session to one container in each output folder
+        self.close_output()
+        if output_format != "folder":
+            session = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            for root in self.volumes.roots:
+                base = os.path.join(root, session)
+                self.packs.append(PackWriter(base, raw=output_format == "pack-raw", depth_codec=self.depth_codec))
+                print("Saving shots to " + base + PACK_EXTENSION)
+
+    def close_output(self):
+        for pack in self.packs:
+            pack.close()
+        self.packs = []
+
+    def write_shot(self, number, name, color_frame, depth_raw, depth_filtered, timestamp_usec=None):
+        # Raises VolumeFullError, before writing anything, when every volume is full
+        with self.volumes.write() as volume:
+            if self.packs:
+                pack = self.packs[volume.index]
+                volume.size = pack.write_shot(name, color_frame, depth_raw, depth_filtered, self.metrics)
+                files = shot_files(name, None, pack=os.path.basename(pack.base) + PACK_EXTENSION)
+            else:
+                volume.size = write_shot(volume.root, name, color_frame, depth_raw, depth_filtered, self.depth_codec, self.metrics)
+                streams = ["color", "depth/raw"] + ["depth/" + subdir for subdir in depth_filtered]
+                files = shot_files(name, streams, self.depth_codec.extension)
+        # Indexed once written, so the manifest only lists complete shots
+        self.manifest.append(number, files, timestamp_usec, self.device, config_hash(self.capture_settings()), volume.index)
+        if self.exporter is not None and depth_filtered:
+            # Cloud of the first, averaged, depth filter, next to the shot
+            if not self.exporter.submit(volume.root, name, color_frame, next(iter(depth_filtered.values()))):
+                print("Point cloud export queue is full, cloud of {} skipped".format(name))
+
+    def capture_settings(self):
+        # Hashed into the manifest to tell apart shots taken with different settings
+        return {"source": {"input": self.input, "transport": self.transport},
+                "align_depth_to_color": self.align_depth_to_color,
+                "depth_filters": [f.subdir(self.depth_queue.maxlen) for f in self.depth_filters],
+                "depth_codec": self.depth_codec.name,
+                "png_level": getattr(self.depth_codec, "level", None)}
+
+    def set_depth_filters(self, names, window=30, outlier_threshold=30):
+        # Call before set_output_dir, which creates the filter subfolders
+        self.depth_queue = RunningDepthWindow(maxlen=window)
+        self.depth_filters = make_filters(names, outlier_threshold)
+
+    def run(self):
+        if self.depth_queue:
+            self.depth_queue.clear()
+        self.ring.clear()
+        metrics = self.metrics
+        while self.status:
+            # Blocks until the streamer publishes a new frame, capture includes the wait
+            start = time.perf_counter()
+            frame = self.source.read_frame()
+            if frame is None:
+                continue
+            captured = time.perf_counter()
+            metrics.observe("capture", captured - start)
+            metrics.frames.inc()
+            sequence, timestamp_usec, color_frame, depth_frame = frame
+            self.ingest(sequence, timestamp_usec, color_frame, depth_frame)
+            metrics.observe("ingest", time.perf_counter() - captured)
+            self.show(color_frame, depth_frame)
+
+    def ingest(self, sequence, timestamp_usec, color_frame, depth_frame):
+        # New frame on screen, in the depth window and the ring, completing the triggers
+        with self.lock:
+            self.color_frame = color_frame
+            self.depth_queue.append(depth_frame)
+            self.timestamp_usec = timestamp_usec
+            for trigger in self.ring.append(timestamp_usec, sequence, color_frame, depth_frame):
+                trigger.complete(self.ring.items(), self.depth_queue.freeze())
+
+    def show(self, color_frame, depth_frame):
+        # Creating a label sized QImage at the preview rate
+        if self.preview.due():
+            start = time.perf_counter()
+            image = self.preview.render(color_frame, depth_frame)
+            self.emitted_at = time.perf_counter()
+            self.metrics.observe("preview", self.emitted_at - start)
+            self.metrics.previews.inc()
+            # Emit signal
+            self.updateFrame.emit(image)
+
+    @Slot(int)
+    def adjust_x(self, value):
+        self.set_x(value)
+
+    def reserve_frame_number(self):
+        return self.manifest.reserve()
+
+    def snapshot(self):
+        # Buffers of one shot, safe to use from another thread: color_frame is
+        # replaced (not modified) by run(), depth frames are never modified and
+        # the filters run on a frozen depth window
+        with self.lock:
+            return self.color_frame, self.depth_queue[-1], self.depth_queue.freeze(), self.timestamp_usec
+
+    def arm_trigger(self):
+        # Called when the shot is requested, not when a save worker picks it up
+        # The depth window is frozen on the frames on screen, the ones the shot is taken from
+        with self.lock:
+            trigger = self.ring.arm(self.pre_frames, self.post_frames, keep_post=self.burst,
+                                    depth_window=self.depth_queue.freeze())
+            if self.post_frames == 0:
+                trigger.complete(self.ring.items(), self.depth_queue.freeze())
+        return trigger
+
+    def flush_triggers(self):
+        # Once capture stopped, the shots waiting for frames are taken from those received
+        with self.lock:
+            for trigger in self.ring.flush():
+                trigger.complete(self.ring.items(), self.depth_queue.freeze())
+
+    def wait_trigger(self, trigger):
+        try:
+            trigger.wait()
+        except RuntimeError:
+            self.ring.cancel(trigger)
+            raise
+        if not trigger.recent:
+            raise RuntimeError("no frame received yet")
+        return trigger
+
+    @Slot()
+    def save_frames(self, number=None, trigger=None):
+        if number is None:
+            number = self.reserve_frame_number()
+        if trigger is None:
+            trigger = self.arm_trigger()
+        # Completes post_frames frames after the request, at the rate of the sensor:
+        # the frame saved and the depth window filtered are those on screen
+        self.wait_trigger(trigger)
+        self.save_matched(number, trigger.shot_frames()[-1], trigger.depth_window)
+        self.metrics.observe("shot", time.perf_counter() - trigger.armed_at)
+        if self.burst:
+            self.save_burst(number, str(number), trigger)
+
+    def save_matched(self, number, entry, depth_window):
+        # entry is the FrameRing item of the shot, picked by match_frames on a rig
+        timestamp_usec, _, color_frame, depth_raw = entry
+        start = time.perf_counter()
+        depth_filtered = apply_filters(self.depth_filters, depth_window)
+        self.metrics.observe("filter", time.perf_counter() - start)
+        self.device = getattr(self.source, "device", None)
+        self.write_shot(number, str(number), color_frame, depth_raw, depth_filtered, timestamp_usec)
+        self.metrics.shots.inc()
+
+    def save_burst(self, number, name, trigger):
+        # Color and raw depth of every frame around the trigger, indexed under the same shot id
+        for i, (timestamp_usec, _, color_frame, depth_raw) in enumerate(trigger.frames()):
+            self.write_shot(number, "{}_b{:02d}".format(name, i), *self.written_frames(color_frame, depth_raw), {}, timestamp_usec)
+
+    def written_frames(self, color_frame, depth_raw):
+        # Color and depth of a ring entry as written: BGR, depth aligned to color
+        return color_frame, depth_raw
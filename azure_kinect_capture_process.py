@@ -0,0 +1,317 @@
+import os
+import time
+import queue
+import threading
+import importlib
+import traceback
+import multiprocessing
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PySide6.QtCore import QCoreApplication, QObject, QTimer, Signal, Slot
+from PySide6.QtGui import QImage
+from azure_kinect_camera import make_exporter
+from azure_kinect_metrics import REGISTRY
+from azure_kinect_preview import PreviewStage
+from azure_kinect_shared_memory import SharedFrameRing, SharedMemoryFrameSource
+
+
+# Commands sent to a capture process and results sent back, as tuples:
+#   ("shot",)                 arm a trigger, reserve a shot id, save once complete (single device)
+#   ("pin", number)           arm a trigger -> ("history", number, [(timestamp, sequence)]) once complete
+#   ("save", number, stamp)   save the pinned frame of timestamp `stamp` as shot `number`
+#   ("release", number)       drop a pinned history
+#   ("preview", mode, near_mm, far_mm)  preview mode and depth colour range
+#   ("stop",)
+# Results: ("saved", name), ("failed", name, error), ("cloud_failed", name, error),
+#          ("cpu", percent), ("metrics", snapshot), ("history", ...)
+CPU_INTERVAL = 1.0
+
+
+class CpuMeter:
+    """CPU use of the current process, all threads, since the previous sample."""
+
+    def __init__(self):
+        self.last = (time.perf_counter(), time.process_time())
+
+    def sample(self):
+        now = (time.perf_counter(), time.process_time())
+        elapsed = now[0] - self.last[0]
+        percent = 100.0 * (now[1] - self.last[1]) / elapsed if elapsed > 0 else 0.0
+        self.last = now
+        return percent
+
+
+class RingPreviewStage(PreviewStage):
+    """Preview stage of a capture process: the small frame goes to a shared
+    memory ring read by the GUI process instead of into a QImage."""
+
+    def __init__(self, ring_name, width=640, height=480, fps=15.0, mode="color", near_mm=300, far_mm=4000):
+        PreviewStage.__init__(self, width, height, fps, mode=mode, near_mm=near_mm, far_mm=far_mm)
+        self.ring_name = ring_name
+        self.ring = None
+        self.depth = np.zeros((1, 1), dtype=np.uint16)
+
+    def render(self, color_frame, depth_frame=None):
+        small = self.compose(color_frame, depth_frame)
+        if self.ring is not None and self.ring.color_shape != small.shape:
+            # Input resolution or preview mode changed, the GUI attaches to the new ring
+            self.close()
+        if self.ring is None:
+            self.ring = SharedFrameRing(self.ring_name, small.shape, self.depth.shape, slots=2, create=True)
+        self.ring.write(small, self.depth)
+        return QImage()
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.unlink()
+            self.ring = None
+
+
+class CaptureWorker(QObject):
+    # Runs in the capture process, in the thread of its event loop
+    def __init__(self, camera, commands, results, save_workers=2, parent=None):
+        QObject.__init__(self, parent)
+        self.camera = camera
+        self.commands = commands
+        self.results = results
+        # Both updated from the save threads too
+        self.lock = threading.Lock()
+        self.pinned = {}
+        self.pending = 0
+        self.camera.metrics.queue("save", lambda: self.pending)
+        self.saver = ThreadPoolExecutor(max_workers=save_workers, thread_name_prefix="save")
+        self.cpu = CpuMeter()
+        self.command_timer = QTimer(self)
+        self.command_timer.timeout.connect(self.poll_commands)
+        self.command_timer.start(5)
+        self.cpu_timer = QTimer(self)
+        self.cpu_timer.timeout.connect(self.report_cpu)
+        self.cpu_timer.timeout.connect(self.report_metrics)
+        self.cpu_timer.start(int(CPU_INTERVAL * 1000))
+
+    @Slot()
+    def poll_commands(self):
+        while True:
+            try:
+                command = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            if command[0] == "stop":
+                self.stop()
+                return
+            if command[0] == "shot":
+                # Reserved here so a failed shot is reported under its id
+                number = self.camera.reserve_frame_number()
+                self.add_pending()
+                self.saver.submit(self.run_job, str(number), self.camera.save_frames, number, self.camera.arm_trigger())
+            elif command[0] == "pin":
+                self.saver.submit(self.pin, command[1], self.camera.arm_trigger())
+            elif command[0] == "save":
+                _, number, timestamp_usec = command
+                with self.lock:
+                    trigger = self.pinned.pop(number, None)
+                if trigger is None:
+                    self.results.put(("failed", str(number), "shot {} is not pinned".format(number)))
+                    continue
+                entry = next((entry for entry in trigger.shot_frames() if entry[0] == timestamp_usec), None)
+                if entry is None:
+                    self.results.put(("failed", str(number), "no pinned frame at {} usec".format(timestamp_usec)))
+                    continue
+                self.add_pending()
+                self.saver.submit(self.run_job, str(number), self.save_pinned, number, entry, trigger)
+            elif command[0] == "release":
+                with self.lock:
+                    self.pinned.pop(command[1], None)
+            elif command[0] == "preview":
+                self.camera.preview.configure(*command[1:])
+
+    def pin(self, number, trigger):
+        # Runs in the save pool until the trigger completes; an empty history fails the shot
+        try:
+            self.camera.wait_trigger(trigger)
+        except RuntimeError as e:
+            print("Shot {} not pinned: {}".format(number, e))
+            self.results.put(("history", number, []))
+            return
+        with self.lock:
+            self.pinned[number] = trigger
+        self.results.put(("history", number, [entry[:2] for entry in trigger.shot_frames()]))
+
+    def save_pinned(self, number, entry, trigger):
+        self.camera.save_matched(number, entry, trigger.depth_window)
+        if self.camera.burst:
+            self.camera.save_burst(number, str(number), trigger)
+
+    def run_job(self, name, job, *args):
+        try:
+            job(*args)
+        except Exception:
+            traceback.print_exc()
+            self.results.put(("failed", name, traceback.format_exc(limit=1)))
+        else:
+            self.results.put(("saved", name))
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def add_pending(self):
+        with self.lock:
+            self.pending += 1
+
+    @Slot()
+    def report_cpu(self):
+        self.results.put(("cpu", self.cpu.sample()))
+
+    @Slot()
+    def report_metrics(self):
+        self.results.put(("metrics", REGISTRY.snapshot()))
+
+    def stop(self):
+        self.command_timer.stop()
+        self.camera.status = False
+        self.camera.wait()
+        self.camera.flush_triggers()
+        self.saver.shutdown(wait=True)
+        self.camera.close_output()
+        self.camera.preview.close()
+        QCoreApplication.instance().quit()
+
+
+def run_capture_process(module_name, settings, preview_ring, commands, results):
+    """Entry point of a capture process: the CameraRGBD of `module_name`
+    configured from `settings` (RecorderSettings), with its own event loop."""
+    app = QCoreApplication([])
+    module = importlib.import_module(module_name)
+    camera = module.CameraRGBD()
+    camera.set_input(settings.input, settings.transport, settings.replay_options)
+    camera.configure(settings)
+    camera.preview = RingPreviewStage(preview_ring, fps=settings.preview_fps, mode=settings.preview_mode,
+                                      near_mm=settings.preview_near_mm, far_mm=settings.preview_far_mm)
+    camera.exporter = make_exporter(settings)
+    if camera.exporter is not None:
+        camera.exporter.failed.connect(lambda name, error: results.put(("cloud_failed", name, error)))
+    # Kept alive by the application until the event loop returns
+    CaptureWorker(camera, commands, results, settings.save_workers, app)
+    camera.start()
+    app.exec()
+    if camera.exporter is not None:
+        camera.exporter.shutdown(wait=True)
+
+
+class CaptureProcess(QObject):
+    """GUI side of a capture process: CameraRGBD's signals, fed by polling the
+    preview ring and the result queue, so the GUI process only renders."""
+    updateFrame = Signal(QImage)
+    saved = Signal(str)
+    failed = Signal(str, str)
+    history = Signal(int, list)
+    cloudFailed = Signal(str, str)
+    cpuChanged = Signal(float)
+    finished = Signal()
+
+    def __init__(self, module_name, settings, parent=None):
+        QObject.__init__(self, parent)
+        self.module_name = module_name
+        # Own copy, the preview settings change with the controls
+        self.settings = replace(settings)
+        self.preview_ring = "kinect_preview_{}_{}".format(os.getpid(), id(self))
+        # spawn: forking a process running Qt and capture threads is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.commands = None
+        self.results = None
+        self.preview = None
+        self.image_format = QImage.Format_BGR888
+        self.cpu = 0.0
+        # Last metrics snapshot of the process, see azure_kinect_metrics
+        self.metrics = []
+        REGISTRY.gauge("kinect_process_cpu_percent", "CPU use of the capture processes", fn=lambda: self.cpu,
+                       camera=self.settings.name)
+        self.preview_timer = QTimer(self)
+        self.preview_timer.timeout.connect(self.poll_preview)
+        self.result_timer = QTimer(self)
+        self.result_timer.timeout.connect(self.poll_results)
+
+    def is_running(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        # A process can't be restarted, every start spawns a new one
+        self.commands = self.context.Queue()
+        self.results = self.context.Queue()
+        self.process = self.context.Process(target=run_capture_process, daemon=True,
+                                            args=(self.module_name, self.settings, self.preview_ring, self.commands, self.results))
+        self.preview = SharedMemoryFrameSource(self.preview_ring, unregister=False)
+        self.process.start()
+        fps = self.settings.preview_fps
+        self.preview_timer.start(int(1000 / fps) if fps and fps > 0 else 15)
+        self.result_timer.start(20)
+
+    def stop(self, timeout=5.0):
+        if not self.is_running():
+            return
+        self.commands.put(("stop",))
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.preview_timer.stop()
+        self.poll_results()
+        self.result_timer.stop()
+        self.preview.close()
+        self.finished.emit()
+
+    def shot(self):
+        self.commands.put(("shot",))
+
+    def pin(self, number):
+        self.commands.put(("pin", number))
+
+    def save(self, number, timestamp_usec):
+        self.commands.put(("save", number, timestamp_usec))
+
+    def release(self, number):
+        self.commands.put(("release", number))
+
+    def set_preview(self, mode, near_mm, far_mm):
+        # Kept for the next start too
+        self.settings = replace(self.settings, preview_mode=mode, preview_near_mm=near_mm, preview_far_mm=far_mm)
+        if self.is_running():
+            self.commands.put(("preview", mode, near_mm, far_mm))
+
+    @Slot()
+    def poll_preview(self):
+        frame = self.preview.read_frame(timeout=0)
+        if frame is None:
+            return
+        color = frame[2]
+        h, w = color.shape[:2]
+        self.updateFrame.emit(QImage(color.data, w, h, color.shape[2] * w, self.image_format).copy())
+
+    @Slot()
+    def poll_results(self):
+        while True:
+            try:
+                result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if result[0] == "saved":
+                self.saved.emit(result[1])
+            elif result[0] == "failed":
+                self.failed.emit(result[1], result[2])
+            elif result[0] == "history":
+                self.history.emit(result[1], result[2])
+            elif result[0] == "cloud_failed":
+                self.cloudFailed.emit(result[1], result[2])
+            elif result[0] == "metrics":
+                self.metrics = result[1]
+            elif result[0] == "cpu":
+                self.cpu = result[1]
+                self.cpuChanged.emit(self.cpu)
+        if self.process.exitcode not in (None, 0) and self.result_timer.isActive():
+            print("Capture process of '{}' exited with code {}".format(self.settings.input, self.process.exitcode))
+            self.preview_timer.stop()
+            self.result_timer.stop()
+            self.finished.emit()
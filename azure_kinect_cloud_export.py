@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+from PySide6.QtCore import QObject, Signal
+from azure_kinect_calibration import intrinsics_for
+from azure_kinect_depth_codec import read_depth
+from azure_kinect_manifest import find_depth, list_shots
+
+
+CLOUD_FORMATS = ("ply", "pcd")
+
+
+def backproject(depth, intrinsics, depth_scale=1000.0, depth_trunc=3.0):
+    """Points (N, 3) in meters of the valid depth pixels closer than depth_trunc,
+    and the mask of these pixels."""
+    z = depth.astype(np.float32) / depth_scale
+    mask = (depth != 0) & (z <= depth_trunc)
+    v, u = np.nonzero(mask)
+    z = z[v, u]
+    points = np.empty((z.size, 3), dtype=np.float64)
+    points[:, 0] = (u - intrinsics.cx) * z / intrinsics.fx
+    points[:, 1] = (v - intrinsics.cy) * z / intrinsics.fy
+    points[:, 2] = z
+    return points, mask
+
+
+def export_cloud(path, color_frame, depth_frame, intrinsics_path=None, voxel_size=0.0, depth_trunc=3.0):
+    """Colored point cloud of a BGR color frame and the depth frame aligned to
+    it, written to path (.ply or .pcd). Runs in the export processes."""
+    # Imported here, only the export processes need Open3D
+    import open3d as o3d
+    if depth_frame.shape != color_frame.shape[:2]:
+        raise ValueError("Depth {} is not aligned to color {}".format(depth_frame.shape, color_frame.shape[:2]))
+    height, width = depth_frame.shape
+    points, mask = backproject(depth_frame, intrinsics_for(width, height, intrinsics_path), depth_trunc=depth_trunc)
+    cloud = o3d.geometry.PointCloud()
+    cloud.points = o3d.utility.Vector3dVector(points)
+    cloud.colors = o3d.utility.Vector3dVector(color_frame[mask][:, ::-1] / 255.0)
+    if voxel_size > 0:
+        cloud = cloud.voxel_down_sample(voxel_size)
+    if not o3d.io.write_point_cloud(path, cloud):
+        raise RuntimeError("Unable to write " + path)
+    return len(cloud.points)
+
+
+def export_files(path, color_path, depth_path, intrinsics_path=None, voxel_size=0.0, depth_trunc=3.0):
+    # Bulk mode: the frames are read by the export process
+    color_frame = cv2.imread(color_path, cv2.IMREAD_COLOR)
+    if color_frame is None:
+        raise RuntimeError("Unable to read " + color_path)
+    return export_cloud(path, color_frame, read_depth(depth_path), intrinsics_path, voxel_size, depth_trunc)
+
+
+class CloudExporter(QObject):
+    """Bounded process pool turning saved shots into point clouds.
+
+    Building and downsampling a cloud holds the GIL, hence processes rather
+    than threads, so neither the GUI nor the capture thread slow down.
+    """
+    exported = Signal(str)
+    failed = Signal(str, str)
+    backlogChanged = Signal(int)
+
+    def __init__(self, cloud_format="ply", workers=2, max_pending=8, intrinsics_path=None,
+                 voxel_size=0.0, depth_trunc=3.0, parent=None):
+        QObject.__init__(self, parent)
+        if cloud_format not in CLOUD_FORMATS:
+            raise ValueError("Unknown point cloud format: " + str(cloud_format))
+        self.cloud_format = cloud_format
+        self.intrinsics_path = intrinsics_path
+        self.voxel_size = voxel_size
+        self.depth_trunc = depth_trunc
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Lock()
+        # spawn: forking a process running Qt and capture threads is unsafe
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def backlog(self):
+        return self.pending
+
+    def submit(self, output_dir, name, color_frame, depth_frame):
+        """Queue the cloud of shot `name` to output_dir/cloud/, False if the backlog is full."""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            pending = self.pending
+        self.backlogChanged.emit(pending)
+        os.makedirs(os.path.join(output_dir, "cloud"), exist_ok=True)
+        path = os.path.join(output_dir, "cloud", "{}.{}".format(name, self.cloud_format))
+        future = self.executor.submit(export_cloud, path, color_frame, depth_frame, self.intrinsics_path,
+                                      self.voxel_size, self.depth_trunc)
+        future.add_done_callback(lambda future: self._done(name, future))
+        return True
+
+    def _done(self, name, future):
+        error = future.exception()
+        if error is None:
+            self.exported.emit(name)
+        else:
+            self.failed.emit(name, "".join(traceback.format_exception_only(type(error), error)))
+        with self.lock:
+            self.pending -= 1
+            pending = self.pending
+        self.backlogChanged.emit(pending)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+def backfill(output_dir, depth_subdir="mean_30", cloud_format="ply", workers=None, intrinsics_path=None,
+             voxel_size=0.0, depth_trunc=3.0, overwrite=False):
+    """Export the clouds missing in output_dir/cloud, shots listed by the
+    manifest or, without one, by the color folder. Clouds of shots on other
+    volumes go to the cloud/ folder next to them."""
+    shots = list_shots(output_dir)
+    jobs = []
+    for root, name in shots:
+        path = os.path.join(root, "cloud", "{}.{}".format(name, cloud_format))
+        depth_path = find_depth(root, depth_subdir, name)
+        if depth_path is None or (os.path.isfile(path) and not overwrite):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        jobs.append((path, os.path.join(root, "color", name + ".jpg"), depth_path))
+    print("{} clouds to export, {} shots skipped".format(len(jobs), len(shots) - len(jobs)))
+    start = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(export_files, path, color_path, depth_path, intrinsics_path, voxel_size, depth_trunc): path
+                   for path, color_path, depth_path in jobs}
+        for i, future in enumerate(as_completed(futures), 1):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print("Unable to export {}: {}".format(futures[future], e))
+            if i % 50 == 0 or i == len(jobs):
+                elapsed = time.perf_counter() - start
+                print("{}/{} clouds, {:.1f} clouds/s".format(i, len(jobs), i / elapsed))
+    return len(jobs) - failed, failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export the point clouds of the shots of an output folder.')
+    parser.add_argument('output', type=str, help='output folder of a recorder, with color/ and depth/')
+    parser.add_argument('--depth', type=str, default="mean_30", help='depth/ subfolder the clouds are built from,  Default: mean_30')
+    parser.add_argument('--format', type=str, default="ply", choices=CLOUD_FORMATS, help='point cloud file format,  Default: ply')
+    parser.add_argument('--workers', type=int, default=None, help='number of export processes,  Default: number of CPUs')
+    parser.add_argument('--intrinsics', type=str, default=None, help='color camera intrinsics, JSON of o3d.io.write_pinhole_camera_intrinsic,  Default: nominal intrinsics')
+    parser.add_argument('--voxel', type=float, default=0.0, help='voxel size in meters of the downsampling, 0 to keep every point,  Default: 0')
+    parser.add_argument('--depth_trunc', type=float, default=3.0, help='points further than this distance in meters are dropped,  Default: 3')
+    parser.add_argument('--overwrite', action='store_true', help='export again the clouds already in cloud/')
+    args = parser.parse_args()
+
+    exported, failed = backfill(args.output, args.depth, args.format, args.workers, args.intrinsics,
+                                args.voxel, args.depth_trunc, args.overwrite)
+    print("Exported {} clouds, {} failed".format(exported, failed))
+    sys.exit(1 if failed else 0)
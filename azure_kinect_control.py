@@ -0,0 +1,82 @@
+import sys
+import json
+import socket
+import argparse
+
+
+def parse_address(address):
+    """Socket family and address of a Unix socket path or [host:]port."""
+    if "/" in address or not address.rsplit(":", 1)[-1].isdigit():
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def connect(address, timeout=5.0):
+    """Socket to a headless recorder: a Unix socket path, or [host:]port."""
+    family, target = parse_address(address)
+    connection = socket.socket(family, socket.SOCK_STREAM)
+    connection.settimeout(timeout)
+    try:
+        connection.connect(target)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+
+def read_reply(connection):
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = connection.recv(4096)
+        if not chunk:
+            raise ConnectionError("connection closed by the recorder")
+        data += chunk
+    return json.loads(data)
+
+
+def send(addresses, command, timeout=30.0):
+    """Send one command to every recorder, return {address: reply}.
+
+    Every recorder is connected first and the command then sent to all of
+    them in a row, so a trigger reaches the rigs within a few hundred
+    microseconds of each other rather than one round trip apart.
+    """
+    connections, replies = {}, {}
+    for address in addresses:
+        try:
+            connections[address] = connect(address, timeout)
+        except OSError as e:
+            replies[address] = {"ok": False, "error": "unable to connect: {}".format(e)}
+    line = (" ".join(command) + "\n").encode()
+    sent = {}
+    for address, connection in connections.items():
+        try:
+            connection.sendall(line)
+        except OSError as e:
+            # Rig dropped since connecting, the others still get the command
+            replies[address] = {"ok": False, "error": "unable to send: {}".format(e)}
+            connection.close()
+        else:
+            sent[address] = connection
+    for address, connection in sent.items():
+        try:
+            replies[address] = read_reply(connection)
+        except (OSError, ValueError) as e:
+            replies[address] = {"ok": False, "error": str(e)}
+        finally:
+            connection.close()
+    return replies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Send a command to headless Azure kinect recorders (azure_kinect_recorder.py --headless).')
+    parser.add_argument('--rig', type=str, action='append', required=True, help='recorder to control, repeat for several: Unix socket path (--control_socket) or [host:]port (--control_port)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds to wait for each reply, "trigger wait" answers once the shot is written,  Default: 30')
+    parser.add_argument('command', nargs='+', help='trigger [wait] | start | stop | status | quit')
+    args = parser.parse_args()
+
+    replies = send(args.rig, args.command, args.timeout)
+    for address in args.rig:
+        print("{}: {}".format(address, json.dumps(replies[address])))
+    sys.exit(0 if all(reply.get("ok") for reply in replies.values()) else 1)
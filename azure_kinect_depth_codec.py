@@ -0,0 +1,138 @@
+import struct
+import cv2
+import numpy as np
+
+
+class PngCodec:
+    """16-bit PNG, level None keeps the OpenCV default of cv2.imwrite."""
+    name = "png"
+    extension = ".png"
+
+    def __init__(self, level=None):
+        self.level = level
+
+    def params(self):
+        return [] if self.level is None else [cv2.IMWRITE_PNG_COMPRESSION, self.level]
+
+    def encode(self, depth):
+        ok, blob = cv2.imencode(self.extension, depth, self.params())
+        if not ok:
+            raise RuntimeError("Unable to encode depth frame")
+        return blob.tobytes()
+
+    def decode(self, blob):
+        return cv2.imdecode(np.frombuffer(blob, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+    def write(self, path, depth):
+        if not cv2.imwrite(path, depth, self.params()):
+            raise RuntimeError("Unable to write " + path)
+
+
+class RvlCodec:
+    """Lossless depth codec after RVL (Wilson, "Fast Lossless Depth Image Compression", 2017).
+
+    Like RVL, runs of invalid (0) and valid pixels alternate and valid pixels
+    are stored as zigzag deltas to the previous valid pixel, in 4-bit codes.
+    RVL's variable length nibbles are replaced by one nibble per value plus an
+    escape (15) to a side array of large values, so every pass is a fixed
+    width NumPy operation with no per-pixel loop.
+    """
+    name = "rvl"
+    extension = ".rvl"
+    MAGIC = b"RVL2"
+    # magic, height, width, number of runs
+    HEADER = struct.Struct("<4sIII")
+
+    def encode(self, depth):
+        if depth.dtype != np.uint16 or depth.ndim != 2:
+            raise ValueError("RVL encodes 2D uint16 depth frames")
+        height, width = depth.shape
+        flat = depth.ravel()
+        valid = flat != 0
+        # Run lengths, starting with a (possibly empty) run of invalid pixels
+        edges = np.flatnonzero(valid[1:] != valid[:-1]) + 1
+        runs = np.diff(np.concatenate(([0], edges, [flat.size])))
+        if flat.size and valid[0]:
+            runs = np.concatenate(([0], runs))
+        values = flat[valid].astype(np.int32)
+        deltas = np.diff(values, prepend=np.int32(0))
+        zigzag = ((deltas << 1) ^ (deltas >> 31)).view(np.uint32)
+        return b"".join([self.HEADER.pack(self.MAGIC, height, width, runs.size),
+                         encode_tokens(runs.astype(np.uint32)), encode_tokens(zigzag)])
+
+    def decode(self, blob):
+        magic, height, width, run_count = self.HEADER.unpack_from(blob)
+        if magic != self.MAGIC:
+            raise ValueError("Not an RVL depth frame")
+        runs, offset = decode_tokens(blob, self.HEADER.size, run_count)
+        valid = np.repeat(np.arange(run_count) % 2 == 1, runs)
+        if valid.size != height * width:
+            raise ValueError("Corrupt RVL depth frame")
+        zigzag, _ = decode_tokens(blob, offset, np.count_nonzero(valid))
+        deltas = (zigzag >> 1).astype(np.int32) ^ -(zigzag & 1).astype(np.int32)
+        depth = np.zeros(height * width, dtype=np.uint16)
+        depth[valid] = np.cumsum(deltas, dtype=np.int32)
+        return depth.reshape(height, width)
+
+    def write(self, path, depth):
+        with open(path, "wb") as f:
+            f.write(self.encode(depth))
+
+
+# Token sections: one nibble per token, two per byte, ESCAPE standing for a
+# value >= ESCAPE stored in a side array of the smallest fitting dtype
+ESCAPE = 15
+ESCAPE_DTYPES = (np.uint8, np.uint16, np.uint32)
+SECTION = struct.Struct("<IB")
+
+
+def encode_tokens(tokens):
+    nibbles = np.minimum(tokens, ESCAPE).astype(np.uint8)
+    escaped = tokens[nibbles == ESCAPE] - ESCAPE
+    code = next(i for i, dtype in enumerate(ESCAPE_DTYPES)
+                if not escaped.size or escaped.max() <= np.iinfo(dtype).max)
+    if nibbles.size % 2:
+        nibbles = np.append(nibbles, np.uint8(0))
+    packed = (nibbles[0::2] | (nibbles[1::2] << 4)).astype(np.uint8)
+    return SECTION.pack(escaped.size, code) + packed.tobytes() + escaped.astype(ESCAPE_DTYPES[code]).tobytes()
+
+
+def decode_tokens(blob, offset, count):
+    # Returns (tokens, offset of the next section)
+    escaped_count, code = SECTION.unpack_from(blob, offset)
+    offset += SECTION.size
+    packed = np.frombuffer(blob, dtype=np.uint8, count=(count + 1) // 2, offset=offset)
+    offset += packed.size
+    tokens = np.empty(packed.size * 2, dtype=np.uint32)
+    tokens[0::2] = packed & 15
+    tokens[1::2] = packed >> 4
+    tokens = tokens[:count]
+    escaped = np.frombuffer(blob, dtype=ESCAPE_DTYPES[code], count=escaped_count, offset=offset)
+    offset += escaped.nbytes
+    tokens[tokens == ESCAPE] = escaped.astype(np.uint32) + ESCAPE
+    return tokens, offset
+
+
+CODECS = {codec.name: codec for codec in (PngCodec, RvlCodec)}
+EXTENSIONS = {codec.extension: codec for codec in (PngCodec, RvlCodec)}
+
+
+def make_codec(name="png", png_level=None):
+    if name not in CODECS:
+        raise ValueError("Unknown depth codec '{}', choose from {}".format(name, ", ".join(CODECS)))
+    if name == PngCodec.name:
+        return PngCodec(png_level)
+    return CODECS[name]()
+
+
+def codec_for(path):
+    for extension, codec in EXTENSIONS.items():
+        if path.endswith(extension):
+            return codec()
+    raise ValueError("No depth codec for " + path)
+
+
+def read_depth(path):
+    """Depth frame of a .png or .rvl file."""
+    with open(path, "rb") as f:
+        return codec_for(path).decode(f.read())
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+# Row chunks of the window stacked at once by the order statistic filters
+CHUNK_BYTES = 32 * 1024 * 1024
+
+
+class MeanFilter:
+    """Mean of all samples, invalid (0) ones included: the historical mean_30."""
+    name = "mean"
+
+    def subdir(self, window_size):
+        return "{}_{}".format(self.name, window_size)
+
+    def compute(self, window):
+        return window.mean()
+
+
+class ValidMeanFilter(MeanFilter):
+    """Mean of the valid samples only, 0 where no sample is valid."""
+    name = "valid_mean"
+
+    def compute(self, window):
+        return window.valid_mean()
+
+
+class MedianFilter(MeanFilter):
+    """Temporal median of the valid samples, 0 where no sample is valid.
+
+    Computed on demand over row chunks of the window, so the memory used
+    stays bounded by CHUNK_BYTES whatever the frame size.
+    """
+    name = "median"
+
+    def compute(self, window):
+        frames = list(window)
+        out = np.zeros(frames[0].shape, dtype=np.uint16)
+        for rows, stack, valid in iter_sorted_chunks(frames):
+            out[rows] = self.reduce(stack, valid)
+        return out
+
+    def reduce(self, stack, valid):
+        median, _ = sorted_median(stack, valid)
+        return median
+
+
+class RobustMeanFilter(MedianFilter):
+    """Mean of the valid samples within `threshold` mm of the temporal median."""
+    name = "robust_mean"
+
+    def __init__(self, threshold=30):
+        self.threshold = threshold
+
+    def reduce(self, stack, valid):
+        median2, invalid = sorted_median(stack, valid, doubled=True)
+        n = stack.shape[0]
+        # Sorted, invalid samples (0) first; compare in doubled units to use
+        # the exact median of an even number of samples
+        sample_valid = np.arange(n)[:, None, None] >= invalid
+        inliers = sample_valid & (np.abs(2 * stack.astype(np.int32) - median2) <= 2 * self.threshold)
+        count = inliers.sum(axis=0, dtype=np.uint32)
+        total = np.where(inliers, stack, 0).sum(axis=0, dtype=np.uint32)
+        return (total // np.maximum(count, 1)).astype(np.uint16)
+
+
+FILTERS = {f.name: f for f in (MeanFilter, ValidMeanFilter, MedianFilter, RobustMeanFilter)}
+
+
+def make_filters(names, outlier_threshold=30):
+    filters = []
+    for name in names:
+        if name not in FILTERS:
+            raise ValueError("Unknown depth filter '{}', choose from {}".format(name, ", ".join(FILTERS)))
+        if name == RobustMeanFilter.name:
+            filters.append(RobustMeanFilter(outlier_threshold))
+        else:
+            filters.append(FILTERS[name]())
+    return filters
+
+
+def apply_filters(filters, window):
+    """Map output subfolder -> filtered depth frame."""
+    return {f.subdir(window.maxlen): f.compute(window) for f in filters}
+
+
+def iter_sorted_chunks(frames):
+    # Yields (rows, stack sorted along time, number of valid samples)
+    n = len(frames)
+    h, w = frames[0].shape
+    step = max(1, CHUNK_BYTES // (n * w * 2))
+    for r0 in range(0, h, step):
+        rows = slice(r0, min(r0 + step, h))
+        stack = np.stack([frame[rows] for frame in frames])
+        stack.sort(axis=0)
+        valid = np.count_nonzero(stack, axis=0)
+        yield rows, stack, valid
+
+
+def sorted_median(stack, valid, doubled=False):
+    # Median of the valid samples of a stack sorted along axis 0, where the
+    # `n - valid` invalid samples come first; returns (median, invalid),
+    # the median being twice the exact value (int32) when doubled is set
+    n = stack.shape[0]
+    invalid = n - valid
+    k = np.maximum(valid, 1)
+    low = np.take_along_axis(stack, (invalid + (k - 1) // 2)[None].clip(max=n - 1), axis=0)[0]
+    high = np.take_along_axis(stack, (invalid + k // 2)[None].clip(max=n - 1), axis=0)[0]
+    median2 = low.astype(np.int32) + high
+    median2[valid == 0] = 0
+    if doubled:
+        return median2, invalid
+    return (median2 // 2).astype(np.uint16), invalid
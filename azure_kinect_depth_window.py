@@ -0,0 +1,101 @@
+import numpy as np
+from collections import deque
+
+
+class RunningDepthWindow:
+    """Sliding window of the last `maxlen` depth frames with running sums.
+
+    Drop-in replacement of deque(maxlen=...) for depth frames: the sum and the
+    number of valid (non zero) samples per pixel are updated when a frame
+    enters or leaves the window, so the mean is available at any time without
+    stacking the whole batch.
+    """
+
+    def __init__(self, maxlen=30):
+        # uint32 sum can't overflow for up to 65537 frames of uint16 depth,
+        # valid_count is uint16
+        if maxlen > 65535:
+            raise ValueError("maxlen too large for uint32 accumulator")
+        self.maxlen = maxlen
+        self.frames = deque()
+        self.sum = None
+        self.valid_count = None
+
+    def _allocate(self, shape):
+        self.sum = np.zeros(shape, dtype=np.uint32)
+        self.valid_count = np.zeros(shape, dtype=np.uint16)
+        self._mask = np.empty(shape, dtype=np.bool_)
+
+    def append(self, frame):
+        # Frames are kept by reference, the caller must not reuse the buffer
+        frame = np.asarray(frame, dtype=np.uint16)
+        if self.sum is None or self.sum.shape != frame.shape:
+            self.clear()
+            self._allocate(frame.shape)
+        if len(self.frames) == self.maxlen:
+            old = self.frames.popleft()
+            np.subtract(self.sum, old, out=self.sum, casting="unsafe")
+            np.not_equal(old, 0, out=self._mask)
+            np.subtract(self.valid_count, self._mask.view(np.uint8), out=self.valid_count)
+        self.frames.append(frame)
+        np.add(self.sum, frame, out=self.sum, casting="unsafe")
+        np.not_equal(frame, 0, out=self._mask)
+        np.add(self.valid_count, self._mask.view(np.uint8), out=self.valid_count)
+
+    def freeze(self):
+        # Frozen window holding only the frame references, cheap enough under
+        # the lock of the capture thread: the running sums are rebuilt by its
+        # first mean, on the thread of the filters
+        window = RunningDepthWindow(self.maxlen)
+        window.frames = deque(self.frames)
+        return window
+
+    def _sums(self):
+        if self.sum is None:
+            self._allocate(self.frames[0].shape)
+            for frame in self.frames:
+                np.add(self.sum, frame, out=self.sum, casting="unsafe")
+                np.not_equal(frame, 0, out=self._mask)
+                np.add(self.valid_count, self._mask.view(np.uint8), out=self.valid_count)
+
+    def clear(self):
+        self.frames.clear()
+        if self.sum is not None:
+            self.sum.fill(0)
+            self.valid_count.fill(0)
+
+    def mean(self, out=None):
+        # Same result as (np.asarray(frames).sum(axis=0) / n).astype(np.uint16):
+        # the float64 quotient of two integers is never rounded up to the next
+        # integer, so truncation equals integer floor division
+        n = len(self.frames)
+        if n == 0:
+            raise ValueError("mean of an empty depth window")
+        self._sums()
+        if out is None:
+            out = np.empty(self.sum.shape, dtype=np.uint16)
+        np.floor_divide(self.sum, n, out=out, casting="unsafe")
+        return out
+
+    def valid_mean(self, out=None):
+        # Mean over valid samples only, 0 where no sample was valid
+        if not self.frames:
+            raise ValueError("mean of an empty depth window")
+        self._sums()
+        if out is None:
+            out = np.empty(self.sum.shape, dtype=np.uint16)
+        count = np.maximum(self.valid_count, 1)
+        np.floor_divide(self.sum, count, out=out, casting="unsafe")
+        return out
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __bool__(self):
+        return bool(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def __iter__(self):
+        return iter(self.frames)
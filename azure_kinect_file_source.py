@@ -0,0 +1,129 @@
+import os
+import time
+import struct
+import threading
+import numpy as np
+from PIL import Image
+from PySide6.QtCore import QObject, QFileSystemWatcher, Slot
+from azure_kinect_depth_codec import RvlCodec, read_depth
+from azure_kinect_stream_files import METADATA_NAME, LEGACY_COLOR_NAME, LEGACY_DEPTH_NAME, read_metadata
+
+
+class FileFrameSource(QObject):
+    """Frame source for the stream-directory written by AzureKinectStreamer.
+
+    Instead of re-opening the files in a tight loop, the reader sleeps until
+    QFileSystemWatcher reports a change. With frame.json (see
+    azure_kinect_stream_files) a pair is decoded only for a new sequence
+    number and dropped frames are counted; with an older streamer writing
+    only color.jpg/depth.png, a pair is decoded when the depth file (written
+    last) differs from the one already ingested. Either way every streamed
+    frame is decoded and queued exactly once.
+    The object must be created in a thread running a Qt event loop (the GUI
+    thread), read_frame() is called from the capture thread.
+    """
+
+    def __init__(self, input, poll_interval=1.0, parent=None):
+        QObject.__init__(self, parent)
+        self.input = input
+        self.color_path = os.path.join(self.input, LEGACY_COLOR_NAME)
+        self.depth_path = os.path.join(self.input, LEGACY_DEPTH_NAME)
+        self.metadata_path = os.path.join(self.input, METADATA_NAME)
+        # Fallback re-check in case a notification was missed (e.g. the
+        # input directory didn't exist yet)
+        self.poll_interval = poll_interval
+        self.changed = threading.Event()
+        self.changed.set()
+        self.retry = False
+        self.last_signature = None
+        self.last_check = 0.0
+        self.sequence = 0
+        self.last_sequence = 0
+        self.dropped = 0
+        self.device = None
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_changed)
+        self.watcher.fileChanged.connect(self.on_changed)
+        self.watch()
+
+    def watch(self):
+        watched = set(self.watcher.files()) | set(self.watcher.directories())
+        for path in (self.input, self.metadata_path, self.color_path, self.depth_path):
+            if path not in watched and os.path.exists(path):
+                self.watcher.addPath(path)
+
+    @Slot(str)
+    def on_changed(self, path):
+        # Replaced files drop out of the watcher, add them back
+        self.watch()
+        self.changed.set()
+
+    def signature(self):
+        try:
+            st = os.stat(self.depth_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def read_frame(self, timeout=0.1):
+        """Return (sequence, timestamp_usec, color, depth) of a new frame or None."""
+        wait = min(timeout, 0.01) if self.retry else timeout
+        if not self.changed.wait(wait):
+            if not self.retry and time.monotonic() - self.last_check < self.poll_interval:
+                return None
+        self.changed.clear()
+        self.last_check = time.monotonic()
+        metadata = read_metadata(self.input)
+        if metadata is not None:
+            return self.read_pair(metadata)
+        signature = self.signature()
+        if signature is None or signature == self.last_signature:
+            self.retry = False
+            return None
+        try:
+            color_frame = np.asarray(Image.open(self.color_path))
+            depth_frame = np.asarray(Image.open(self.depth_path), dtype=np.uint16)
+        except (OSError, SyntaxError, ValueError):
+            # Half-written file, try again shortly
+            self.retry = True
+            return None
+        if self.signature() != signature:
+            # Rewritten while decoding, the pair may be mixed
+            self.retry = True
+            return None
+        self.retry = False
+        self.last_signature = signature
+        self.sequence += 1
+        return self.sequence, signature[0] // 1000, color_frame, depth_frame
+
+    def read_pair(self, metadata):
+        sequence = metadata["sequence"]
+        if sequence == self.last_sequence:
+            self.retry = False
+            return None
+        try:
+            color_frame = np.asarray(Image.open(os.path.join(self.input, metadata["color"])))
+            depth_path = os.path.join(self.input, metadata["depth"])
+            if depth_path.endswith(RvlCodec.extension):
+                depth_frame = read_depth(depth_path)
+            else:
+                depth_frame = np.asarray(Image.open(depth_path), dtype=np.uint16)
+        except (OSError, SyntaxError, ValueError, KeyError, struct.error):
+            self.retry = True
+            return None
+        # The slot is rewritten once the streamer is slots - 1 frames ahead
+        latest = read_metadata(self.input)
+        if latest is None or latest["sequence"] - sequence >= metadata["slots"] - 1:
+            self.retry = True
+            return None
+        self.retry = False
+        if sequence < self.last_sequence:
+            print("Stream '{}' restarted".format(self.input))
+        elif self.last_sequence and sequence > self.last_sequence + 1:
+            self.dropped += sequence - self.last_sequence - 1
+        self.last_sequence = sequence
+        self.device = metadata.get("device")
+        return sequence, metadata["timestamp_usec"], color_frame, depth_frame
+
+    def close(self):
+        pass
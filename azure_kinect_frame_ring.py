@@ -0,0 +1,128 @@
+import time
+import threading
+
+
+# Longest wait for the post-trigger frames before a shot is given up
+TRIGGER_TIMEOUT = 10.0
+
+
+class Trigger:
+    """One shot request: the frames before it and the frames after it.
+
+    history holds the frames of the ring when the trigger was armed (those
+    on screen) and depth_window the depth window ending at them, pre the
+    `pre` newest of them, post the frames received since (only kept for
+    bursts). The trigger completes when `post` new frames have arrived;
+    recent then holds the frames of the ring at that moment.
+    """
+
+    def __init__(self, pre, post, keep_post=False, history=None, depth_window=None):
+        self.history = history or []
+        self.pre = pre
+        self.post = []
+        self.remaining = post
+        self.keep_post = keep_post
+        self.recent = None
+        self.depth_window = depth_window
+        self.event = threading.Event()
+        self.armed_at = time.perf_counter()
+
+    def complete(self, recent, depth_window=None):
+        # depth_window at completion, only used when nothing was on screen
+        self.recent = recent
+        if not self.history:
+            self.depth_window = depth_window
+        self.event.set()
+
+    def wait(self, timeout=TRIGGER_TIMEOUT):
+        if not self.event.wait(timeout):
+            raise RuntimeError("{} frames still missing after {:.0f} s".format(self.remaining, timeout))
+        return self
+
+    def done(self):
+        return self.event.is_set()
+
+    def frames(self):
+        # The whole burst, oldest first
+        return self.pre + self.post
+
+    def shot_frames(self):
+        # Frames the shot is taken from, oldest first: those on screen when it
+        # was requested, or the first ones received if there were none yet
+        return self.history or self.recent
+
+
+class FrameRing:
+    """Fixed number of slots holding the last frames of one device.
+
+    Entries are (timestamp_usec, sequence, color, depth), the frames kept by
+    reference like in the depth window: sources hand over a new buffer per
+    frame, so no copy is needed. Triggers armed on the ring count the frames
+    appended after them, shots then complete after a number of frames rather
+    than after a fixed delay.
+    """
+
+    def __init__(self, capacity=4):
+        self.capacity = max(1, capacity)
+        self.slots = [None] * self.capacity
+        self.count = 0
+        self.triggers = []
+        self.lock = threading.Lock()
+
+    def append(self, timestamp_usec, sequence, color_frame, depth_frame):
+        """Store a frame, return the triggers it completes (their caller completes them)."""
+        entry = (timestamp_usec, sequence, color_frame, depth_frame)
+        with self.lock:
+            self.slots[self.count % self.capacity] = entry
+            self.count += 1
+            if not self.triggers:
+                return []
+            completed = []
+            for trigger in self.triggers:
+                if trigger.keep_post:
+                    trigger.post.append(entry)
+                trigger.remaining -= 1
+                if trigger.remaining <= 0:
+                    completed.append(trigger)
+            if completed:
+                self.triggers = [trigger for trigger in self.triggers if trigger.remaining > 0]
+            return completed
+
+    def _latest(self, n):
+        n = min(n, self.count, self.capacity)
+        return [self.slots[i % self.capacity] for i in range(self.count - n, self.count)]
+
+    def items(self):
+        # Frames of the ring, oldest first
+        with self.lock:
+            return self._latest(self.capacity)
+
+    def latest(self, n=1):
+        with self.lock:
+            return self._latest(n)
+
+    def arm(self, pre=1, post=0, keep_post=False, depth_window=None):
+        """Trigger holding the `pre` newest frames and the depth window ending
+        at them, completing after `post` new frames; with post=0 the caller
+        completes it right away."""
+        with self.lock:
+            trigger = Trigger(self._latest(pre), post, keep_post, self._latest(self.capacity), depth_window)
+            if post > 0:
+                self.triggers.append(trigger)
+            return trigger
+
+    def cancel(self, trigger):
+        with self.lock:
+            if trigger in self.triggers:
+                self.triggers.remove(trigger)
+
+    def flush(self):
+        """Triggers still waiting for frames, removed from the ring (their caller completes them)."""
+        with self.lock:
+            triggers, self.triggers = self.triggers, []
+            return triggers
+
+    def clear(self):
+        with self.lock:
+            self.slots = [None] * self.capacity
+            self.count = 0
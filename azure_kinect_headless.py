@@ -0,0 +1,218 @@
+import os
+import json
+import time
+from PySide6.QtCore import QCoreApplication, QObject, QTimer, Slot
+from PySide6.QtNetwork import QHostAddress, QLocalServer, QTcpServer
+from azure_kinect_metrics import REGISTRY
+from azure_kinect_preview import PreviewStage
+from azure_kinect_save_pool import SavePool
+
+
+# Commands, one per line, each answered by one line of JSON ({"ok": true, ...}
+# or {"ok": false, "error": ...}):
+#   trigger [wait]   take a shot; with wait, answer once it is saved or failed
+#   start            start capturing
+#   stop             stop capturing, queued shots are still saved, from the frames received
+#   status           capture state, frame and shot counters
+#   quit             stop and exit once the queued shots are saved
+COMMANDS = ("trigger", "start", "stop", "status", "quit")
+
+
+class NoPreview(PreviewStage):
+    # Headless: the capture loop never renders a preview
+    def due(self):
+        return False
+
+
+class CommandServer(QObject):
+    """Line based command server on a local Unix socket and/or a localhost
+    TCP port. `handle(words, reply)` runs in the GUI thread for every command
+    and calls reply(dict), possibly later, to answer it."""
+
+    def __init__(self, handle, socket_path=None, port=None, parent=None):
+        QObject.__init__(self, parent)
+        self.handle = handle
+        self.servers = []
+        if socket_path is not None:
+            # Left behind by a recorder that was killed
+            QLocalServer.removeServer(socket_path)
+            server = QLocalServer(self)
+            if not server.listen(socket_path):
+                raise RuntimeError("Unable to listen on {}: {}".format(socket_path, server.errorString()))
+            server.newConnection.connect(lambda server=server: self.accept(server.nextPendingConnection()))
+            self.servers.append(server)
+            print("Listening for commands on " + server.fullServerName())
+        if port is not None:
+            server = QTcpServer(self)
+            if not server.listen(QHostAddress(QHostAddress.LocalHost), port):
+                raise RuntimeError("Unable to listen on 127.0.0.1:{}: {}".format(port, server.errorString()))
+            server.newConnection.connect(lambda server=server: self.accept(server.nextPendingConnection()))
+            self.servers.append(server)
+            print("Listening for commands on 127.0.0.1:{}".format(server.serverPort()))
+
+    def accept(self, connection):
+        connection.readyRead.connect(lambda: self.read(connection))
+        connection.disconnected.connect(connection.deleteLater)
+
+    def read(self, connection):
+        while connection.canReadLine():
+            words = bytes(connection.readLine()).decode(errors="replace").split()
+            if words:
+                self.handle(words, lambda answer: self.reply(connection, answer))
+
+    def reply(self, connection, answer):
+        # The client may be gone by the time a shot is saved
+        try:
+            if connection.isOpen():
+                connection.write((json.dumps(answer) + "\n").encode())
+        except RuntimeError:
+            pass
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+
+
+class HeadlessRecorder(QObject):
+    """Recorder without a window: a CameraRGBD capturing and saving shots,
+    driven by commands (see COMMANDS) instead of buttons. No preview is
+    rendered, the capture thread only ingests frames."""
+
+    def __init__(self, camera, save_workers=2, save_queue=8, exporter=None, metrics_exporter=None,
+                 socket_path=None, port=None, parent=None):
+        QObject.__init__(self, parent)
+        self.camera = camera
+        self.camera.preview = NoPreview()
+        self.exporter = exporter
+        self.metrics_exporter = metrics_exporter
+        self.saver = SavePool(max_workers=save_workers, max_pending=save_queue, parent=self)
+        self.saver.saved.connect(self.shot_saved)
+        self.saver.failed.connect(self.shot_failed)
+        REGISTRY.gauge("kinect_queue_depth", "Items waiting in the queues of the pipeline", fn=self.saver.backlog,
+                       camera=self.camera.metrics.camera, queue="save")
+        self.saved = 0
+        self.failed = 0
+        self.last_saved = None
+        self.last_error = None
+        self.started_at = None
+        # Replies of "trigger wait" commands, by shot name
+        self.waiting = {}
+        self.quitting = False
+        self.closed = False
+        self.server = CommandServer(self.handle, socket_path, port, self)
+
+    def handle(self, words, reply):
+        command, args = words[0].lower(), words[1:]
+        if command not in COMMANDS:
+            reply({"ok": False, "error": "unknown command '{}', expected one of {}".format(command, ", ".join(COMMANDS))})
+            return
+        if self.quitting:
+            reply({"ok": False, "error": "quitting"})
+            return
+        try:
+            getattr(self, "command_" + command)(args, reply)
+        except Exception as e:
+            reply({"ok": False, "error": str(e)})
+
+    def command_trigger(self, args, reply):
+        if not self.camera.isRunning():
+            raise RuntimeError("not capturing, send start first")
+        if self.saver.backlog() >= self.saver.max_pending:
+            raise RuntimeError("save queue is full ({} shots)".format(self.saver.max_pending))
+        if self.camera.volumes.paused:
+            raise RuntimeError("all output volumes are full")
+        number = self.camera.reserve_frame_number()
+        # Armed now, the shot holds the frames of this moment whatever the backlog
+        trigger = self.camera.arm_trigger()
+        if args and args[0] == "wait":
+            self.waiting[str(number)] = reply
+        else:
+            reply({"ok": True, "shot": number})
+        self.saver.submit(str(number), self.camera.save_frames, number, trigger)
+
+    def command_start(self, args, reply):
+        self.start()
+        reply({"ok": True, "running": True})
+
+    def command_stop(self, args, reply):
+        self.stop()
+        reply({"ok": True, "running": False})
+
+    def command_status(self, args, reply):
+        reply(dict(self.status(), ok=True))
+
+    def command_quit(self, args, reply):
+        reply({"ok": True})
+        self.quitting = True
+        # After the reply is sent
+        QTimer.singleShot(0, self.quit)
+
+    def status(self):
+        metrics = self.camera.metrics
+        return {"running": self.camera.isRunning(),
+                "uptime": round(time.monotonic() - self.started_at, 1) if self.camera.isRunning() else 0.0,
+                "frames": metrics.frames.sample(),
+                "queued": self.saver.backlog(),
+                "saved": self.saved,
+                "failed": self.failed,
+                "last_saved": self.last_saved,
+                "last_error": self.last_error,
+                "output": os.path.abspath(self.camera.output_dir),
+                "volumes": self.camera.volumes.stats()}
+
+    def start(self):
+        if self.camera.isRunning():
+            return
+        print("Starting...")
+        self.camera.status = True
+        self.started_at = time.monotonic()
+        self.camera.start()
+
+    def stop(self):
+        if not self.camera.isRunning():
+            return
+        print("Finishing...")
+        self.camera.status = False
+        # The sensor read blocks, give it a few frames to return
+        if not self.camera.wait(5000):
+            self.camera.terminate()
+            self.camera.wait()
+        # No more frames to wait for
+        self.camera.flush_triggers()
+
+    @Slot(str)
+    def shot_saved(self, name):
+        self.saved += 1
+        self.last_saved = name
+        print("Saved shot " + name)
+        reply = self.waiting.pop(name, None)
+        if reply is not None:
+            reply({"ok": True, "shot": int(name)})
+
+    @Slot(str, str)
+    def shot_failed(self, name, error):
+        self.failed += 1
+        self.last_error = "{}: {}".format(name, error.strip().splitlines()[-1])
+        print("Shot {} failed: {}".format(name, error.strip()))
+        reply = self.waiting.pop(name, None)
+        if reply is not None:
+            reply({"ok": False, "shot": int(name), "error": error.strip().splitlines()[-1]})
+
+    @Slot()
+    def quit(self):
+        self.close()
+        QCoreApplication.instance().quit()
+
+    def close(self):
+        # Let queued shots reach the disk
+        if self.closed:
+            return
+        self.closed = True
+        self.server.close()
+        self.stop()
+        self.saver.shutdown(wait=True)
+        if self.exporter is not None:
+            self.exporter.shutdown(wait=True)
+        self.camera.close_output()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.close()
@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from azure_kinect_depth_codec import EXTENSIONS
+
+
+MANIFEST_NAME = "manifest.jsonl"
+# Folders of a dataset striped over several volumes, see load_volumes
+VOLUMES_NAME = "volumes.json"
+# Shots are saved by a pool, so records may land slightly out of order: resume
+# takes the highest id of the tail instead of the last line
+TAIL_BYTES = 64 * 1024
+
+
+def config_hash(settings):
+    """Short hash of a JSON-serialisable description of the capture settings."""
+    blob = json.dumps(settings, sort_keys=True, default=str).encode()
+    return hashlib.sha1(blob).hexdigest()[:12]
+
+
+def shot_files(name, streams, depth_extension=".png", pack=None):
+    # Paths relative to the output directory of a shot written by write_shot
+    # or, for the packed formats, the pack holding it
+    if pack is not None:
+        return {"pack": pack, "name": name}
+    return {stream: "{}/{}{}".format(stream, name, ".jpg" if stream == "color" else depth_extension)
+            for stream in streams}
+
+
+def read_tail(path, size=TAIL_BYTES):
+    # Complete records of the last `size` bytes of the manifest
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        f.seek(max(0, end - size))
+        lines = f.read().split(b"\n")
+    if end > size:
+        # First line is likely cut
+        lines = lines[1:]
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # Empty or torn last line of an interrupted write
+            continue
+    return records
+
+
+def drop_torn_tail(path, size=TAIL_BYTES):
+    # Cut a last line left without its newline by an interrupted write, or
+    # the next record would be appended to it and lost with it
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return
+        start = max(0, end - size)
+        f.seek(start)
+        newline = f.read().rfind(b"\n")
+        if newline >= 0 or start == 0:
+            f.truncate(start + newline + 1)
+        else:
+            # Torn line longer than the tail: terminate it instead
+            f.write(b"\n")
+
+
+def save_volumes(output_dir, roots):
+    # Relative to output_dir where possible, so the volumes can be mounted elsewhere together
+    paths = []
+    for root in roots[1:]:
+        try:
+            paths.append(os.path.relpath(root, output_dir))
+        except ValueError:
+            # Another drive
+            paths.append(os.path.abspath(root))
+    with open(os.path.join(output_dir, VOLUMES_NAME), "w") as f:
+        json.dump({"volumes": paths}, f, indent=1)
+
+
+def load_volumes(output_dir):
+    """Folders holding the files of a dataset: output_dir, which holds the
+    manifest, then its counterparts on the other volumes; a record written
+    to one of those has its index as `volume`."""
+    roots = [output_dir]
+    path = os.path.join(output_dir, VOLUMES_NAME)
+    if os.path.isfile(path):
+        with open(path) as f:
+            roots += [os.path.normpath(os.path.join(output_dir, root)) for root in json.load(f)["volumes"]]
+    return roots
+
+
+def record_root(roots, record):
+    # Folder the files of a record are relative to, roots from load_volumes
+    return roots[record.get("volume", 0)]
+
+
+def load_manifest(output_dir):
+    """Records of every shot of an output directory, in the order they were saved."""
+    records = []
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def list_shots(output_dir):
+    """(folder, name) of the shots of an output directory: from the manifest,
+    in the order they were saved and on whichever volume, or from the color
+    folder without one."""
+    records = load_manifest(output_dir)
+    if records:
+        roots = load_volumes(output_dir)
+        return [(record_root(roots, r), os.path.splitext(os.path.basename(r["files"]["color"]))[0])
+                for r in records if "color" in r["files"]]
+    return [(output_dir, os.path.splitext(f)[0]) for f in sorted(os.listdir(os.path.join(output_dir, "color")))]
+
+
+def find_depth(output_dir, depth_subdir, name):
+    # Depth frame of a shot in any of the codecs
+    for extension in EXTENSIONS:
+        path = os.path.join(output_dir, "depth", depth_subdir, name + extension)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+class Manifest:
+    """Append-only JSONL index of the shots of an output directory.
+
+    Opening reads only the tail of the file to find the next shot id, and
+    ids are handed out under a lock, so names never collide whatever the
+    size of the dataset or the number of save workers.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.next_shot = 1
+        if os.path.isfile(self.path):
+            drop_torn_tail(self.path)
+            shots = [record["shot"] for record in read_tail(self.path) if "shot" in record]
+            self.next_shot = max(shots, default=0) + 1
+        elif os.path.isdir(os.path.join(output_dir, "color")):
+            # Directory recorded before the manifest existed: continue after its shots
+            with os.scandir(os.path.join(output_dir, "color")) as entries:
+                self.next_shot += sum(1 for entry in entries if entry.is_file())
+
+    def reserve(self):
+        with self.lock:
+            shot = self.next_shot
+            self.next_shot += 1
+        return shot
+
+    def append(self, shot, files, timestamp_usec=None, device=None, config=None, volume=0):
+        record = {"shot": shot,
+                  "time": datetime.now().isoformat(timespec="milliseconds"),
+                  "timestamp_usec": timestamp_usec,
+                  "device": device,
+                  "config": config,
+                  "files": files}
+        if volume:
+            # Files are on another volume, see load_volumes
+            record["volume"] = volume
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            # Shot ids chosen by the caller (synchronized rigs) move the counter too
+            self.next_shot = max(self.next_shot, shot + 1)
+            with open(self.path, "a") as f:
+                f.write(line)
+        return record
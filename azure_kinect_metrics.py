@@ -0,0 +1,309 @@
+import os
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QLabel
+
+
+# Upper bounds in seconds of the latency histograms: 0.25 ms to ~11 s, two
+# buckets per doubling, enough to tell a 3 ms stage from a 4 ms one
+BUCKETS = tuple(0.00025 * 2 ** (k / 2) for k in range(32))
+COUNTER, GAUGE, HISTOGRAM = "counter", "gauge", "histogram"
+
+
+class Counter:
+    def __init__(self, fn=None):
+        # fn: read the value from its owner (e.g. source.dropped) at export time
+        self.fn = fn
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self.lock:
+            self.value += n
+
+    def sample(self):
+        return self.fn() if self.fn is not None else self.value
+
+
+class Gauge(Counter):
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Counts per latency bucket; observe() is a bisect and three additions."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def sample(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Metrics:
+    """Registry of the metrics of one process, labelled per camera.
+
+    Children are created once and kept by the instrumented code, the hot
+    path never looks anything up. snapshot() returns plain data, so the
+    metrics of capture processes can be sent to the GUI and exported with
+    the ones of the GUI process.
+    """
+
+    def __init__(self):
+        self.families = {}
+        self.lock = threading.Lock()
+
+    def _child(self, kind, name, help, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.families.setdefault(name, (kind, help, {}))
+            if family[0] != kind:
+                raise ValueError("Metric {} is a {}, not a {}".format(name, family[0], kind))
+            children = family[2]
+            if key not in children:
+                children[key] = factory()
+            return children[key]
+
+    def counter(self, name, help, fn=None, **labels):
+        child = self._child(COUNTER, name, help, labels, lambda: Counter(fn))
+        child.fn = fn or child.fn
+        return child
+
+    def gauge(self, name, help, fn=None, **labels):
+        # Gauges of a reused label set (e.g. a restarted camera) read the new owner
+        child = self._child(GAUGE, name, help, labels, lambda: Gauge(fn))
+        child.fn = fn or child.fn
+        return child
+
+    def histogram(self, name, help, **labels):
+        return self._child(HISTOGRAM, name, help, labels, Histogram)
+
+    def snapshot(self):
+        # [(name, kind, help, [(labels, value or (counts, sum, count))])]
+        with self.lock:
+            families = [(name, kind, help, list(children.items()))
+                        for name, (kind, help, children) in self.families.items()]
+        snapshot = []
+        for name, kind, help, children in families:
+            samples = []
+            for labels, child in children:
+                try:
+                    samples.append((labels, child.sample()))
+                except Exception:
+                    # Owner of a gauge went away
+                    continue
+            snapshot.append((name, kind, help, samples))
+        return snapshot
+
+
+# Registry of this process
+REGISTRY = Metrics()
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs) + "}"
+
+
+def render(*snapshots):
+    """Prometheus text exposition format of one or more snapshots."""
+    merged = {}
+    for snapshot in snapshots:
+        for name, kind, help, samples in snapshot:
+            merged.setdefault(name, (kind, help, []))[2].extend(samples)
+    lines = []
+    for name, (kind, help, samples) in sorted(merged.items()):
+        lines.append("# HELP {} {}".format(name, help))
+        lines.append("# TYPE {} {}".format(name, kind))
+        for labels, value in samples:
+            if kind != HISTOGRAM:
+                lines.append("{}{} {}".format(name, _labels(labels), value))
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, n in zip(BUCKETS, counts):
+                cumulative += n
+                lines.append("{}_bucket{} {}".format(name, _labels(labels, [("le", "{:.6g}".format(bound))]), cumulative))
+            lines.append("{}_bucket{} {}".format(name, _labels(labels, [("le", "+Inf")]), count))
+            lines.append("{}_sum{} {:.6f}".format(name, _labels(labels), total))
+            lines.append("{}_count{} {}".format(name, _labels(labels), count))
+    return "\n".join(lines) + "\n"
+
+
+def quantile(counts, q):
+    # Linear interpolation inside the bucket holding the q-th observation
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    for i, n in enumerate(counts):
+        if n and cumulative + n >= rank:
+            lower = BUCKETS[i - 1] if i > 0 else 0.0
+            upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1] * 2
+            return lower + (upper - lower) * (rank - cumulative) / n
+        cumulative += n
+    return BUCKETS[-1]
+
+
+class CameraMetrics:
+    """Metrics of one camera: stage latencies, frame and shot counters and
+    the queue depths, read from their owners at export time."""
+
+    def __init__(self, camera, registry=REGISTRY):
+        self.camera = camera
+        self.registry = registry
+        self.frames = registry.counter("kinect_frames_total", "Frames received from the sensor or the streamer", camera=camera)
+        self.previews = registry.counter("kinect_previews_total", "Preview images rendered", camera=camera)
+        self.shots = registry.counter("kinect_shots_total", "Shots written", camera=camera)
+        self.stages = {}
+
+    def observe(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = self.registry.histogram(
+                "kinect_stage_seconds", "Latency of the capture, preview and save stages", camera=self.camera, stage=stage)
+        histogram.observe(seconds)
+
+    def dropped(self, fn):
+        self.registry.counter("kinect_frames_dropped_total", "Frames lost before the recorder read them", fn=fn, camera=self.camera)
+
+    def queue(self, queue, fn):
+        self.registry.gauge("kinect_queue_depth", "Items waiting in the queues of the pipeline", fn=fn, camera=self.camera, queue=queue)
+
+
+def overlay_text(camera, current, previous, interval):
+    """Per-stage p50/p99 latency, frame rate, drops and queue depths of one
+    camera over the last interval, from two snapshots."""
+    def samples(snapshot):
+        values = {}
+        for name, kind, _, children in snapshot or ():
+            for labels, value in children:
+                labels = dict(labels)
+                if labels.get("camera") == camera:
+                    values[(name, labels.get("stage") or labels.get("queue"))] = value
+        return values
+    now, before = samples(current), samples(previous)
+    lines = []
+    for (name, stage), value in sorted(now.items(), key=lambda item: str(item[0])):
+        if name != "kinect_stage_seconds":
+            continue
+        counts = value[0]
+        if (name, stage) in before:
+            recent = [a - b for a, b in zip(counts, before[(name, stage)][0])]
+            # Rare stages (shots) keep showing their all-time figures
+            counts = recent if any(recent) else counts
+        p50, p99 = quantile(counts, 0.5), quantile(counts, 0.99)
+        if p50 is not None:
+            lines.append("{:<8} {:6.1f} {:6.1f} ms".format(stage, p50 * 1e3, p99 * 1e3))
+    frames = now.get(("kinect_frames_total", None), 0) - before.get(("kinect_frames_total", None), 0)
+    dropped = now.get(("kinect_frames_dropped_total", None), 0)
+    lines.append("{:.1f} fps, {} dropped".format(frames / interval if interval > 0 else 0.0, dropped))
+    queues = ["{} {}".format(queue, value) for (name, queue), value in sorted(now.items(), key=lambda item: str(item[0]))
+              if name == "kinect_queue_depth"]
+    if queues:
+        lines.append(", ".join(queues))
+    return "stage       p50    p99\n" + "\n".join(lines)
+
+
+class MetricsOverlay(QLabel):
+    # Metrics of one camera over its preview label
+    def __init__(self, camera, parent):
+        QLabel.__init__(self, parent)
+        self.camera = camera
+        self.previous = None
+        self.last_time = time.monotonic()
+        self.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 160); color: white; font-family: monospace; padding: 4px;")
+        self.move(4, 4)
+        self.hide()
+
+    def update_metrics(self, snapshot):
+        now = time.monotonic()
+        if self.isVisible():
+            self.setText(overlay_text(self.camera, snapshot, self.previous, now - self.last_time))
+            self.adjustSize()
+        self.previous = snapshot
+        self.last_time = now
+
+
+class MetricsExporter:
+    """Publishes the metrics as Prometheus text: rewritten every `interval`
+    seconds to `path` (node_exporter textfile collector) and/or served on
+    http://127.0.0.1:<port>/metrics. `snapshot` returns the metrics to publish,
+    e.g. Metrics.snapshot or the snapshots of several processes added up."""
+
+    def __init__(self, snapshot, path=None, port=None, interval=5.0):
+        self.snapshot = snapshot
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.server = None
+        self.threads = []
+        if path is not None:
+            self.threads.append(threading.Thread(target=self._write_loop, name="metrics-file", daemon=True))
+        if port is not None:
+            exporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] not in ("/", "/metrics"):
+                        self.send_error(404)
+                        return
+                    body = exporter.text().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+            self.threads.append(threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True))
+            print("Serving metrics on http://127.0.0.1:{}/metrics".format(self.server.server_address[1]))
+        for thread in self.threads:
+            thread.start()
+
+    def text(self):
+        return render(self.snapshot())
+
+    def write(self):
+        # Atomic replace, a collector never reads a half written file
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            f.write(self.text())
+        os.replace(temporary, self.path)
+
+    def _write_loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print("Unable to write metrics to {}: {}".format(self.path, e))
+
+    def close(self):
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.path is not None:
+            self.write()
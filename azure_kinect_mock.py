@@ -0,0 +1,121 @@
+import json
+import time
+import numpy as np
+
+
+COLOR_RESOLUTIONS = {
+    "K4A_COLOR_RESOLUTION_720P": (1280, 720),
+    "K4A_COLOR_RESOLUTION_1080P": (1920, 1080),
+    "K4A_COLOR_RESOLUTION_1440P": (2560, 1440),
+    "K4A_COLOR_RESOLUTION_1536P": (2048, 1536),
+    "K4A_COLOR_RESOLUTION_2160P": (3840, 2160),
+    "K4A_COLOR_RESOLUTION_3072P": (4096, 3072),
+}
+DEPTH_MODES = {
+    "K4A_DEPTH_MODE_NFOV_2X2BINNED": (320, 288),
+    "K4A_DEPTH_MODE_NFOV_UNBINNED": (640, 576),
+    "K4A_DEPTH_MODE_WFOV_2X2BINNED": (512, 512),
+    "K4A_DEPTH_MODE_WFOV_UNBINNED": (1024, 1024),
+    "K4A_DEPTH_MODE_PASSIVE_IR": (1024, 1024),
+}
+FRAME_RATES = {
+    "K4A_FRAMES_PER_SECOND_5": 5,
+    "K4A_FRAMES_PER_SECOND_15": 15,
+    "K4A_FRAMES_PER_SECOND_30": 30,
+}
+
+
+class MockRGBDImage:
+    # Same attributes as open3d.geometry.RGBDImage, np.asarray() works on both
+    def __init__(self, color, depth):
+        self.color = color
+        self.depth = depth
+
+
+def synthetic_depth(width, height, index=0, seed=0):
+    """Deterministic depth frame in mm: a slanted wall, a few boxes, sensor
+    noise and invalid (0) pixels along box edges and in random dropouts."""
+    rng = np.random.default_rng(seed + index)
+    x = np.arange(width, dtype=np.float32) / width
+    y = np.arange(height, dtype=np.float32)[:, None] / height
+    depth = 2500.0 + 600.0 * x - 300.0 * y
+    for cx, cy, size, z in ((0.3, 0.5, 0.15, 900.0), (0.65, 0.4, 0.1, 1400.0), (0.5, 0.8, 0.2, 1800.0)):
+        x0, x1 = int((cx - size) * width), int((cx + size) * width)
+        y0, y1 = int((cy - size) * height), int((cy + size) * height)
+        depth[y0:y1, x0:x1] = z + 50.0 * (x[x0:x1] - cx)
+        # Flying pixels are dropped by the sensor along depth discontinuities
+        depth[y0:y1, [x0, x1 - 1]] = 0
+        depth[[y0, y1 - 1], x0:x1] = 0
+    noise = rng.integers(-4, 5, depth.shape, dtype=np.int16)
+    depth = np.maximum(depth + noise, 0).astype(np.uint16)
+    depth[depth < 100] = 0
+    depth[rng.random(depth.shape, dtype=np.float32) < 0.02] = 0
+    return depth
+
+
+def synthetic_color(width, height, index=0, seed=0):
+    rng = np.random.default_rng(seed + index)
+    x = np.arange(width)
+    y = np.arange(height)[:, None]
+    color = np.empty((height, width, 3), dtype=np.uint8)
+    color[..., 0] = (x * 255 // max(width - 1, 1)).astype(np.uint8)
+    color[..., 1] = (y * 255 // max(height - 1, 1)).astype(np.uint8)
+    color[..., 2] = ((x // 64 + y // 64 + index) % 2 * 200).astype(np.uint8)
+    color += rng.integers(0, 8, color.shape, dtype=np.uint8)
+    return color
+
+
+class MockAzureKinectSensor:
+    """Synthetic stand-in of open3d.io.AzureKinectSensor.
+
+    Produces deterministic color/depth frames at the resolution and rate of a
+    sensor config (the JSON files read by o3d.io.read_azure_kinect_sensor_config),
+    so the capture, preview and save paths run without a device. Frames cycle
+    through `variants` precomputed images to keep generation out of the
+    measured path.
+    """
+
+    def __init__(self, config=None, color_size=None, depth_size=None, fps=None,
+                 realtime=True, variants=4, seed=0):
+        if isinstance(config, str):
+            with open(config) as f:
+                config = json.load(f)
+        config = config or {}
+        self.color_size = color_size or COLOR_RESOLUTIONS[config.get("color_resolution", "K4A_COLOR_RESOLUTION_1080P")]
+        self.depth_size = depth_size or DEPTH_MODES[config.get("depth_mode", "K4A_DEPTH_MODE_NFOV_UNBINNED")]
+        self.fps = fps or FRAME_RATES[config.get("camera_fps", "K4A_FRAMES_PER_SECOND_30")]
+        self.realtime = realtime
+        self.variants = variants
+        self.seed = seed
+        self.frame_index = 0
+        self.next_time = None
+        self.frames = {}
+
+    def connect(self, device):
+        return True
+
+    def disconnect(self):
+        pass
+
+    def _variants(self, align_depth_to_color):
+        depth_size = self.color_size if align_depth_to_color else self.depth_size
+        if depth_size not in self.frames:
+            self.frames[depth_size] = [
+                (synthetic_color(*self.color_size, index=i, seed=self.seed),
+                 synthetic_depth(*depth_size, index=i, seed=self.seed))
+                for i in range(self.variants)]
+        return self.frames[depth_size]
+
+    def capture_frame(self, align_depth_to_color):
+        frames = self._variants(align_depth_to_color)
+        if self.realtime:
+            # Block like the device until the next frame is due
+            now = time.monotonic()
+            if self.next_time is None:
+                self.next_time = now
+            if now < self.next_time:
+                time.sleep(self.next_time - now)
+            self.next_time = max(self.next_time + 1.0 / self.fps, time.monotonic() - 1.0 / self.fps)
+        color, depth = frames[self.frame_index % len(frames)]
+        self.frame_index += 1
+        return MockRGBDImage(color, depth)
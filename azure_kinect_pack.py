@@ -0,0 +1,246 @@
+import io
+import os
+import sys
+import mmap
+import time
+import argparse
+import threading
+import cv2
+import numpy as np
+from azure_kinect_depth_codec import PngCodec, RvlCodec
+from azure_kinect_manifest import list_shots
+
+
+# A pack is a plain concatenation of blobs (<base>.pack) and a side index of
+# fixed size records (<base>.idx), both only ever appended to. A blob is
+# indexed once it is fully written, so a crash leaves at most an unindexed
+# tail in the pack and a partial last record in the index, both ignored.
+PACK_EXTENSION = ".pack"
+INDEX_EXTENSION = ".idx"
+# Blob encodings: an image file (jpg/png, the bytes of the folder layout), a
+# .npy array or an RVL depth frame (the bytes of a .rvl file)
+ENCODED = 0
+RAW = 1
+RVL = 2
+INDEX_DTYPE = np.dtype([("shot", "S48"), ("stream", "S48"), ("offset", "<u8"), ("length", "<u8"), ("encoding", "u1")])
+
+
+def stream_extension(stream, encoding=ENCODED):
+    # Streams are the subfolders of the folder layout: color, depth/raw, depth/mean_30...
+    if stream == "color":
+        return ".jpg"
+    return RvlCodec.extension if encoding == RVL else PngCodec.extension
+
+
+def shot_streams(color_frame, depth_raw, depth_filtered):
+    # Same content as azure_kinect_save_pool.write_shot, as (stream, frame)
+    streams = [("color", color_frame), ("depth/raw", depth_raw)]
+    streams += [("depth/" + subdir, depth_frame) for subdir, depth_frame in depth_filtered.items()]
+    return streams
+
+
+def encode_blob(stream, frame, encoding, depth_codec=None):
+    if encoding == RAW:
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(frame))
+        return buffer.getvalue()
+    if stream != "color" and depth_codec is not None:
+        return depth_codec.encode(frame)
+    ok, blob = cv2.imencode(stream_extension(stream), frame)
+    if not ok:
+        raise RuntimeError("Unable to encode {}".format(stream))
+    return blob.tobytes()
+
+
+def decode_blob(blob, encoding):
+    # blob is a memoryview of the mapped pack; raw arrays are returned as
+    # read-only views of the mapping, images are decoded
+    if encoding == RAW:
+        header = io.BytesIO(blob[:256])
+        if np.lib.format.read_magic(header) == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(header)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(header)
+        array = np.frombuffer(blob, dtype=dtype, count=int(np.prod(shape)), offset=header.tell())
+        return array.reshape(shape, order="F" if fortran_order else "C")
+    if encoding == RVL:
+        return RvlCodec().decode(blob)
+    return cv2.imdecode(np.frombuffer(blob, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+class PackWriter:
+    """Append-only writer of one capture session.
+
+    write_shot() takes the same frames as the folder writer; blobs are encoded
+    outside of the lock so several save workers can share one writer.
+    """
+
+    def __init__(self, base, raw=False, depth_codec=None):
+        self.base = base
+        self.encoding = RAW if raw else ENCODED
+        self.depth_codec = depth_codec
+        self.depth_encoding = RVL if isinstance(depth_codec, RvlCodec) and not raw else self.encoding
+        self.lock = threading.Lock()
+        self.pack = open(base + PACK_EXTENSION, "ab")
+        self.index = open(base + INDEX_EXTENSION, "ab")
+
+    def write_shot(self, name, color_frame, depth_raw, depth_filtered, stages=None):
+        start = time.perf_counter()
+        blobs = []
+        for stream, frame in shot_streams(color_frame, depth_raw, depth_filtered):
+            encoding = self.encoding if stream == "color" else self.depth_encoding
+            blobs.append((stream, encode_blob(stream, frame, encoding, self.depth_codec), encoding))
+        encoded = time.perf_counter()
+        self.write_blobs(name, blobs)
+        if stages is not None:
+            stages.observe("encode", encoded - start)
+            stages.observe("write", time.perf_counter() - encoded)
+        return sum(len(blob) for _, blob, _ in blobs)
+
+    def write_blobs(self, name, blobs):
+        # blobs are (stream, bytes, encoding)
+        if len(name.encode()) > INDEX_DTYPE["shot"].itemsize:
+            raise ValueError("Shot name '{}' too long for the pack index".format(name))
+        records = np.zeros(len(blobs), dtype=INDEX_DTYPE)
+        with self.lock:
+            offset = self.pack.seek(0, os.SEEK_END)
+            for i, (stream, blob, encoding) in enumerate(blobs):
+                self.pack.write(blob)
+                records[i] = (name.encode(), stream.encode(), offset, len(blob), encoding)
+                offset += len(blob)
+            self.pack.flush()
+            self.index.write(records.tobytes())
+            self.index.flush()
+
+    def close(self):
+        with self.lock:
+            self.pack.close()
+            self.index.close()
+
+
+class PackReader:
+    """Random access to the shots of a pack through a memory mapping.
+
+    Shots are in the order they were written; reader[i] and reader.get(name)
+    return {stream: array} without reading the other shots.
+    """
+
+    def __init__(self, base):
+        if base.endswith(PACK_EXTENSION):
+            base = base[:-len(PACK_EXTENSION)]
+        self.base = base
+        with open(base + INDEX_EXTENSION, "rb") as f:
+            data = f.read()
+        records = np.frombuffer(data, dtype=INDEX_DTYPE, count=len(data) // INDEX_DTYPE.itemsize)
+        self.file = open(base + PACK_EXTENSION, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.shots = []
+        self.streams = {}
+        for shot, stream, offset, length, encoding in records.tolist():
+            if offset + length > size:
+                break
+            shot = shot.decode()
+            if shot not in self.streams:
+                self.shots.append(shot)
+                self.streams[shot] = {}
+            self.streams[shot][stream.decode()] = (offset, length, encoding)
+
+    def __len__(self):
+        return len(self.shots)
+
+    def __getitem__(self, index):
+        return self.get(self.shots[index])
+
+    def names(self):
+        return list(self.shots)
+
+    def blob(self, name, stream):
+        offset, length, encoding = self.streams[name][stream]
+        return memoryview(self.map)[offset:offset + length], encoding
+
+    def get(self, name, streams=None):
+        return {stream: decode_blob(*self.blob(name, stream))
+                for stream in (streams or self.streams[name])}
+
+    def close(self):
+        # Arrays returned for raw blobs are views of the mapping, which can't
+        # be closed while one is alive; it is then unmapped with the last one
+        try:
+            if self.map is not None:
+                try:
+                    self.map.close()
+                except BufferError:
+                    pass
+                self.map = None
+        finally:
+            self.file.close()
+
+
+def pack_folder(folder, base, raw=False):
+    """Pack a color/ depth/<stream>/ folder; images are copied as they are
+    unless raw is set, in which case they are decoded once and stored as arrays."""
+    streams = ["color"] + sorted("depth/" + d for d in os.listdir(os.path.join(folder, "depth"))
+                                 if os.path.isdir(os.path.join(folder, "depth", d)))
+    # Shots in the order they were taken, without listing the folder, from every volume
+    shots = list_shots(folder)
+    writer = PackWriter(base, raw=raw)
+    for root, name in shots:
+        blobs = []
+        for stream in streams:
+            for encoding in (ENCODED, RVL):
+                path = os.path.join(root, stream, name + stream_extension(stream, encoding))
+                if os.path.isfile(path):
+                    break
+            else:
+                continue
+            if raw:
+                with open(path, "rb") as f:
+                    frame = decode_blob(f.read(), encoding)
+                blobs.append((stream, encode_blob(stream, frame, RAW), RAW))
+            else:
+                with open(path, "rb") as f:
+                    blobs.append((stream, f.read(), encoding))
+        writer.write_blobs(name, blobs)
+    writer.close()
+    return len(shots)
+
+
+def unpack(base, folder):
+    reader = PackReader(base)
+    for name in reader.names():
+        for stream in reader.streams[name]:
+            os.makedirs(os.path.join(folder, stream), exist_ok=True)
+            blob, encoding = reader.blob(name, stream)
+            path = os.path.join(folder, stream, name + stream_extension(stream, encoding))
+            if encoding == RAW:
+                cv2.imwrite(path, decode_blob(blob, encoding))
+            else:
+                with open(path, "wb") as f:
+                    f.write(blob)
+            blob.release()
+    count = len(reader)
+    reader.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert between the color/ depth/ folder layout and packed captures.')
+    parser.add_argument('command', choices=["pack", "unpack", "list"], help='pack a folder, unpack a pack into a folder or list the shots of a pack')
+    parser.add_argument('source', type=str, help='folder to pack, or pack to read (with or without .pack)')
+    parser.add_argument('destination', type=str, nargs='?', help='pack to write (without extension) or folder to unpack to')
+    parser.add_argument('--raw', action='store_true', help='store decoded arrays instead of the jpg/png files, larger but read without decoding')
+    args = parser.parse_args()
+
+    if args.command == "list":
+        reader = PackReader(args.source)
+        for name in reader.names():
+            print(name, " ".join(reader.streams[name]))
+        reader.close()
+        sys.exit(0)
+    if args.destination is None:
+        parser.error("{} needs a destination".format(args.command))
+    if args.command == "pack":
+        print("Packed {} shots".format(pack_folder(args.source, args.destination, args.raw)))
+    else:
+        print("Unpacked {} shots".format(unpack(args.source, args.destination)))
@@ -0,0 +1,176 @@
+import time
+import cv2
+import numpy as np
+from PySide6.QtCore import Signal, Slot
+from PySide6.QtGui import QImage
+from PySide6.QtWidgets import QComboBox, QFormLayout, QSpinBox, QWidget
+
+
+COLOR, DEPTH, SIDE_BY_SIDE = "color", "depth", "side-by-side"
+PREVIEW_MODES = (COLOR, DEPTH, SIDE_BY_SIDE)
+# Range of the depth sensor, in millimeters
+MAX_DEPTH_MM = 65535
+
+
+def depth_lut(near_mm, far_mm, rgb=False, colormap=cv2.COLORMAP_TURBO):
+    """(65536, 3) uint8 table giving the colour of every depth in millimeters:
+    near_mm to far_mm spread over the colormap, closer than near_mm white,
+    further than far_mm dark grey and no depth (0) black, so holes and range
+    problems stand out. Channels in RGB order with rgb, BGR otherwise."""
+    if not 0 <= near_mm < far_mm <= MAX_DEPTH_MM:
+        raise ValueError("Invalid depth preview range {}-{} mm".format(near_mm, far_mm))
+    ramp = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(-1, 1), colormap).reshape(256, 3)
+    if rgb:
+        ramp = ramp[:, ::-1]
+    depth = np.arange(MAX_DEPTH_MM + 1, dtype=np.float32)
+    index = np.clip((depth - near_mm) * (255.0 / (far_mm - near_mm)), 0, 255).astype(np.uint8)
+    lut = ramp[index]
+    lut[:near_mm] = 255
+    lut[far_mm + 1:] = 64
+    lut[0] = 0
+    return lut
+
+
+class PreviewStage:
+    """Turns full resolution frames into small display images.
+
+    The frame is decimated and resized once with an area filter to the label
+    size (keeping the aspect ratio) and wrapped into a QImage of the channel order
+    the frame already has, so no full resolution colour conversion or
+    QImage.scaled is needed. Rendering is throttled to `fps`, independently
+    of the capture rate; the full resolution frame is never modified.
+
+    In depth and side-by-side modes the depth frame is decimated to the label
+    size with a nearest resize (averaging would blend holes into their
+    neighbours) and coloured with one lookup per pixel in a table rebuilt
+    only when the range changes.
+    """
+
+    def __init__(self, width=640, height=480, fps=15.0, image_format=QImage.Format_BGR888,
+                 mode=COLOR, near_mm=300, far_mm=4000):
+        self.width = width
+        self.height = height
+        self.image_format = image_format
+        self.next_time = 0.0
+        self.set_fps(fps)
+        self.mode = COLOR
+        self.lut = None
+        self.configure(mode, near_mm, far_mm)
+
+    def set_fps(self, fps):
+        # fps <= 0 renders every frame
+        self.interval = 1.0 / fps if fps and fps > 0 else 0.0
+
+    def configure(self, mode, near_mm, far_mm):
+        # Called from the GUI thread while the capture thread renders, the
+        # table is replaced, never modified in place
+        if mode not in PREVIEW_MODES:
+            raise ValueError("Unknown preview mode '{}', choose from {}".format(mode, ", ".join(PREVIEW_MODES)))
+        if self.lut is None or (near_mm, far_mm) != (self.near_mm, self.far_mm):
+            lut = np.zeros((MAX_DEPTH_MM + 1, 4), dtype=np.uint8)
+            lut[:, :3] = depth_lut(near_mm, far_mm, rgb=self.image_format == QImage.Format_RGB888)
+            # One uint32 per depth: a 4 byte gather per pixel from a 256 KB
+            # table, several times faster than indexing rows of 3 bytes
+            self.lut = lut.view(np.uint32).ravel()
+            self.near_mm, self.far_mm = near_mm, far_mm
+        self.mode = mode
+
+    def due(self):
+        # True when a new preview should be rendered, the caller then calls render()
+        now = time.monotonic()
+        if now < self.next_time:
+            return False
+        # Keep the cadence without bursting after a stall
+        self.next_time = max(self.next_time + self.interval, now)
+        return True
+
+    def target_size(self, frame_width, frame_height, width=None):
+        scale = min((width or self.width) / frame_width, self.height / frame_height)
+        return max(1, int(frame_width * scale)), max(1, int(frame_height * scale))
+
+    def resize(self, frame, width=None):
+        h, w = frame.shape[:2]
+        size = self.target_size(w, h, width)
+        if size == (w, h):
+            return np.ascontiguousarray(frame)
+        # Integer decimation down to the smallest frame still covering the
+        # label, then one area resize; an area resize of the full frame costs
+        # several times the old colour conversion at 3072P
+        step = max(1, min(w // size[0], h // size[1]))
+        if step > 1:
+            frame = frame[::step, ::step]
+        return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+    def colorize(self, depth_frame, width=None):
+        h, w = depth_frame.shape[:2]
+        # Nearest only reads the pixels it keeps, no decimation needed first
+        small = cv2.resize(depth_frame, self.target_size(w, h, width), interpolation=cv2.INTER_NEAREST)
+        colored = self.lut.take(small).view(np.uint8).reshape(small.shape + (4,))
+        # Drops the padding byte whatever the channel order, unlike a numpy slice copy
+        return cv2.cvtColor(colored, cv2.COLOR_BGRA2BGR)
+
+    def compose(self, color_frame, depth_frame=None):
+        """Label sized frame of the current mode, colour only without depth."""
+        mode = self.mode
+        if mode == COLOR or depth_frame is None:
+            return self.resize(color_frame)
+        if mode == DEPTH:
+            return self.colorize(depth_frame)
+        # Side by side in half the width each; registered depth has the
+        # color size, native depth another aspect ratio
+        color = self.resize(color_frame, self.width // 2)
+        depth = self.colorize(depth_frame, self.width // 2)
+        height = max(color.shape[0], depth.shape[0])
+        small = np.zeros((height, color.shape[1] + depth.shape[1], 3), dtype=np.uint8)
+        small[:color.shape[0], :color.shape[1]] = color
+        small[:depth.shape[0], color.shape[1]:] = depth
+        return small
+
+    def render(self, color_frame, depth_frame=None):
+        small = self.compose(color_frame, depth_frame)
+        h, w = small.shape[:2]
+        ch = small.shape[2] if small.ndim == 3 else 1
+        # QImage doesn't own `small`, copy() detaches it before the array is freed
+        return QImage(small.data, w, h, ch * w, self.image_format).copy()
+
+
+class PreviewControls(QWidget):
+    """Preview mode and depth colour range of the recorder windows, emits
+    changed(mode, near_mm, far_mm)."""
+    changed = Signal(str, int, int)
+
+    def __init__(self, mode=COLOR, near_mm=300, far_mm=4000, parent=None):
+        QWidget.__init__(self, parent)
+        self.combo_mode = QComboBox(self)
+        self.combo_mode.addItems(PREVIEW_MODES)
+        self.combo_mode.setCurrentText(mode)
+        self.spin_near = QSpinBox(self)
+        self.spin_far = QSpinBox(self)
+        for spin in (self.spin_near, self.spin_far):
+            spin.setRange(0, MAX_DEPTH_MM)
+            spin.setSingleStep(100)
+            spin.setSuffix(" mm")
+        self.spin_near.setValue(near_mm)
+        self.spin_far.setValue(far_mm)
+        self.update_limits()
+        layout = QFormLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addRow("Preview", self.combo_mode)
+        layout.addRow("Near", self.spin_near)
+        layout.addRow("Far", self.spin_far)
+        self.combo_mode.currentTextChanged.connect(self.emit_changed)
+        self.spin_near.valueChanged.connect(self.emit_changed)
+        self.spin_far.valueChanged.connect(self.emit_changed)
+
+    def update_limits(self):
+        # Keep near < far
+        self.spin_near.setMaximum(self.spin_far.value() - 1)
+        self.spin_far.setMinimum(self.spin_near.value() + 1)
+
+    def settings(self):
+        return self.combo_mode.currentText(), self.spin_near.value(), self.spin_far.value()
+
+    @Slot()
+    def emit_changed(self):
+        self.update_limits()
+        self.changed.emit(*self.settings())
@@ -0,0 +1,284 @@
+import os
+import time
+import queue
+import socket
+import struct
+import threading
+import collections
+import cv2
+import numpy as np
+from azure_kinect_control import parse_address
+from azure_kinect_depth_codec import PngCodec, RvlCodec
+
+
+# A frame message is a fixed header followed by the color and depth payloads:
+#   magic, color and depth encodings, channels, sequence, timestamp_usec,
+#   device (-1 for none), color width/height, depth width/height, payload sizes
+HEADER = struct.Struct("<4sBBBxQqiIIIIII")
+MAGIC = b"AKF1"
+# Payload encodings; raw arrays for local subscribers, compressed (jpg color,
+# png or rvl depth) for subscribers on other machines
+RAW = 0
+JPEG = 1
+PNG = 2
+RVL = 3
+ENCODINGS = ("raw", "compressed")
+
+
+def encode_frame(sequence, timestamp_usec, device, color_frame, depth_frame, encoding="raw", depth_codec=None):
+    """Header and payloads of one frame message, sent as they are to every subscriber."""
+    color_frame = np.ascontiguousarray(color_frame)
+    depth_frame = np.ascontiguousarray(depth_frame, dtype=np.uint16)
+    if encoding == "raw":
+        color_encoding, depth_encoding = RAW, RAW
+        color_payload, depth_payload = memoryview(color_frame).cast("B"), memoryview(depth_frame).cast("B")
+    else:
+        depth_codec = depth_codec or PngCodec()
+        ok, color_payload = cv2.imencode(".jpg", color_frame)
+        if not ok:
+            raise RuntimeError("Unable to encode the color frame")
+        color_encoding = JPEG
+        depth_encoding = RVL if isinstance(depth_codec, RvlCodec) else PNG
+        depth_payload = depth_codec.encode(depth_frame)
+    channels = color_frame.shape[2] if color_frame.ndim == 3 else 1
+    header = HEADER.pack(MAGIC, color_encoding, depth_encoding, channels, sequence, timestamp_usec,
+                         -1 if device is None else device,
+                         color_frame.shape[1], color_frame.shape[0], depth_frame.shape[1], depth_frame.shape[0],
+                         len(color_payload), len(depth_payload))
+    return header, color_payload, depth_payload
+
+
+def decode_payload(payload, encoding, width, height, channels=None):
+    if encoding == RAW:
+        shape = (height, width, channels) if channels and channels > 1 else (height, width)
+        return np.frombuffer(payload, dtype=np.uint8 if channels else np.uint16).reshape(shape)
+    if encoding == RVL:
+        return RvlCodec().decode(payload)
+    flags = cv2.IMREAD_COLOR if encoding == JPEG else cv2.IMREAD_UNCHANGED
+    frame = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), flags)
+    if frame is None:
+        raise ValueError("Unable to decode a frame payload")
+    return frame
+
+
+class Subscriber:
+    # One connection of a FramePublisher: bounded queue and sender thread
+    def __init__(self, connection, name, queue_size):
+        self.connection = connection
+        self.name = name
+        self.queue = collections.deque(maxlen=queue_size)
+        self.condition = threading.Condition()
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._send_loop, name="pubsub-" + name, daemon=True)
+        self.thread.start()
+
+    def put(self, message):
+        with self.condition:
+            if len(self.queue) == self.queue.maxlen:
+                # Slow consumer: its oldest frame goes, the others don't wait for it
+                self.dropped += 1
+            self.queue.append(message)
+            self.condition.notify()
+
+    def _send_loop(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                message = self.queue.popleft()
+            try:
+                for part in message:
+                    self.connection.sendall(part)
+            except OSError:
+                self.close()
+                return
+            self.sent += 1
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.connection.close()
+
+
+class FramePublisher:
+    """Serves the frames of a streamer to any number of subscribers over a
+    Unix socket or TCP.
+
+    A frame is encoded once, raw or compressed, and queued to every
+    subscriber; each subscriber has its own bounded queue and sender thread,
+    so a slow or remote consumer loses its oldest frames instead of slowing
+    down the streamer or the other consumers. Nothing is encoded while
+    nobody is subscribed.
+    """
+
+    def __init__(self, address, encoding="raw", depth_codec=None, queue_size=2):
+        if encoding not in ENCODINGS:
+            raise ValueError("Unknown encoding '{}', choose from {}".format(encoding, ", ".join(ENCODINGS)))
+        self.address = address
+        self.encoding = encoding
+        self.depth_codec = depth_codec
+        self.queue_size = max(1, queue_size)
+        self.subscribers = []
+        self.lock = threading.Lock()
+        family, target = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(target):
+            # Left behind by a streamer that was killed
+            os.remove(target)
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(target)
+        self.server.listen()
+        self.unix_path = target if family == socket.AF_UNIX else None
+        self.thread = threading.Thread(target=self._accept_loop, name="pubsub-accept", daemon=True)
+        self.thread.start()
+        print("Publishing {} frames on {}".format(encoding, address))
+
+    def _accept_loop(self):
+        while True:
+            try:
+                connection, peer = self.server.accept()
+            except OSError:
+                # Closed
+                return
+            if connection.family != socket.AF_UNIX:
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            name = "{}:{}".format(*peer[:2]) if isinstance(peer, tuple) else "local"
+            with self.lock:
+                self.subscribers.append(Subscriber(connection, name, self.queue_size))
+            print("Subscriber {} connected".format(name))
+
+    def publish(self, sequence, timestamp_usec, device, color_frame, depth_frame):
+        with self.lock:
+            # Drop the subscribers that went away
+            gone = [subscriber for subscriber in self.subscribers if subscriber.closed]
+            for subscriber in gone:
+                print("Subscriber {} left, {} frames sent, {} dropped".format(subscriber.name, subscriber.sent, subscriber.dropped))
+            self.subscribers = [subscriber for subscriber in self.subscribers if not subscriber.closed]
+            subscribers = list(self.subscribers)
+        if not subscribers:
+            return
+        # Raw messages reference the frames, which the sensor never reuses
+        message = encode_frame(sequence, timestamp_usec, device, color_frame, depth_frame, self.encoding, self.depth_codec)
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.close()
+            self.subscribers = []
+        if self.unix_path is not None and os.path.exists(self.unix_path):
+            os.remove(self.unix_path)
+
+
+class FrameSubscriber:
+    """Frame source for the recorders subscribing to a FramePublisher.
+
+    A receiver thread reads and decodes the messages, so the capture thread
+    only picks decoded frames up; it (re)connects until the publisher is
+    there. Frames the publisher dropped for this subscriber and frames not
+    picked up in time show as sequence gaps, counted in `dropped`.
+    """
+
+    def __init__(self, address, queue_size=4, retry_interval=0.5):
+        self.address = address
+        self.retry_interval = retry_interval
+        self.frames = queue.Queue(maxsize=max(1, queue_size))
+        self.last_sequence = 0
+        self.dropped = 0
+        self.device = None
+        self.connection = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._receive_loop, name="pubsub-receive", daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        family, target = parse_address(self.address)
+        connection = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            connection.connect(target)
+        except OSError:
+            connection.close()
+            raise
+        return connection
+
+    def _receive(self, connection, size):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            n = connection.recv_into(view[received:], size - received)
+            if n == 0:
+                raise ConnectionError("publisher closed the connection")
+            received += n
+        return buffer
+
+    def _receive_loop(self):
+        while not self.closed:
+            try:
+                self.connection = self._connect()
+            except OSError:
+                # Publisher is not running (yet)
+                time.sleep(self.retry_interval)
+                continue
+            try:
+                while not self.closed:
+                    self._put(self._read_message(self.connection))
+            except (OSError, ValueError) as e:
+                if not self.closed:
+                    print("Subscription to '{}' lost: {}".format(self.address, e))
+            finally:
+                self.connection.close()
+            # A restarted publisher starts its sequence over
+            self.last_sequence = 0
+
+    def _read_message(self, connection):
+        (magic, color_encoding, depth_encoding, channels, sequence, timestamp_usec, device,
+         color_width, color_height, depth_width, depth_height, color_size, depth_size) = HEADER.unpack(
+            self._receive(connection, HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("not a frame stream")
+        color_frame = decode_payload(self._receive(connection, color_size), color_encoding, color_width, color_height, channels)
+        depth_frame = decode_payload(self._receive(connection, depth_size), depth_encoding, depth_width, depth_height)
+        return sequence, timestamp_usec, None if device < 0 else device, color_frame, depth_frame
+
+    def _put(self, frame):
+        if self.frames.full():
+            # The capture thread fell behind, keep the newest frames; the
+            # sequence gap counts the dropped one
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                pass
+        self.frames.put(frame)
+
+    def read_frame(self, timeout=0.1):
+        """Return (sequence, timestamp_usec, color, depth) of a new frame or None."""
+        try:
+            sequence, timestamp_usec, device, color_frame, depth_frame = self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if self.last_sequence and sequence > self.last_sequence + 1:
+            self.dropped += sequence - self.last_sequence - 1
+        self.last_sequence = sequence
+        self.device = device
+        return sequence, timestamp_usec, color_frame, depth_frame
+
+    def close(self):
+        self.closed = True
+        if self.connection is not None:
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
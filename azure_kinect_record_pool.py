@@ -0,0 +1,192 @@
+import os
+import time
+import queue
+import threading
+from datetime import datetime
+import cv2
+from azure_kinect_depth_codec import PngCodec
+from azure_kinect_manifest import save_volumes
+from azure_kinect_volumes import VolumeSet, VolumeFullError
+
+
+DROP_OLDEST = "drop-oldest"
+BLOCK = "block"
+
+
+class RecordingEncoder:
+    """Continuous recording of every captured RGBD frame.
+
+    Frames go through a bounded queue to a pool of encoder threads (cv2
+    releases the GIL while encoding), so memory stays bounded: when the
+    encoders fall behind, either the oldest queued frame is dropped
+    ("drop-oldest") or the capture thread waits ("block"). With a VolumeSet
+    the frames are spread over its folders, each holding part of
+    record/<session>; frames are dropped while every volume is full.
+    """
+
+    def __init__(self, output_dir, workers=4, queue_size=16, drop_policy=DROP_OLDEST, color_is_rgb=False, depth_codec=None, volumes=None):
+        if drop_policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError("Unknown drop policy: " + str(drop_policy))
+        self.output_dir = output_dir
+        self.workers = workers
+        self.drop_policy = drop_policy
+        # RGB frames are converted to BGR by the encoder threads, not by capture
+        self.color_is_rgb = color_is_rgb
+        self.depth_codec = depth_codec or PngCodec()
+        self.volumes = volumes or VolumeSet([output_dir], reserve_mb=0)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = []
+        self.lock = threading.Lock()
+        # Notified when no put() is queueing a frame, see stop()
+        self.idle = threading.Condition(self.lock)
+        self.putting = 0
+        self.stopped = False
+        self.session_dir = None
+        # record/<session> in every folder of the volumes, session_dir first
+        self.session_dirs = []
+        self.captured = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.bytes_written = 0
+        self.start_time = None
+        self.stop_time = None
+
+    def start(self):
+        # Milliseconds, and a counter, keep sessions started within a second apart
+        current_datetime = datetime.now()
+        session = current_datetime.strftime("%Y-%m-%d_%H-%M-%S-") + "{:03d}".format(current_datetime.microsecond // 1000)
+        suffix = 0
+        while os.path.exists(os.path.join(self.volumes.roots[0], "record", session + ("_{}".format(suffix) if suffix else ""))):
+            suffix += 1
+        if suffix:
+            session += "_{}".format(suffix)
+        self.session_dirs = [os.path.join(root, "record", session) for root in self.volumes.roots]
+        for session_dir in self.session_dirs:
+            os.makedirs(session_dir + "/color", exist_ok=True)
+            os.makedirs(session_dir + "/depth", exist_ok=True)
+        self.session_dir = self.session_dirs[0]
+        if len(self.session_dirs) > 1:
+            # Replay finds the frames on the other volumes from there
+            save_volumes(self.session_dir, self.session_dirs)
+        self.start_time = time.monotonic()
+        self.stop_time = None
+        self.stopped = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._encode_loop, name="record-{}".format(i), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        print('Recording to \'{}\''.format(self.session_dir))
+
+    def put(self, color_frame, depth_frame):
+        """Queue one captured frame, returns False if a frame was dropped."""
+        with self.lock:
+            self.captured += 1
+            if self.stopped:
+                # The capture thread took the recorder before it was stopped
+                self.dropped += 1
+                return False
+            index = self.captured
+            self.putting += 1
+        try:
+            return self._queue((index, color_frame, depth_frame))
+        finally:
+            with self.lock:
+                self.putting -= 1
+                self.idle.notify_all()
+
+    def _queue(self, item):
+        if self.drop_policy == BLOCK:
+            self.queue.put(item)
+            return True
+        dropped = False
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return not dropped
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                except queue.Empty:
+                    continue
+                dropped = True
+                with self.lock:
+                    self.dropped += 1
+
+    def _encode_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            index, color_frame, depth_frame = item
+            name = "{:06d}".format(index)
+            try:
+                if self.color_is_rgb:
+                    color_frame = cv2.cvtColor(color_frame, cv2.COLOR_RGB2BGR)
+                with self.volumes.write() as volume:
+                    session_dir = self.session_dirs[volume.index]
+                    volume.size = self._write(session_dir + "/color/" + name + ".jpg", ".jpg", color_frame)
+                    volume.size += self._save(session_dir + "/depth/" + name + self.depth_codec.extension,
+                                              self.depth_codec.encode(depth_frame))
+                size = volume.size
+            except VolumeFullError:
+                # Reported by the volume watchdog
+                with self.lock:
+                    self.dropped += 1
+            except (OSError, RuntimeError, cv2.error) as e:
+                print("Unable to record frame {}: {}".format(name, e))
+                with self.lock:
+                    self.dropped += 1
+            else:
+                with self.lock:
+                    self.encoded += 1
+                    self.bytes_written += size
+            self.queue.task_done()
+
+    @staticmethod
+    def _write(path, ext, image):
+        ok, data = cv2.imencode(ext, image)
+        if not ok:
+            raise RuntimeError("Unable to encode " + path)
+        return RecordingEncoder._save(path, data)
+
+    @staticmethod
+    def _save(path, data):
+        with open(path, "wb") as f:
+            f.write(data)
+        return len(data)
+
+    def stop(self):
+        # Frames still being queued go in before the sentinels, later ones are
+        # counted as dropped by put(); the encoders are running, so a blocked
+        # put() gets its place
+        with self.lock:
+            self.stopped = True
+            self.idle.wait_for(lambda: self.putting == 0)
+        # Encode what is still queued, then stop the workers
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.stop_time = time.monotonic()
+        return self.stats()
+
+    def stats(self):
+        with self.lock:
+            captured, encoded, dropped, bytes_written = self.captured, self.encoded, self.dropped, self.bytes_written
+        end = self.stop_time if self.stop_time is not None else time.monotonic()
+        elapsed = max(end - self.start_time, 1e-6) if self.start_time is not None else 0.0
+        return {"captured": captured,
+                "encoded": encoded,
+                "dropped": dropped,
+                "queued": self.queue.qsize(),
+                "seconds": elapsed,
+                "fps": encoded / elapsed if elapsed else 0.0,
+                "mb_per_s": bytes_written / 1e6 / elapsed if elapsed else 0.0}
+
+    @staticmethod
+    def format_stats(stats):
+        return "captured {captured}, encoded {encoded}, dropped {dropped}, queued {queued}, " \
+               "{fps:.1f} FPS, {mb_per_s:.1f} MB/s".format(**stats)
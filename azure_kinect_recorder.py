@@ -1,13 +1,25 @@
-import os
 import sys
+import signal
 import time
+import json
 from datetime import datetime
 import cv2
-import open3d as o3d
 import argparse
 import numpy as np
-from collections import deque
-from PySide6.QtCore import Qt, QThread, Signal, Slot, QUrl
+import azure_kinect_camera
+from azure_kinect_camera import RecorderSettings, make_exporter
+from azure_kinect_depth_filters import apply_filters
+from azure_kinect_save_pool import SavePool
+from azure_kinect_volumes import POLICIES
+from azure_kinect_preview import PREVIEW_MODES, PreviewControls, PreviewStage
+from azure_kinect_calibration import load_calibration
+from azure_kinect_registration import DepthRegistration
+from azure_kinect_metrics import REGISTRY, MetricsExporter, MetricsOverlay
+from azure_kinect_mock import MockAzureKinectSensor
+from azure_kinect_replay import ReplaySource
+from azure_kinect_record_pool import RecordingEncoder
+from azure_kinect_headless import HeadlessRecorder
+from PySide6.QtCore import Qt, QCoreApplication, QTimer, Slot, QUrl
 from PySide6.QtGui import QAction, QImage, QKeySequence, QPixmap
 from PySide6.QtMultimedia import QSoundEffect
 from PySide6.QtWidgets import (QApplication, QComboBox, QGroupBox,
@@ -20,88 +32,134 @@ from PySide6.QtWidgets import (QApplication, QComboBox, QGroupBox,
 detection from the OpenCV module. e.g.: face, eyes, body, etc."""
 
 
-class CameraRGBD(QThread):
-    updateFrame = Signal(QImage)
+class CameraRGBD(azure_kinect_camera.CameraRGBD):
+    """CameraRGBD capturing from the sensor itself (an open3d AzureKinectSensor,
+    or a stand-in with the same interface), which delivers RGB frames, with
+    optional deferred registration and continuous recording."""
 
     def __init__(self, parent=None):
-        QThread.__init__(self, parent)
-        self.status = True
-        self.sensor = None
-        self.color_frame = None
-        self.depth_queue = deque(maxlen=30)
-        self.output_dir = None
-        self.number_last_frame = 1
-        self.align_depth_to_color = True
-
-    def set_sensor(self, sensor):
-        self.sensor = sensor
-    
-    def set_output_dir(self, output_dir):
-        self.output_dir = output_dir
-        if self.output_dir is None:
-            self.output_dir = "frames"
-
-        if (os.path.isdir(self.output_dir + "/color") and os.path.isdir(self.output_dir + "/depth")):
-            print('Output directory \'{}\' already existing, continue recording there'.format(self.output_dir))
-            for path in os.listdir(self.output_dir + "/color"):
-                # check if current path is a file
-                if os.path.isfile(os.path.join(self.output_dir + "/color", path)):
-                    self.number_last_frame += 1
-        else:
-            try:
-                os.mkdir(self.output_dir)
-                os.mkdir(self.output_dir + "/color")
-                os.mkdir(self.output_dir + "/depth/")
-                os.mkdir(self.output_dir + "/depth/raw")
-                os.mkdir(self.output_dir + "/depth/mean_30")
-            except (PermissionError, FileExistsError):
-                print("Unable to mkdir: " + self.output_dir)
+        azure_kinect_camera.CameraRGBD.__init__(self, parent)
+        self.sensor_config = None
+        # DepthRegistration of the saved frames when the sensor doesn't align, see set_registration
+        self.registration = None
+        self.preview = PreviewStage(640, 480, fps=15.0, image_format=QImage.Format_RGB888)
+        # RecordingEncoder receiving every frame while recording
+        self.recorder = None
+
+    def configure(self, settings):
+        self.set_registration(settings.deferred_registration, settings.calibration)
+        azure_kinect_camera.CameraRGBD.configure(self, settings)
+
+    def set_sensor(self, sensor, device=None, config=None):
+        self.source = sensor
+        self.device = device
+        if config is not None:
+            with open(config) as f:
+                self.sensor_config = json.load(f)
+
+    def set_registration(self, deferred=False, calibration=None):
+        # Deferred: the window holds native depth frames, only the written
+        # ones are registered to color, from the calibration file if any
+        self.align_depth_to_color = not deferred
+        self.registration = None
+        if deferred:
+            self.registration = DepthRegistration(load_calibration(calibration) if calibration is not None else None)
+            if calibration is None:
+                print("No calibration file, registering depth with the nominal calibration")
+
+    def register(self, color_frame, depth_frame):
+        # Depth of a written frame in the geometry of the color frame
+        if self.registration is None:
+            return depth_frame
+        return self.registration.register(depth_frame, (color_frame.shape[1], color_frame.shape[0]))
+
+    def capture_settings(self):
+        # Hashed into the manifest to tell apart shots taken with different settings
+        settings = {"source": self.sensor_config,
+                    "align_depth_to_color": self.align_depth_to_color,
+                    "depth_filters": [f.subdir(self.depth_queue.maxlen) for f in self.depth_filters],
+                    "depth_codec": self.depth_codec.name,
+                    "png_level": getattr(self.depth_codec, "level", None)}
+        if self.registration is not None:
+            settings["registration"] = self.registration.calibration or "nominal"
+        return settings
 
     def run(self):
         if self.depth_queue:
             self.depth_queue.clear()
+        self.ring.clear()
+        sequence = 0
+        metrics = self.metrics
         while self.status: 
-            rgbd = self.sensor.capture_frame(self.align_depth_to_color)
+            # Blocks until the sensor delivers a frame, capture includes the wait
+            start = time.perf_counter()
+            rgbd = self.source.capture_frame(self.align_depth_to_color)
             if rgbd is None:
                 continue
-            self.color_frame = cv2.cvtColor(np.asarray(rgbd.color), cv2.COLOR_BGR2RGB)
+            captured = time.perf_counter()
+            metrics.observe("capture", captured - start)
+            metrics.frames.inc()
+            # Kept in the RGB order of the sensor, converted to BGR only for the written frames
+            color_frame = np.asarray(rgbd.color)
             depth_frame = np.asarray(rgbd.depth)
-            self.depth_queue.append(depth_frame)
-            # Creating and scaling QImage
-            h, w, ch = self.color_frame.shape
-            img = QImage(self.color_frame.data, w, h, ch * w, QImage.Format_BGR888)
-            scaled_img = img.scaled(640, 480, Qt.KeepAspectRatio)
-            # Emit signal
-            self.updateFrame.emit(scaled_img)
+            sequence += 1
+            # Open3D doesn't expose the device timestamp, use the host clock at capture
+            self.ingest(sequence, time.time_ns() // 1000, color_frame, depth_frame)
+            metrics.observe("ingest", time.perf_counter() - captured)
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.put(color_frame, depth_frame)
+            self.show(color_frame, depth_frame)
+
+    def snapshot(self):
+        color_frame, depth_raw, depth_window, timestamp_usec = azure_kinect_camera.CameraRGBD.snapshot(self)
+        return cv2.cvtColor(color_frame, cv2.COLOR_RGB2BGR), depth_raw, depth_window, timestamp_usec
 
-    @Slot(int)
-    def adjust_x(self, value):
-        self.set_x(value)
-        
     @Slot()
-    def save_frames(self):
-        time.sleep(1)
+    def save_frames(self, number=None, trigger=None):
+        if number is None:
+            number = self.reserve_frame_number()
+        if trigger is None:
+            trigger = self.arm_trigger()
+        # Completes post_frames frames after the request, at the rate of the sensor:
+        # the frame saved and the depth window filtered are those on screen
+        self.wait_trigger(trigger)
         current_datetime = datetime.now()
         unique_image_name = str(current_datetime.year) + "-" \
                             + str(current_datetime.month) + "-" \
                             + str(current_datetime.day) + "_" \
                             + str(current_datetime.hour) + "-" \
                             + str(current_datetime.minute) + "-" \
-                            + str(current_datetime.second)
-        cv2.imwrite(self.output_dir + "/color/" + unique_image_name + ".jpg", self.color_frame)
-        depth_batch = np.asarray(self.depth_queue)
-        depth_raw = depth_batch[-1]
-        depth_mean = (depth_batch.sum(axis=0)/depth_batch.shape[0]).astype(np.uint16)
-        cv2.imwrite(self.output_dir + "/depth/raw/" + unique_image_name + ".png", depth_raw)
-        cv2.imwrite(self.output_dir + "/depth/mean_30/" + unique_image_name + ".png", depth_mean)
-        print("frame ", self.number_last_frame)
-        self.number_last_frame += 1
-
+                            + str(current_datetime.second) + "_" \
+                            + str(number)
+        timestamp_usec, _, color_frame, depth_raw = trigger.shot_frames()[-1]
+        start = time.perf_counter()
+        depth_filtered = apply_filters(self.depth_filters, trigger.depth_window)
+        filtered = time.perf_counter()
+        color_frame = cv2.cvtColor(color_frame, cv2.COLOR_RGB2BGR)
+        converted = time.perf_counter()
+        self.metrics.observe("filter", filtered - start)
+        self.metrics.observe("convert", converted - filtered)
+        if self.registration is not None:
+            # Filtered at the native depth resolution, registered once
+            depth_raw = self.register(color_frame, depth_raw)
+            depth_filtered = {subdir: self.register(color_frame, depth) for subdir, depth in depth_filtered.items()}
+            self.metrics.observe("register", time.perf_counter() - converted)
+        self.write_shot(number, unique_image_name, color_frame, depth_raw, depth_filtered, timestamp_usec)
+        self.metrics.shots.inc()
+        self.metrics.observe("shot", time.perf_counter() - trigger.armed_at)
+        if self.burst:
+            self.save_burst(number, unique_image_name, trigger)
+        print("frame ", number)
+
+    def written_frames(self, color_frame, depth_raw):
+        return cv2.cvtColor(color_frame, cv2.COLOR_RGB2BGR), self.register(color_frame, depth_raw)
 
 
 class Window(QMainWindow):
-    def __init__(self, sensor, output_dir):
+    def __init__(self, sensor, settings):
         super().__init__()
+        self.settings = settings
         # Title and dimensions
         self.setWindowTitle("Patterns detection")
         self.setGeometry(0, 0, 800, 500)
@@ -117,22 +175,73 @@ class Window(QMainWindow):
                         triggered=qApp.aboutQt)
         self.menu_about.addAction(about)
 
+        self.menu_view = self.menu.addMenu("View")
+        self.action_metrics = QAction("Metrics overlay", self, checkable=True, checked=settings.metrics_overlay)
+        self.action_metrics.toggled.connect(self.show_metrics)
+        self.menu_view.addAction(self.action_metrics)
+
         # Create a label for the display camera
         self.label = QLabel(self)
         self.label.setFixedSize(640, 480)
 
         # Thread in charge of updating the image
         self.th = CameraRGBD(self)
-        self.th.set_sensor(sensor)
-        self.th.set_output_dir(output_dir)
+        self.th.set_sensor(sensor, settings.device, settings.config)
+        self.th.configure(settings)
         self.th.finished.connect(self.close)
         self.th.updateFrame.connect(self.setImage)
 
+        # Writer pool in charge of saving shots off the GUI thread
+        self.saver = SavePool(max_workers=settings.save_workers, max_pending=settings.save_queue, parent=self)
+        self.saver.saved.connect(self.shot_saved)
+        self.saver.backlogChanged.connect(self.set_backlog)
+        self.label_backlog = QLabel("Queued: 0", self)
+
+        # Optional point cloud export of every shot, in a process pool
+        self.exporter = make_exporter(settings, self)
+        self.label_clouds = QLabel("Clouds: 0", self)
+        if self.exporter is not None:
+            self.exporter.failed.connect(self.cloud_failed)
+            self.exporter.backlogChanged.connect(self.set_cloud_backlog)
+            self.th.exporter = self.exporter
+        self.label_clouds.setVisible(self.exporter is not None)
+
+        # Continuous recording of every frame
+        self.recorder = None
+        self.label_record = QLabel("", self)
+        self.label_record.setWordWrap(True)
+        self.label_record.setFixedWidth(140)
+        self.record_timer = QTimer(self)
+        self.record_timer.setInterval(1000)
+        self.record_timer.timeout.connect(self.update_record_stats)
+
+        # Stage latencies and queue depths, over the preview and/or exported
+        REGISTRY.gauge("kinect_queue_depth", "Items waiting in the queues of the pipeline", fn=self.saver.backlog, camera="camera", queue="save")
+        REGISTRY.gauge("kinect_queue_depth", "Items waiting in the queues of the pipeline", camera="camera", queue="record",
+                       fn=lambda: self.recorder.stats()["queued"] if self.recorder is not None else 0)
+        if self.exporter is not None:
+            REGISTRY.gauge("kinect_queue_depth", "Items waiting in the queues of the pipeline", fn=self.exporter.backlog, camera="camera", queue="cloud")
+        self.overlay = MetricsOverlay("camera", self.label)
+        self.overlay.setVisible(settings.metrics_overlay)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.update_metrics)
+        self.metrics_timer.start(1000)
+        self.metrics_exporter = None
+        if settings.metrics_file is not None or settings.metrics_port is not None:
+            self.metrics_exporter = MetricsExporter(REGISTRY.snapshot, settings.metrics_file, settings.metrics_port,
+                                                    settings.metrics_interval)
+
+        # Color, depth or both in the preview, and the depth colour range
+        self.preview_controls = PreviewControls(settings.preview_mode, settings.preview_near_mm, settings.preview_far_mm, self)
+        self.preview_controls.changed.connect(self.set_preview)
+
         # Buttons layout
         horizontal_buttons_layout = QHBoxLayout()
         self.button_start = QPushButton("Start")
         self.button_stop = QPushButton("Stop/Close")
         self.button_photo = QPushButton("Photo")
+        self.button_record = QPushButton("Record")
+        self.button_record.setCheckable(True)
         self.button_start.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Expanding)
         self.button_stop.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Expanding)
         self.button_photo.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Expanding)
@@ -153,11 +262,18 @@ class Window(QMainWindow):
         self.button_stop.setEnabled(False)
         self.button_photo.clicked.connect(self.save_frames)
         self.button_photo.setEnabled(False)
+        self.button_record.toggled.connect(self.toggle_recording)
+        self.button_record.setEnabled(False)
 
         # Layout for button_photo
         vertical_buttons_layout = QVBoxLayout()
         vertical_buttons_layout.setAlignment(Qt.AlignTop)
         vertical_buttons_layout.addWidget(self.button_photo) 
+        vertical_buttons_layout.addWidget(self.label_backlog)
+        vertical_buttons_layout.addWidget(self.label_clouds)
+        vertical_buttons_layout.addWidget(self.button_record)
+        vertical_buttons_layout.addWidget(self.label_record)
+        vertical_buttons_layout.addWidget(self.preview_controls)
         
         # Main layout to align left layout and right layout
         main_layout = QHBoxLayout()
@@ -177,6 +293,8 @@ class Window(QMainWindow):
         print("Finishing...")
         self.button_stop.setEnabled(False)
         self.button_photo.setEnabled(False)
+        self.button_record.setChecked(False)
+        self.button_record.setEnabled(False)
         self.button_start.setEnabled(True)
         self.th.status = False
         # Give time for the camera to finish
@@ -190,29 +308,97 @@ class Window(QMainWindow):
         print("Starting...")
         self.button_stop.setEnabled(True)
         self.button_photo.setEnabled(True)
+        self.button_record.setEnabled(True)
         self.button_start.setEnabled(False)
         self.th.start()
     
     @Slot()
     def save_frames(self):
+        # Only the GUI thread submits, so the backlog can't grow after this check
+        if self.saver.backlog() >= self.saver.max_pending:
+            print("Save queue is full ({} shots), photo skipped".format(self.saver.max_pending))
+            return
+        if self.th.volumes.paused:
+            print("All output volumes are full, photo skipped")
+            return
         print("Saving frames...")
-        self.button_photo.setEnabled(False)
-        self.th.save_frames()
-        self.button_photo.setEnabled(True)
+        number = self.th.reserve_frame_number()
+        self.saver.submit(str(number), self.th.save_frames, number, self.th.arm_trigger())
+
+    @Slot(bool)
+    def toggle_recording(self, checked):
+        if checked:
+            self.recorder = RecordingEncoder(self.settings.output, workers=self.settings.record_workers,
+                                             queue_size=self.settings.record_queue, drop_policy=self.settings.drop_policy,
+                                             color_is_rgb=True, depth_codec=self.th.depth_codec, volumes=self.th.volumes)
+            self.recorder.start()
+            self.th.recorder = self.recorder
+            self.button_record.setText("Stop recording")
+            self.record_timer.start()
+        elif self.recorder is not None:
+            self.th.recorder = None
+            self.record_timer.stop()
+            stats = self.recorder.stop()
+            self.recorder = None
+            print("Recording finished:", RecordingEncoder.format_stats(stats))
+            self.label_record.setText(RecordingEncoder.format_stats(stats))
+            self.button_record.setText("Record")
+
+    @Slot()
+    def update_record_stats(self):
+        if self.recorder is not None:
+            self.label_record.setText(RecordingEncoder.format_stats(self.recorder.stats()))
+
+    @Slot(str)
+    def shot_saved(self, name):
+        self.effect.play()
         print("Saved")
 
+    @Slot()
+    def update_metrics(self):
+        self.overlay.update_metrics(REGISTRY.snapshot())
+
+    @Slot(bool)
+    def show_metrics(self, checked):
+        self.overlay.setVisible(checked)
+        self.update_metrics()
+
+    @Slot(int)
+    def set_backlog(self, pending):
+        self.label_backlog.setText("Queued: {}".format(pending))
+
+    @Slot(str, int, int)
+    def set_preview(self, mode, near_mm, far_mm):
+        self.th.preview.configure(mode, near_mm, far_mm)
+
     @Slot(QImage)
     def setImage(self, image):
+        # Queued signal delivery from the capture thread to the GUI thread
+        self.th.metrics.observe("deliver", time.perf_counter() - self.th.emitted_at)
         self.label.setPixmap(QPixmap.fromImage(image))
 
     def keyPressEvent(self, event):
         if event.key() == 16777239: # clicker button code
-            print("Saving frames...")
-            self.button_photo.setEnabled(False)
-            self.th.save_frames()
-            self.button_photo.setEnabled(True)
-            self.effect.play()
-            print("Saved")
+            self.save_frames()
+
+    @Slot(int)
+    def set_cloud_backlog(self, pending):
+        self.label_clouds.setText("Clouds: {}".format(pending))
+
+    @Slot(str, str)
+    def cloud_failed(self, name, error):
+        print("Point cloud of {} not exported: {}".format(name, error.strip()))
+
+    def closeEvent(self, event):
+        # Let queued shots and recorded frames reach the disk
+        self.button_record.setChecked(False)
+        self.saver.shutdown(wait=True)
+        if self.exporter is not None:
+            self.exporter.shutdown(wait=True)
+        self.th.close_output()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.close()
+        event.accept()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Azure kinect recorder.')
@@ -220,17 +406,70 @@ if __name__ == "__main__":
     parser.add_argument('--list', action='store_true', help='list available azure kinect sensors')
     parser.add_argument('--device', type=int, default=0, help='input kinect device id')
     parser.add_argument('--output', type=str, default="frames", help='output path to store color/ and depth/ images,  Default: frames')
+    parser.add_argument('--output_volumes', type=str, nargs='+', default=None, help='further disks to spread the shots and recorded frames over, each gets a folder named like the output folder; the manifest stays in the output folder,  Default: output folder only')
+    parser.add_argument('--volume_policy', type=str, default="round-robin", choices=POLICIES, help='volume of each shot: in turn, the one with the most free space, or the one expected to write it first from the measured write rates,  Default: round-robin')
+    parser.add_argument('--min_free_mb', type=int, default=1024, help='free space kept on every volume: full volumes are skipped, shots are refused once all are (0 disables the watchdog),  Default: 1024')
+    parser.add_argument('--save_workers', type=int, default=2, help='number of threads encoding and writing shots,  Default: 2')
+    parser.add_argument('--save_queue', type=int, default=8, help='maximum number of shots waiting to be saved,  Default: 8')
+    parser.add_argument('--record_workers', type=int, default=4, help='number of encoder threads in record mode,  Default: 4')
+    parser.add_argument('--record_queue', type=int, default=16, help='maximum number of frames waiting for the encoders in record mode,  Default: 16')
+    parser.add_argument('--drop_policy', type=str, default="drop-oldest", choices=["drop-oldest", "block"], help='what to do when the encoders fall behind in record mode,  Default: drop-oldest')
+    parser.add_argument('--mock', action='store_true', help='use a synthetic sensor producing frames of the --config resolution and rate')
+    parser.add_argument('--replay', type=str, default=None, help='play a folder recorded by the recorders (color/, depth/raw/ or a record/<session> folder) instead of the sensor,  Default: sensor')
+    parser.add_argument('--replay_timing', type=str, default="original", choices=["original", "fixed", "fast"], help='with --replay, play the recorded frames at their recorded timestamps, at --replay_fps or as fast as they decode,  Default: original')
+    parser.add_argument('--replay_fps', type=float, default=30.0, help='frame rate of --replay_timing fixed,  Default: 30')
+    parser.add_argument('--replay_loop', action='store_true', help='with --replay, start over at the end of the recording')
+    parser.add_argument('--preview_fps', type=float, default=15.0, help='maximum preview refresh rate, independent of the capture rate,  Default: 15')
+    parser.add_argument('--preview', type=str, default="color", choices=PREVIEW_MODES, help='preview the color frames, the depth frames coloured from --preview_near_mm to --preview_far_mm, or both side by side, also switchable in the window,  Default: color')
+    parser.add_argument('--preview_near_mm', type=int, default=300, help='depth shown at the start of the colormap, closer is white, no depth black,  Default: 300')
+    parser.add_argument('--preview_far_mm', type=int, default=4000, help='depth shown at the end of the colormap, further is grey,  Default: 4000')
+    parser.add_argument('--depth_window', type=int, default=30, help='number of depth frames the filters run over,  Default: 30')
+    parser.add_argument('--depth_filters', type=str, nargs='+', default=["mean"], choices=["mean", "valid_mean", "median", "robust_mean"], help='temporal depth filters, each written to depth/<filter>_<window>/,  Default: mean')
+    parser.add_argument('--outlier_mm', type=int, default=30, help='distance to the temporal median beyond which robust_mean rejects a sample,  Default: 30')
+    parser.add_argument('--output_format', type=str, default="folder", choices=["folder", "pack", "pack-raw"], help='write shots as files in color/ and depth/, or append them to one container per session with encoded (pack) or raw (pack-raw) frames,  Default: folder')
+    parser.add_argument('--depth_codec', type=str, default="png", choices=["png", "rvl"], help='depth frame format: 16-bit png, or rvl, a faster and smaller lossless depth codec (read with azure_kinect_depth_codec.read_depth),  Default: png')
+    parser.add_argument('--png_level', type=int, default=None, choices=range(10), metavar='[0-9]', help='png compression level of the depth frames,  Default: OpenCV default')
+    parser.add_argument('--cloud_format', type=str, default=None, choices=["ply", "pcd"], help='also export a colored point cloud of every shot to cloud/, built from the first depth filter,  Default: no export')
+    parser.add_argument('--cloud_workers', type=int, default=2, help='number of point cloud export processes,  Default: 2')
+    parser.add_argument('--cloud_voxel', type=float, default=0.0, help='voxel size in meters of the point cloud downsampling, 0 to keep every point,  Default: 0')
+    parser.add_argument('--intrinsics', type=str, default=None, help='color camera intrinsics of the point clouds, JSON of o3d.io.write_pinhole_camera_intrinsic,  Default: nominal intrinsics')
+    parser.add_argument('--depth_trunc', type=float, default=3.0, help='points further than this distance in meters are left out of the point clouds,  Default: 3')
+    parser.add_argument('--metrics_overlay', action='store_true', help='show the stage latencies, frame rate, drops and queue depths over the preview (View menu)')
+    parser.add_argument('--metrics_file', type=str, default=None, help='write the metrics in Prometheus text format to this file every --metrics_interval seconds,  Default: no file')
+    parser.add_argument('--metrics_port', type=int, default=None, help='serve the metrics in Prometheus text format on http://127.0.0.1:<port>/metrics,  Default: no server')
+    parser.add_argument('--metrics_interval', type=float, default=5.0, help='seconds between two writes of --metrics_file,  Default: 5')
+    parser.add_argument('--pre_frames', type=int, default=1, help='frames kept from the moment a shot is requested, saved with --burst,  Default: 1')
+    parser.add_argument('--post_frames', type=int, default=0, help='frames captured after a shot is requested before it is written, saved too with --burst,  Default: 0')
+    parser.add_argument('--burst', action='store_true', help='also save the color and raw depth of all pre and post trigger frames of a shot, as <shot>_b<index>')
+    parser.add_argument('--deferred_registration', action='store_true', help='keep native resolution depth in the window and register only the written depth frames to color, instead of the sensor aligning every frame; record mode then writes native depth')
+    parser.add_argument('--calibration', type=str, default=None, help='depth/color intrinsics and extrinsics of --deferred_registration, JSON of azure_kinect_calibration.save_calibration,  Default: nominal calibration')
+    parser.add_argument('--headless', action='store_true', help='run without a window nor preview, capturing from the start and taking commands (trigger, start, stop, status, quit) on --control_socket/--control_port, see azure_kinect_control.py')
+    parser.add_argument('--control_socket', type=str, default=None, help='Unix socket path of the headless command server,  Default: none')
+    parser.add_argument('--control_port', type=int, default=None, help='localhost TCP port of the headless command server,  Default: none')
     args = parser.parse_args()
+    if not 0 <= args.preview_near_mm < args.preview_far_mm <= 65535:
+        parser.error('--preview_near_mm must be below --preview_far_mm, both within 0-65535')
+    if args.headless and args.control_socket is None and args.control_port is None:
+        parser.error('--headless needs --control_socket and/or --control_port')
 
     if args.list:
+        import open3d as o3d
         o3d.io.AzureKinectSensor.list_devices()
         exit()
 
-    if args.config is not None:
-        config = o3d.io.read_azure_kinect_sensor_config(args.config)
+    if args.replay is not None:
+        # The sensor delivers RGB
+        sensor = ReplaySource(args.replay, args.replay_timing, args.replay_fps, args.replay_loop, rgb=True)
+    elif args.mock:
+        sensor = MockAzureKinectSensor(args.config)
     else:
-        config = o3d.io.AzureKinectSensorConfig()
-    sensor = o3d.io.AzureKinectSensor(config)
+        # Imported here, --mock and --replay run without Open3D
+        import open3d as o3d
+        if args.config is not None:
+            config = o3d.io.read_azure_kinect_sensor_config(args.config)
+        else:
+            config = o3d.io.AzureKinectSensorConfig()
+        sensor = o3d.io.AzureKinectSensor(config)
 
     device = args.device
     if device < 0 or device > 255:
@@ -240,7 +479,31 @@ if __name__ == "__main__":
     if not sensor.connect(device):
         raise RuntimeError('Failed to connect to sensor')
     
+    settings = RecorderSettings.from_args(args, device=device, preview_mode=args.preview)
+    if args.headless:
+        app = QCoreApplication()
+        camera = CameraRGBD()
+        camera.set_sensor(sensor, device, args.config)
+        camera.configure(settings)
+        exporter = make_exporter(settings)
+        if exporter is not None:
+            exporter.failed.connect(lambda name, error: print("Point cloud of {} not exported: {}".format(name, error.strip())))
+            camera.exporter = exporter
+        metrics_exporter = None
+        if args.metrics_file is not None or args.metrics_port is not None:
+            metrics_exporter = MetricsExporter(REGISTRY.snapshot, args.metrics_file, args.metrics_port, args.metrics_interval)
+        recorder = HeadlessRecorder(camera, args.save_workers, args.save_queue, exporter, metrics_exporter,
+                                    socket_path=args.control_socket, port=args.control_port)
+        # Ctrl+C / kill save the queued shots too; the timer lets Python see the signal
+        signal.signal(signal.SIGINT, lambda *_: recorder.quit())
+        signal.signal(signal.SIGTERM, lambda *_: recorder.quit())
+        timer = QTimer()
+        timer.timeout.connect(lambda: None)
+        timer.start(200)
+        recorder.start()
+        sys.exit(app.exec())
+
     app = QApplication()
-    w = Window(sensor, args.output)
+    w = Window(sensor, settings)
     w.show()
     sys.exit(app.exec())
\ No newline at end of file
@@ -1,94 +1,22 @@
-import os
 import sys
 import time
 
-import cv2
 import argparse
-import numpy as np
-from PIL import Image
-from collections import deque
-from PySide6.QtCore import Qt, QThread, Signal, Slot
+from azure_kinect_camera import CameraRGBD, RecorderSettings, make_exporter
+from azure_kinect_save_pool import SavePool
+from azure_kinect_volumes import POLICIES
+from azure_kinect_preview import PREVIEW_MODES, PreviewControls
+from azure_kinect_metrics import REGISTRY, MetricsExporter, MetricsOverlay
+from azure_kinect_capture_process import CaptureProcess, CpuMeter
+from PySide6.QtCore import Qt, QTimer, Slot
 from PySide6.QtGui import QAction, QImage, QKeySequence, QPixmap
 from PySide6.QtWidgets import (QApplication, QComboBox, QGroupBox,
                                QHBoxLayout, QLabel, QMainWindow, QPushButton,
                                QSizePolicy, QVBoxLayout, QWidget, QSlider)
 
 
-class CameraRGBD(QThread):
-    updateFrame = Signal(QImage)
-
-    def __init__(self, parent=None):
-        QThread.__init__(self, parent)
-        self.status = True
-        self.input = None
-        self.color_frame = None
-        self.depth_queue = deque(maxlen=30)
-        self.output_dir = None
-        self.number_last_frame = 1
-        self.align_depth_to_color = True
-
-    def set_input(self, input):
-        self.input = input
-    
-    def set_output_dir(self, output_dir):
-        self.output_dir = output_dir
-        if self.output_dir is None:
-            self.output_dir = "frames"
-
-        if (os.path.isdir(self.output_dir + "/color") and os.path.isdir(self.output_dir + "/depth")):
-            print('Output directory \'{}\' already existing, continue recording there'.format(self.output_dir))
-            for path in os.listdir(self.output_dir + "/color"):
-                # check if current path is a file
-                if os.path.isfile(os.path.join(self.output_dir + "/color", path)):
-                    self.number_last_frame += 1
-        else:
-            try:
-                os.mkdir(self.output_dir)
-                os.mkdir(self.output_dir + "/color")
-                os.mkdir(self.output_dir + "/depth/")
-                os.mkdir(self.output_dir + "/depth/raw")
-                os.mkdir(self.output_dir + "/depth/mean_30")
-            except (PermissionError, FileExistsError):
-                print("Unable to mkdir: " + self.output_dir)
-    
-
-    def run(self):
-        while self.status:
-            try:
-                color_frame = Image.open(self.input + "/" + "color.jpg")
-                color_frame = np.asarray(color_frame)
-                depth_frame = Image.open(self.input + "/" + "depth.png")
-                depth_frame = np.asarray(depth_frame, dtype=np.uint16)
-            except:
-                continue
-            self.color_frame = color_frame
-            self.depth_queue.append(depth_frame)
-            # Creating and scaling QImage
-            h, w, ch = self.color_frame.shape
-            img = QImage(self.color_frame.data, w, h, ch * w, QImage.Format_BGR888)
-            scaled_img = img.scaled(640, 480, Qt.KeepAspectRatio)
-            # Emit signal
-            self.updateFrame.emit(scaled_img)
-
-    @Slot(int)
-    def adjust_x(self, value):
-        self.set_x(value)
-        
-    @Slot()
-    def save_frames(self):
-        time.sleep(1)
-        depth_batch = np.asarray(self.depth_queue)
-        depth_raw = depth_batch[-1]
-        depth_mean = (depth_batch.sum(axis=0)/depth_batch.shape[0]).astype(np.uint16)
-        cv2.imwrite(self.output_dir + "/color/" + str(self.number_last_frame) + ".jpg", self.color_frame)
-        cv2.imwrite(self.output_dir + "/depth/raw/" + str(self.number_last_frame) + ".png", depth_raw)
-        cv2.imwrite(self.output_dir + "/depth/mean_30/" + str(self.number_last_frame) + ".png", depth_mean)
-        self.number_last_frame += 1
-
-
-
 class Window(QMainWindow):
-    def __init__(self, input, output):
+    def __init__(self, settings):
         super().__init__()
         self.setWindowTitle("Patterns detection")
         self.setGeometry(0, 0, 800, 500)
@@ -104,17 +32,75 @@ class Window(QMainWindow):
                         triggered=qApp.aboutQt)
         self.menu_about.addAction(about)
 
+        self.menu_view = self.menu.addMenu("View")
+        self.action_metrics = QAction("Metrics overlay", self, checkable=True, checked=settings.metrics_overlay)
+        self.action_metrics.toggled.connect(self.show_metrics)
+        self.menu_view.addAction(self.action_metrics)
+
         # Create a label for the display camera
         self.label = QLabel(self)
         self.label.setFixedSize(640, 480)
 
-        # Thread in charge of updating the image
-        self.th = CameraRGBD(self)
-        self.th.set_input(input)
-        self.th.set_output_dir(output)
+        # Thread in charge of updating the image, or a capture process doing
+        # the capture, filtering and saving, the GUI process then only renders
+        self.capture_process = settings.capture_process
+        if self.capture_process:
+            self.th = CaptureProcess("azure_kinect_recorder_v2", settings, self)
+            self.th.saved.connect(self.shot_saved)
+            self.th.failed.connect(self.shot_failed)
+            self.th.cloudFailed.connect(self.cloud_failed)
+        else:
+            self.th = CameraRGBD(self)
+            self.th.set_input(settings.input, settings.transport, settings.replay_options)
+            self.th.configure(settings)
         self.th.finished.connect(self.close)
         self.th.updateFrame.connect(self.setImage)
 
+        # Writer pool in charge of saving shots off the GUI thread
+        self.saver = SavePool(max_workers=settings.save_workers, max_pending=settings.save_queue, parent=self)
+        self.saver.saved.connect(self.shot_saved)
+        self.saver.failed.connect(self.shot_failed)
+        self.saver.backlogChanged.connect(self.set_backlog)
+        self.label_backlog = QLabel("Queued: 0", self)
+        # Shots sent to the capture process and not saved or failed yet
+        self.in_flight = 0
+
+        # Optional point cloud export of every shot, in a process pool
+        self.exporter = None
+        self.label_clouds = QLabel("Clouds: 0", self)
+        if not self.capture_process:
+            self.exporter = make_exporter(settings, self)
+        if self.exporter is not None:
+            self.exporter.failed.connect(self.cloud_failed)
+            self.exporter.backlogChanged.connect(self.set_cloud_backlog)
+            self.th.exporter = self.exporter
+        self.label_clouds.setVisible(self.exporter is not None)
+
+        # CPU use of the GUI process and of the capture process
+        self.cpu = CpuMeter()
+        self.label_cpu = QLabel("CPU: -", self)
+        self.cpu_timer = QTimer(self)
+        self.cpu_timer.timeout.connect(self.update_cpu)
+        self.cpu_timer.timeout.connect(self.update_metrics)
+        self.cpu_timer.start(1000)
+
+        # Stage latencies and queue depths, over the preview and/or exported
+        if not self.capture_process:
+            # The capture process reports its own save queue
+            REGISTRY.gauge("kinect_queue_depth", "Items waiting in the queues of the pipeline", fn=self.saver.backlog, camera="camera", queue="save")
+        if self.exporter is not None:
+            REGISTRY.gauge("kinect_queue_depth", "Items waiting in the queues of the pipeline", fn=self.exporter.backlog, camera="camera", queue="cloud")
+        self.overlay = MetricsOverlay("camera", self.label)
+        self.overlay.setVisible(settings.metrics_overlay)
+        self.metrics_exporter = None
+        if settings.metrics_file is not None or settings.metrics_port is not None:
+            self.metrics_exporter = MetricsExporter(self.metrics_snapshot, settings.metrics_file, settings.metrics_port,
+                                                    settings.metrics_interval)
+
+        # Color, depth or both in the preview, and the depth colour range
+        self.preview_controls = PreviewControls(settings.preview_mode, settings.preview_near_mm, settings.preview_far_mm, self)
+        self.preview_controls.changed.connect(self.set_preview)
+
         # Buttons layout
         horizontal_buttons_layout = QHBoxLayout()
         self.button_start = QPushButton("Start")
@@ -145,6 +131,10 @@ class Window(QMainWindow):
         vertical_buttons_layout = QVBoxLayout()
         vertical_buttons_layout.setAlignment(Qt.AlignTop)
         vertical_buttons_layout.addWidget(self.button_photo) 
+        vertical_buttons_layout.addWidget(self.label_backlog)
+        vertical_buttons_layout.addWidget(self.label_clouds)
+        vertical_buttons_layout.addWidget(self.label_cpu)
+        vertical_buttons_layout.addWidget(self.preview_controls)
         
         # Main layout to align left layout and right layout
         main_layout = QHBoxLayout()
@@ -160,6 +150,9 @@ class Window(QMainWindow):
         self.button_stop.setEnabled(False)
         self.button_photo.setEnabled(False)
         self.button_start.setEnabled(True)
+        if self.capture_process:
+            self.th.stop()
+            return
         self.th.status = False
         # Give time for the camera to finish
         time.sleep(1)
@@ -177,23 +170,143 @@ class Window(QMainWindow):
     
     @Slot()
     def save_frames(self):
+        # Only the GUI thread submits, so the backlog can't grow after this check
+        pending = self.in_flight if self.capture_process else self.saver.backlog()
+        if pending >= self.saver.max_pending:
+            print("Save queue is full ({} shots), photo skipped".format(self.saver.max_pending))
+            return
         print("Saving frames...")
-        self.button_photo.setEnabled(False)
-        self.th.save_frames()
-        self.button_photo.setEnabled(True)
+        if self.capture_process:
+            # The capture process reserves the shot id, settles and saves
+            self.th.shot()
+            self.in_flight += 1
+            self.set_backlog(self.in_flight)
+            return
+        if self.th.volumes.paused:
+            print("All output volumes are full, photo skipped")
+            return
+        number = self.th.reserve_frame_number()
+        self.saver.submit(str(number), self.th.save_frames, number, self.th.arm_trigger())
+
+    @Slot(str, int, int)
+    def set_preview(self, mode, near_mm, far_mm):
+        if self.capture_process:
+            self.th.set_preview(mode, near_mm, far_mm)
+        else:
+            self.th.preview.configure(mode, near_mm, far_mm)
+
+    @Slot(str)
+    def shot_saved(self, name):
         print("Saved")
+        self.shot_done()
+
+    @Slot(str, str)
+    def shot_failed(self, name, error):
+        print("Shot {} not saved: {}".format(name, error.strip().splitlines()[-1]))
+        self.shot_done()
+
+    def shot_done(self):
+        # The capture process answers every shot once, saved or failed
+        if self.capture_process and self.in_flight > 0:
+            self.in_flight -= 1
+            self.set_backlog(self.in_flight)
+
+    @Slot()
+    def update_cpu(self):
+        text = "CPU: GUI {:.0f}%".format(self.cpu.sample())
+        if self.capture_process:
+            text += "\ncapture {:.0f}%".format(self.th.cpu)
+        self.label_cpu.setText(text)
+
+    def metrics_snapshot(self):
+        # Metrics of this process, and of the capture process if any
+        if self.capture_process:
+            return REGISTRY.snapshot() + self.th.metrics
+        return REGISTRY.snapshot()
+
+    @Slot()
+    def update_metrics(self):
+        self.overlay.update_metrics(self.metrics_snapshot())
+
+    @Slot(bool)
+    def show_metrics(self, checked):
+        self.overlay.setVisible(checked)
+        self.update_metrics()
+
+    @Slot(int)
+    def set_backlog(self, pending):
+        self.label_backlog.setText("Queued: {}".format(pending))
 
     @Slot(QImage)
     def setImage(self, image):
+        if not self.capture_process:
+            # Queued signal delivery from the capture thread to the GUI thread
+            self.th.metrics.observe("deliver", time.perf_counter() - self.th.emitted_at)
         self.label.setPixmap(QPixmap.fromImage(image))
 
+    @Slot(int)
+    def set_cloud_backlog(self, pending):
+        self.label_clouds.setText("Clouds: {}".format(pending))
+
+    @Slot(str, str)
+    def cloud_failed(self, name, error):
+        print("Point cloud of {} not exported: {}".format(name, error.strip()))
+
+    def closeEvent(self, event):
+        # Let queued shots reach the disk
+        self.saver.shutdown(wait=True)
+        if self.exporter is not None:
+            self.exporter.shutdown(wait=True)
+        if self.capture_process:
+            self.th.stop()
+        else:
+            self.th.close_output()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.close()
+        event.accept()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Azure kinect recorder.')
-    parser.add_argument('--input', type=str, default="camera_stream", help='input path to catch color and depth images,  Default: camera_stream')
+    parser.add_argument('--input', type=str, default="camera_stream", help='input path to catch color and depth images (shared memory name for --transport shm, recorded folder for --transport replay, Unix socket path or [host:]port of the streamer for --transport pubsub),  Default: camera_stream')
+    parser.add_argument('--transport', type=str, default="file", choices=["file", "shm", "pubsub", "replay"], help='read frames from files, from the shared memory ring of the streamer or subscribe to its socket, or replay a folder recorded by the recorders,  Default: file')
+    parser.add_argument('--replay_timing', type=str, default="original", choices=["original", "fixed", "fast"], help='with --transport replay, play the recorded frames at their recorded timestamps, at --replay_fps or as fast as they decode,  Default: original')
+    parser.add_argument('--replay_fps', type=float, default=30.0, help='frame rate of --replay_timing fixed,  Default: 30')
+    parser.add_argument('--replay_loop', action='store_true', help='with --transport replay, start over at the end of the recording')
     parser.add_argument('--output', type=str, default="frames", help='output path to store color/ and depth/ images,  Default: frames')
+    parser.add_argument('--output_volumes', type=str, nargs='+', default=None, help='further disks to spread the shots over, each gets a folder named like the output folder; the manifest stays in the output folder,  Default: output folder only')
+    parser.add_argument('--volume_policy', type=str, default="round-robin", choices=POLICIES, help='volume of each shot: in turn, the one with the most free space, or the one expected to write it first from the measured write rates,  Default: round-robin')
+    parser.add_argument('--min_free_mb', type=int, default=1024, help='free space kept on every volume: full volumes are skipped, shots are refused once all are (0 disables the watchdog),  Default: 1024')
+    parser.add_argument('--save_workers', type=int, default=2, help='number of threads encoding and writing shots,  Default: 2')
+    parser.add_argument('--save_queue', type=int, default=8, help='maximum number of shots waiting to be saved,  Default: 8')
+    parser.add_argument('--preview_fps', type=float, default=15.0, help='maximum preview refresh rate, independent of the capture rate,  Default: 15')
+    parser.add_argument('--preview', type=str, default="color", choices=PREVIEW_MODES, help='preview the color frames, the depth frames coloured from --preview_near_mm to --preview_far_mm, or both side by side, also switchable in the window,  Default: color')
+    parser.add_argument('--preview_near_mm', type=int, default=300, help='depth shown at the start of the colormap, closer is white, no depth black,  Default: 300')
+    parser.add_argument('--preview_far_mm', type=int, default=4000, help='depth shown at the end of the colormap, further is grey,  Default: 4000')
+    parser.add_argument('--depth_window', type=int, default=30, help='number of depth frames the filters run over,  Default: 30')
+    parser.add_argument('--depth_filters', type=str, nargs='+', default=["mean"], choices=["mean", "valid_mean", "median", "robust_mean"], help='temporal depth filters, each written to depth/<filter>_<window>/,  Default: mean')
+    parser.add_argument('--outlier_mm', type=int, default=30, help='distance to the temporal median beyond which robust_mean rejects a sample,  Default: 30')
+    parser.add_argument('--output_format', type=str, default="folder", choices=["folder", "pack", "pack-raw"], help='write shots as files in color/ and depth/, or append them to one container per session with encoded (pack) or raw (pack-raw) frames,  Default: folder')
+    parser.add_argument('--depth_codec', type=str, default="png", choices=["png", "rvl"], help='depth frame format: 16-bit png, or rvl, a faster and smaller lossless depth codec (read with azure_kinect_depth_codec.read_depth),  Default: png')
+    parser.add_argument('--png_level', type=int, default=None, choices=range(10), metavar='[0-9]', help='png compression level of the depth frames,  Default: OpenCV default')
+    parser.add_argument('--cloud_format', type=str, default=None, choices=["ply", "pcd"], help='also export a colored point cloud of every shot to cloud/, built from the first depth filter,  Default: no export')
+    parser.add_argument('--cloud_workers', type=int, default=2, help='number of point cloud export processes,  Default: 2')
+    parser.add_argument('--cloud_voxel', type=float, default=0.0, help='voxel size in meters of the point cloud downsampling, 0 to keep every point,  Default: 0')
+    parser.add_argument('--intrinsics', type=str, default=None, help='color camera intrinsics of the point clouds, JSON of o3d.io.write_pinhole_camera_intrinsic,  Default: nominal intrinsics')
+    parser.add_argument('--depth_trunc', type=float, default=3.0, help='points further than this distance in meters are left out of the point clouds,  Default: 3')
+    parser.add_argument('--pre_frames', type=int, default=1, help='frames kept from the moment a shot is requested, saved with --burst,  Default: 1')
+    parser.add_argument('--post_frames', type=int, default=0, help='frames captured after a shot is requested before it is written, saved too with --burst,  Default: 0')
+    parser.add_argument('--burst', action='store_true', help='also save the color and raw depth of all pre and post trigger frames of a shot, as <shot>_b<index>')
+    parser.add_argument('--metrics_overlay', action='store_true', help='show the stage latencies, frame rate, drops and queue depths over the preview (View menu)')
+    parser.add_argument('--metrics_file', type=str, default=None, help='write the metrics in Prometheus text format to this file every --metrics_interval seconds,  Default: no file')
+    parser.add_argument('--metrics_port', type=int, default=None, help='serve the metrics in Prometheus text format on http://127.0.0.1:<port>/metrics,  Default: no server')
+    parser.add_argument('--metrics_interval', type=float, default=5.0, help='seconds between two writes of --metrics_file,  Default: 5')
+    parser.add_argument('--capture_process', action='store_true', help='capture, filter and save in a separate process, the GUI process only renders the preview')
     args = parser.parse_args()
+    if not 0 <= args.preview_near_mm < args.preview_far_mm <= 65535:
+        parser.error('--preview_near_mm must be below --preview_far_mm, both within 0-65535')
 
+    replay = {"timing": args.replay_timing, "fps": args.replay_fps, "loop": args.replay_loop}
     app = QApplication()
-    w = Window(args.input, args.output)
+    w = Window(RecorderSettings.from_args(args, replay_options=replay, preview_mode=args.preview))
     w.show()
     sys.exit(app.exec())
\ No newline at end of file
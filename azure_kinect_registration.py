@@ -0,0 +1,110 @@
+import numpy as np
+import cv2
+from azure_kinect_calibration import nominal_calibration
+
+
+def distort(x, y, coefficients):
+    # OpenCV distortion model (k1, k2, p1, p2[, k3[, k4, k5, k6]]) of normalised coordinates
+    k1, k2, p1, p2, k3, k4, k5, k6 = (list(coefficients) + [0.0] * 8)[:8]
+    r2 = x * x + y * y
+    radial = (1 + r2 * (k1 + r2 * (k2 + r2 * k3))) / (1 + r2 * (k4 + r2 * (k5 + r2 * k6)))
+    xy = x * y
+    return (x * radial + 2 * p1 * xy + p2 * (r2 + 2 * x * x),
+            y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * xy)
+
+
+class DepthRegistration:
+    """Registers native depth frames to the color camera, vectorised.
+
+    Every valid depth pixel is back-projected along its (undistorted) ray,
+    moved to the color camera by the extrinsics and projected, in numpy:
+    the Python binding of cv2.projectPoints always computes the Jacobian,
+    ten times the cost of the projection. Points land on a grid of k x k
+    color pixels, k being about the number of color pixels per depth pixel,
+    so the frame is covered without the holes of a per-pixel splat; the
+    nearest point wins each cell (z-buffer), cells left empty take their
+    nearest neighbour and the grid is replicated to the color resolution. The result has the
+    resolution and meaning of the sensor's aligned depth (mm along the color
+    camera axis, 0 for no data), its detail is that of the depth camera.
+
+    The rays and projection parameters depend only on the frame sizes and
+    are computed once per resolution.
+    """
+
+    def __init__(self, calibration=None):
+        # None: nominal calibration of the frame sizes, see azure_kinect_calibration
+        self.calibration = calibration
+        self.setups = {}
+
+    def setup(self, depth_shape, color_size):
+        key = (depth_shape, color_size)
+        if key not in self.setups:
+            depth_size = (depth_shape[1], depth_shape[0])
+            if self.calibration is None:
+                calibration = nominal_calibration(depth_size, color_size)
+            else:
+                calibration = self.calibration.scaled(depth_size, color_size)
+            self.setups[key] = self._setup(calibration, depth_shape, color_size)
+        return self.setups[key]
+
+    @staticmethod
+    def _setup(calibration, depth_shape, color_size):
+        depth, color = calibration.depth, calibration.color
+        # Normalised rays of the depth pixels, x/z and y/z
+        v, u = np.indices(depth_shape, dtype=np.float32)
+        pixels = np.stack([u.ravel(), v.ravel()], axis=1).reshape(-1, 1, 2)
+        depth_matrix = np.array([[depth.fx, 0, depth.cx], [0, depth.fy, depth.cy], [0, 0, 1]], dtype=np.float64)
+        distortion = np.array(calibration.depth_distortion, dtype=np.float64) if calibration.depth_distortion else None
+        rays = cv2.undistortPoints(pixels, depth_matrix, distortion).reshape(-1, 2)
+        # Cell size: color pixels per depth pixel at the center of the frame
+        k = max(1, int(color.fx / depth.fx))
+        grid_size = (-(-color_size[0] // k), -(-color_size[1] // k))
+        # Cell i covers color pixels [i * k, i * k + k)
+        return {"ray_x": np.ascontiguousarray(rays[:, 0]),
+                "ray_y": np.ascontiguousarray(rays[:, 1]),
+                "k": k,
+                "grid_size": grid_size,
+                # Projection on the grid of cells
+                "fx": np.float32(color.fx / k), "fy": np.float32(color.fy / k),
+                "cx": np.float32((color.cx - (k - 1) / 2.0) / k), "cy": np.float32((color.cy - (k - 1) / 2.0) / k),
+                "color_distortion": list(calibration.color_distortion),
+                # Rows of [rotation | translation], applied to [x, y, z, 1]
+                "extrinsics": np.array([list(calibration.rotation[3 * i:3 * i + 3]) + [calibration.translation[i]]
+                                        for i in range(3)], dtype=np.float32).T}
+
+    def register(self, depth, color_size):
+        """Depth frame registered to a color frame of color_size (width, height)."""
+        setup = self.setup(depth.shape, tuple(color_size))
+        grid_width, grid_height = setup["grid_size"]
+        flat = depth.ravel()
+        valid = np.flatnonzero(flat)
+        grid = np.full(grid_width * grid_height, 65535, dtype=np.uint16)
+        if valid.size:
+            z = flat[valid].astype(np.float32)
+            points = np.empty((valid.size, 4), dtype=np.float32)
+            np.multiply(setup["ray_x"][valid], z, out=points[:, 0])
+            np.multiply(setup["ray_y"][valid], z, out=points[:, 1])
+            points[:, 2] = z
+            points[:, 3] = 1.0
+            moved = points @ setup["extrinsics"]
+            z_color = moved[:, 2]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x = moved[:, 0] / z_color
+                y = moved[:, 1] / z_color
+            if setup["color_distortion"]:
+                x, y = distort(x, y, setup["color_distortion"])
+            u = np.floor(x * setup["fx"] + (setup["cx"] + 0.5))
+            v = np.floor(y * setup["fy"] + (setup["cy"] + 0.5))
+            inside = (u >= 0) & (u < grid_width) & (v >= 0) & (v < grid_height) & (z_color >= 1.0)
+            cells = v[inside].astype(np.int64) * grid_width + u[inside].astype(np.int64)
+            np.minimum.at(grid, cells, np.minimum(z_color[inside] + 0.5, 65534.0).astype(np.uint16))
+        grid = grid.reshape(grid_height, grid_width)
+        # Empty cells between projected points take the nearest surface around them
+        nearest = cv2.erode(grid, np.ones((3, 3), np.uint8))
+        empty = grid == 65535
+        grid[empty] = nearest[empty]
+        grid[grid == 65535] = 0
+        k = setup["k"]
+        if k > 1:
+            grid = cv2.resize(grid, (grid_width * k, grid_height * k), interpolation=cv2.INTER_NEAREST)
+        return np.ascontiguousarray(grid[:color_size[1], :color_size[0]])
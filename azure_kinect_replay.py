@@ -0,0 +1,212 @@
+import os
+import time
+import argparse
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from azure_kinect_depth_codec import EXTENSIONS, read_depth
+from azure_kinect_manifest import load_manifest, load_volumes, record_root
+from azure_kinect_mock import MockRGBDImage
+
+
+ORIGINAL, FIXED, FAST = "original", "fixed", "fast"
+TIMINGS = (ORIGINAL, FIXED, FAST)
+
+
+def list_frames(folder):
+    """(timestamp_usec, color_path, depth_path, device) of every frame of a
+    recorded folder, in capture order.
+
+    Folders written by save_frames are read from their manifest (shots and
+    burst frames, with their capture timestamps, packed shots are skipped);
+    older folders and record/<session> folders (depth/ instead of
+    depth/raw/) are listed, the file modification time standing in for the
+    capture time. Folders striped over several volumes are read from all of them.
+    """
+    frames = []
+    roots = load_volumes(folder)
+    for record in load_manifest(folder):
+        files = record.get("files") or {}
+        if "color" in files and "depth/raw" in files:
+            root = record_root(roots, record)
+            color_path = os.path.join(root, files["color"])
+            timestamp_usec = record.get("timestamp_usec")
+            if timestamp_usec is None:
+                timestamp_usec = os.stat(color_path).st_mtime_ns // 1000
+            frames.append((timestamp_usec, color_path, os.path.join(root, files["depth/raw"]), record.get("device")))
+    if frames:
+        # Saved by a pool, records may be slightly out of order
+        frames.sort(key=lambda frame: frame[0])
+        return frames
+    for root in roots:
+        depth_dir = os.path.join(root, "depth", "raw")
+        if not os.path.isdir(depth_dir):
+            depth_dir = os.path.join(root, "depth")
+        depth_files = {}
+        if os.path.isdir(depth_dir):
+            for name in os.listdir(depth_dir):
+                stem, extension = os.path.splitext(name)
+                if extension in EXTENSIONS:
+                    depth_files[stem] = os.path.join(depth_dir, name)
+        color_dir = os.path.join(root, "color")
+        if os.path.isdir(color_dir):
+            with os.scandir(color_dir) as entries:
+                for entry in entries:
+                    stem = os.path.splitext(entry.name)[0]
+                    if entry.is_file() and stem in depth_files:
+                        frames.append((entry.stat().st_mtime_ns // 1000, entry.path, depth_files[stem], None))
+    frames.sort(key=lambda frame: (frame[0], frame[1]))
+    return frames
+
+
+def decode_frame(color_path, depth_path, rgb=False):
+    color_frame = cv2.imread(color_path, cv2.IMREAD_COLOR)
+    if color_frame is None:
+        raise OSError("Unable to read " + color_path)
+    if rgb:
+        color_frame = cv2.cvtColor(color_frame, cv2.COLOR_BGR2RGB)
+    return color_frame, read_depth(depth_path)
+
+
+class ReplaySource:
+    """Plays a recorded folder back in place of a sensor or a streamer.
+
+    Usable as the sensor of azure_kinect_recorder (capture_frame) and as the
+    frame source of azure_kinect_recorder_v2 and the synchronized recorder
+    (read_frame). Frames are delivered at their original timing, at a fixed
+    rate or as fast as they can be decoded. Decoding runs ahead of playback
+    in a small thread pool (cv2 releases the GIL), `prefetch` frames deep, so
+    the capture loop only waits for the frames to be due.
+    Color frames are BGR like the streamer's, or RGB like the sensor's.
+    """
+
+    def __init__(self, folder, timing=ORIGINAL, fps=30.0, loop=False, prefetch=8, workers=2, rgb=False):
+        if timing not in TIMINGS:
+            raise ValueError("Unknown replay timing '{}', choose from {}".format(timing, ", ".join(TIMINGS)))
+        self.folder = folder
+        self.timing = timing
+        self.interval = 1.0 / fps if fps and fps > 0 else 0.0
+        self.loop = loop
+        self.prefetch = max(1, prefetch)
+        self.rgb = rgb
+        self.frames = list_frames(folder)
+        if not self.frames:
+            raise RuntimeError("No frames to replay in '{}'".format(folder))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay")
+        self.queue = collections.deque()
+        self.next_index = 0
+        self.sequence = 0
+        self.pending = None
+        self.start_time = None
+        self.first_timestamp = None
+        # Timestamps keep increasing when the folder loops, by the recorded
+        # span plus one mean frame interval per pass
+        span = self.frames[-1][0] - self.frames[0][0]
+        self.period_usec = span + (span // (len(self.frames) - 1) if len(self.frames) > 1 else int(self.interval * 1e6))
+        self.offset_usec = 0
+        self.dropped = 0
+        self.device = None
+        self.finished = False
+        print("Replaying {} frames of '{}' ({} timing)".format(len(self.frames), folder, timing))
+
+    def _fill(self):
+        while len(self.queue) < self.prefetch:
+            if self.next_index >= len(self.frames):
+                if not self.loop:
+                    return
+                self.offset_usec += self.period_usec
+                self.next_index = 0
+            timestamp_usec, color_path, depth_path, device = self.frames[self.next_index]
+            future = self.executor.submit(decode_frame, color_path, depth_path, self.rgb)
+            self.queue.append((timestamp_usec, device, self.offset_usec, future))
+            self.next_index += 1
+
+    def _next(self):
+        # Next decoded frame, its due time and timestamp; None at the end
+        if self.pending is None:
+            self._fill()
+            if not self.queue:
+                return None
+            timestamp_usec, device, offset_usec, future = self.queue.popleft()
+            self._fill()
+            color_frame, depth_frame = future.result()
+            now = time.monotonic()
+            if self.start_time is None:
+                self.start_time = now
+                self.first_timestamp = timestamp_usec
+            self.sequence += 1
+            if self.timing == FIXED:
+                due = self.start_time + (self.sequence - 1) * self.interval
+                timestamp_usec = self.first_timestamp + int((self.sequence - 1) * self.interval * 1e6)
+            else:
+                timestamp_usec += offset_usec
+                due = self.start_time + (timestamp_usec - self.first_timestamp) / 1e6
+            if self.timing == FAST:
+                due = now
+            self.pending = (due, self.sequence, timestamp_usec, color_frame, depth_frame, device)
+        return self.pending
+
+    def read_frame(self, timeout=0.1):
+        """Return (sequence, timestamp_usec, color, depth) once the next frame is due, or None."""
+        try:
+            pending = self._next()
+        except (OSError, ValueError) as e:
+            print("Unable to replay frame: {}".format(e))
+            self.dropped += 1
+            self.pending = None
+            return None
+        if pending is None:
+            if not self.finished:
+                self.finished = True
+                print("Replay of '{}' finished".format(self.folder))
+            time.sleep(timeout)
+            return None
+        due, sequence, timestamp_usec, color_frame, depth_frame, device = pending
+        wait = due - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return None
+        if wait > 0:
+            time.sleep(wait)
+        self.pending = None
+        self.device = device
+        return sequence, timestamp_usec, color_frame, depth_frame
+
+    # open3d.io.AzureKinectSensor interface, see MockAzureKinectSensor
+    def connect(self, device):
+        return True
+
+    def disconnect(self):
+        self.close()
+
+    def capture_frame(self, align_depth_to_color):
+        # Recorded depth is already registered to color
+        frame = self.read_frame(timeout=0.1)
+        if frame is None:
+            return None
+        return MockRGBDImage(frame[2], frame[3])
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.queue.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay a recorded folder and report the delivered frame rate.')
+    parser.add_argument('folder', type=str, help='folder written by the recorders (color/, depth/raw/) or a record/<session> folder')
+    parser.add_argument('--timing', type=str, default=FAST, choices=TIMINGS, help='replay at the recorded timestamps, at --fps or as fast as possible,  Default: fast')
+    parser.add_argument('--fps', type=float, default=30.0, help='frame rate of --timing fixed,  Default: 30')
+    parser.add_argument('--prefetch', type=int, default=8, help='frames decoded ahead of playback,  Default: 8')
+    parser.add_argument('--workers', type=int, default=2, help='decoder threads,  Default: 2')
+    args = parser.parse_args()
+
+    source = ReplaySource(args.folder, args.timing, args.fps, prefetch=args.prefetch, workers=args.workers)
+    start = end = time.perf_counter()
+    count = 0
+    while not source.finished:
+        if source.read_frame() is not None:
+            count += 1
+            end = time.perf_counter()
+    elapsed = end - start
+    source.close()
+    print("{} frames in {:.2f} s, {:.1f} fps".format(count, elapsed, count / elapsed if elapsed > 0 else 0.0))
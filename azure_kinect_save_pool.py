@@ -0,0 +1,81 @@
+import time
+import threading
+import traceback
+from azure_kinect_depth_codec import PngCodec
+from azure_kinect_pack import ENCODED, encode_blob, shot_streams
+from concurrent.futures import ThreadPoolExecutor
+from PySide6.QtCore import QObject, Signal
+
+
+def write_shot(output_dir, name, color_frame, depth_raw, depth_filtered, depth_codec=None, stages=None):
+    # Layout created by CameraRGBD.set_output_dir, depth_filtered maps the
+    # depth/ subfolder of each filter (e.g. mean_30) to its output. Encoded
+    # first, then written, so `stages` (CameraMetrics) can time both apart.
+    # Returns the number of bytes written
+    depth_codec = depth_codec or PngCodec()
+    start = time.perf_counter()
+    blobs = [(stream, encode_blob(stream, frame, ENCODED, depth_codec))
+             for stream, frame in shot_streams(color_frame, depth_raw, depth_filtered)]
+    encoded = time.perf_counter()
+    for stream, blob in blobs:
+        extension = ".jpg" if stream == "color" else depth_codec.extension
+        with open(output_dir + "/" + stream + "/" + name + extension, "wb") as f:
+            f.write(blob)
+    if stages is not None:
+        stages.observe("encode", encoded - start)
+        stages.observe("write", time.perf_counter() - encoded)
+    return sum(len(blob) for _, blob in blobs)
+
+
+class SavePool(QObject):
+    """Bounded pool of writer threads running save jobs off the GUI thread.
+
+    cv2 releases the GIL while encoding and writing, so a few threads are
+    enough to keep the GUI and the capture thread responsive.
+    """
+    saved = Signal(str)
+    failed = Signal(str, str)
+    backlogChanged = Signal(int)
+
+    def __init__(self, max_workers=2, max_pending=8, parent=None):
+        QObject.__init__(self, parent)
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="save")
+
+    def backlog(self):
+        return self.pending
+
+    def submit(self, name, job, *args):
+        """Queue job(*args) under the shot `name`, False if the backlog is full.
+
+        A job returning False is neither saved nor failed.
+        """
+        with self.lock:
+            if self.pending >= self.max_pending:
+                return False
+            self.pending += 1
+            pending = self.pending
+        self.backlogChanged.emit(pending)
+        self.executor.submit(self._run, name, job, args)
+        return True
+
+    def _run(self, name, job, args):
+        try:
+            done = job(*args)
+        except Exception:
+            traceback.print_exc()
+            self.failed.emit(name, traceback.format_exc(limit=1))
+        else:
+            # False: the job gave up on the shot and reported why itself
+            if done is not False:
+                self.saved.emit(name)
+        finally:
+            with self.lock:
+                self.pending -= 1
+                pending = self.pending
+            self.backlogChanged.emit(pending)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
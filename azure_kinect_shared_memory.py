@@ -0,0 +1,217 @@
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+
+# Layout of the shared memory segment:
+#   header      HEADER_FIELDS x int64
+#   slot table  slots x (sequence, timestamp_usec) int64
+#   color ring  slots x color frame (uint8)
+#   depth ring  slots x depth frame (uint16)
+# A slot sequence of 0 means "empty", -1 means "being written".
+MAGIC = 0x4B494E52  # "KINR"
+HEADER_FIELDS = 9
+HEADER_MAGIC, HEADER_SLOTS, HEADER_COLOR_H, HEADER_COLOR_W, HEADER_COLOR_C, \
+    HEADER_DEPTH_H, HEADER_DEPTH_W, HEADER_LAST_SEQUENCE, HEADER_PID = range(HEADER_FIELDS)
+WRITING = -1
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, owned by another user
+        return True
+    return True
+
+
+class SharedFrameRing:
+    """Fixed-slot ring of color/depth frames living in shared memory.
+
+    One writer (the streamer) creates the ring, any number of readers attach
+    to it by name and get the frames without encoding or copying through disk.
+    """
+
+    def __init__(self, name, color_shape=None, depth_shape=None, slots=4, create=False, unregister=True):
+        self.name = name
+        self.create = create
+        if create:
+            if color_shape is None or depth_shape is None:
+                raise ValueError("color_shape and depth_shape are required to create a ring")
+            size = self._segment_size(slots, color_shape, depth_shape)
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                self._unlink_stale(name)
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self._map(slots, color_shape, depth_shape)
+            self.header[:] = 0
+            self.slot_table[:] = 0
+            self.header[HEADER_PID] = os.getpid()
+            self.header[HEADER_SLOTS] = slots
+            self.header[HEADER_COLOR_H:HEADER_COLOR_C + 1] = color_shape
+            self.header[HEADER_DEPTH_H:HEADER_DEPTH_W + 1] = depth_shape
+            self.header[HEADER_MAGIC] = MAGIC
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # Readers must not unlink the segment of the streamer on exit
+            # (the resource tracker does that for every attached segment
+            # before Python 3.13). Not when the writer is a child process
+            # sharing our resource tracker, its registration is the only one
+            if unregister:
+                try:
+                    resource_tracker.unregister(self.shm._name, "shared_memory")
+                except Exception:
+                    pass
+            header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+            if header[HEADER_MAGIC] != MAGIC:
+                self.shm.close()
+                raise RuntimeError("Shared memory '{}' is not a frame ring".format(name))
+            slots = int(header[HEADER_SLOTS])
+            color_shape = tuple(int(v) for v in header[HEADER_COLOR_H:HEADER_COLOR_C + 1])
+            depth_shape = tuple(int(v) for v in header[HEADER_DEPTH_H:HEADER_DEPTH_W + 1])
+            del header
+            self._map(slots, color_shape, depth_shape)
+
+    @staticmethod
+    def _unlink_stale(name):
+        # Only a segment whose writer is gone (crashed streamer) is replaced,
+        # unlinking a live one would silently detach its readers
+        existing = shared_memory.SharedMemory(name=name)
+        try:
+            owner = 0
+            if existing.size >= HEADER_FIELDS * 8:
+                header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=existing.buf)
+                if header[HEADER_MAGIC] == MAGIC:
+                    owner = int(header[HEADER_PID])
+                del header
+            if owner and owner != os.getpid() and pid_alive(owner):
+                # Left alone, our resource tracker must not unlink it on exit
+                try:
+                    resource_tracker.unregister(existing._name, "shared_memory")
+                except Exception:
+                    pass
+                raise FileExistsError("Shared memory '{}' is in use by process {}, choose another name".format(name, owner))
+        finally:
+            existing.close()
+        existing.unlink()
+
+    @staticmethod
+    def _segment_size(slots, color_shape, depth_shape):
+        return (HEADER_FIELDS + 2 * slots) * 8 \
+            + slots * int(np.prod(color_shape)) \
+            + slots * int(np.prod(depth_shape)) * 2
+
+    def _map(self, slots, color_shape, depth_shape):
+        self.slots = slots
+        self.color_shape = tuple(color_shape)
+        self.depth_shape = tuple(depth_shape)
+        offset = 0
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += HEADER_FIELDS * 8
+        self.slot_table = np.ndarray((slots, 2), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += slots * 2 * 8
+        self.color = np.ndarray((slots,) + self.color_shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+        offset += self.color[0].nbytes * slots
+        self.depth = np.ndarray((slots,) + self.depth_shape, dtype=np.uint16, buffer=self.shm.buf, offset=offset)
+
+    def write(self, color, depth, timestamp_usec=None):
+        if timestamp_usec is None:
+            timestamp_usec = time.time_ns() // 1000
+        sequence = int(self.header[HEADER_LAST_SEQUENCE]) + 1
+        slot = sequence % self.slots
+        self.slot_table[slot, 0] = WRITING
+        self.color[slot] = color
+        self.depth[slot] = depth
+        self.slot_table[slot, 1] = timestamp_usec
+        self.slot_table[slot, 0] = sequence
+        self.header[HEADER_LAST_SEQUENCE] = sequence
+        return sequence
+
+    def last_sequence(self):
+        return int(self.header[HEADER_LAST_SEQUENCE])
+
+    def is_valid(self, sequence):
+        # True while the slot holding `sequence` has not been overwritten
+        return int(self.slot_table[sequence % self.slots, 0]) == sequence
+
+    def read_latest(self, last_sequence=0, copy=True):
+        """Return (sequence, timestamp_usec, color, depth) of the newest frame
+        or None if there is nothing newer than `last_sequence`.
+
+        With copy=False the arrays are views into the ring, valid only while
+        is_valid(sequence) holds.
+        """
+        sequence = self.last_sequence()
+        if sequence <= last_sequence:
+            return None
+        slot = sequence % self.slots
+        timestamp_usec = int(self.slot_table[slot, 1])
+        if copy:
+            color = self.color[slot].copy()
+            depth = self.depth[slot].copy()
+        else:
+            color = self.color[slot]
+            depth = self.depth[slot]
+        # Writer lapped us while copying, frame is torn
+        if not self.is_valid(sequence):
+            return None
+        return sequence, timestamp_usec, color, depth
+
+    def is_alive(self):
+        return int(self.header[HEADER_MAGIC]) == MAGIC
+
+    def close(self):
+        self.header = self.slot_table = self.color = self.depth = None
+        self.shm.close()
+
+    def unlink(self):
+        # Tell attached readers the segment is gone before unlinking it
+        self.header[HEADER_MAGIC] = 0
+        self.close()
+        self.shm.unlink()
+
+
+class SharedMemoryFrameSource:
+    """Frame source for the recorders reading the ring of AzureKinectStreamer."""
+
+    def __init__(self, name, poll_interval=0.002, unregister=True):
+        self.name = name
+        self.poll_interval = poll_interval
+        self.unregister = unregister
+        self.ring = None
+        self.last_sequence = 0
+        self.dropped = 0
+
+    def read_frame(self, timeout=0.1):
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.ring is None:
+                try:
+                    self.ring = SharedFrameRing(self.name, unregister=self.unregister)
+                except (FileNotFoundError, RuntimeError):
+                    # Streamer is not running (yet)
+                    self.ring = None
+            if self.ring is not None and not self.ring.is_alive():
+                # Streamer was restarted, attach to the new segment
+                self.close()
+                self.last_sequence = 0
+                continue
+            if self.ring is not None:
+                frame = self.ring.read_latest(self.last_sequence)
+                if frame is not None:
+                    if self.last_sequence and frame[0] > self.last_sequence + 1:
+                        self.dropped += frame[0] - self.last_sequence - 1
+                    self.last_sequence = frame[0]
+                    return frame
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
@@ -0,0 +1,82 @@
+import os
+import json
+import cv2
+from azure_kinect_depth_codec import PngCodec
+
+
+# Files of the streaming directory written by AzureKinectStreamer:
+#   color_<slot>.jpg, depth_<slot>.png  frame pair of generation `slot`
+#                                       (depth_<slot>.rvl with the rvl codec)
+#   frame.json                          metadata of the last complete pair
+#   color.jpg, depth.png                legacy names, links to the last pair (png only)
+METADATA_NAME = "frame.json"
+LEGACY_COLOR_NAME = "color.jpg"
+LEGACY_DEPTH_NAME = "depth.png"
+# With one slot a pair would be rewritten while it is read, readers reject it
+MIN_SLOTS = 2
+
+
+def slot_names(slot, depth_extension=".png"):
+    return "color_{}.jpg".format(slot), "depth_{}{}".format(slot, depth_extension)
+
+
+def _replace(tmp_path, path):
+    # os.replace is atomic on POSIX and NTFS: readers see the old or the new file
+    os.replace(tmp_path, path)
+
+
+def _link(src, path):
+    tmp_path = path + ".tmp"
+    try:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        os.link(src, tmp_path)
+        _replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+def publish_pair(output, sequence, slots, color_frame, depth_frame, timestamp_usec, device, depth_codec=None):
+    """Write one color/depth pair so that no reader sees a torn or mixed pair.
+
+    The pair goes to slot `sequence % slots` through temp files and renames,
+    then frame.json is atomically replaced to point at it. A reader has
+    slots - 1 frame periods to load a pair before its slot is reused.
+    """
+    if slots < MIN_SLOTS:
+        raise ValueError("At least {} file slots are needed, got {}".format(MIN_SLOTS, slots))
+    depth_codec = depth_codec or PngCodec()
+    slot = sequence % slots
+    color_name, depth_name = slot_names(slot, depth_codec.extension)
+    for name, frame in ((color_name, color_frame), (depth_name, depth_frame)):
+        path = os.path.join(output, name)
+        base, ext = os.path.splitext(path)
+        tmp_path = base + ".tmp" + ext
+        if frame is depth_frame:
+            depth_codec.write(tmp_path, frame)
+        elif not cv2.imwrite(tmp_path, frame):
+            raise RuntimeError("Unable to write " + tmp_path)
+        _replace(tmp_path, path)
+    metadata = {"sequence": sequence,
+                "timestamp_usec": timestamp_usec,
+                "device": device,
+                "slots": slots,
+                "color": color_name,
+                "depth": depth_name}
+    metadata_path = os.path.join(output, METADATA_NAME)
+    with open(metadata_path + ".tmp", "w") as f:
+        json.dump(metadata, f)
+    _replace(metadata_path + ".tmp", metadata_path)
+    # Old consumers keep reading color.jpg/depth.png
+    _link(os.path.join(output, color_name), os.path.join(output, LEGACY_COLOR_NAME))
+    if depth_codec.extension == PngCodec.extension:
+        _link(os.path.join(output, depth_name), os.path.join(output, LEGACY_DEPTH_NAME))
+    return metadata
+
+
+def read_metadata(input):
+    try:
+        with open(os.path.join(input, METADATA_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -1,26 +1,53 @@
-import open3d as o3d
 import argparse
 import cv2
 import os
+import time
 import numpy as np
+from azure_kinect_shared_memory import SharedFrameRing
+from azure_kinect_pubsub import FramePublisher
+from azure_kinect_stream_files import MIN_SLOTS, publish_pair
+from azure_kinect_depth_codec import make_codec
+from azure_kinect_mock import MockAzureKinectSensor
 
 class AzureKinectStreamer:
     
-    def __init__(self, device = 0, config_json = None, output = "camera_stream"):
+    def __init__(self, device = 0, config_json = None, output = "camera_stream", transport = "file", shm_slots = 4, file_slots = 3, mock = False, depth_codec = "png", png_level = None,
+                 pubsub_encoding = "raw", pubsub_queue = 2):
         if device < 0 or device > 255:
             print('Unsupported device id, fall back to 0')
             device = 0
+        if file_slots < MIN_SLOTS:
+            raise ValueError("file_slots must be at least {}, got {}".format(MIN_SLOTS, file_slots))
         self.device = device
-        if config_json is not None:
-            config = o3d.io.read_azure_kinect_sensor_config(config_json)
+        if mock:
+            self.sensor = MockAzureKinectSensor(config_json)
         else:
-            config = o3d.io.AzureKinectSensorConfig()
-        self.sensor = o3d.io.AzureKinectSensor(config)
+            # Imported here, --mock runs without Open3D
+            import open3d as o3d
+            if config_json is not None:
+                config = o3d.io.read_azure_kinect_sensor_config(config_json)
+            else:
+                config = o3d.io.AzureKinectSensorConfig()
+            self.sensor = o3d.io.AzureKinectSensor(config)
         if not self.sensor.connect(device):
             raise RuntimeError('Failed to connect to sensor')
         self.output = output
         if self.output is None:
             self.output = "camera_stream"
+        self.transport = transport
+        self.shm_slots = shm_slots
+        self.file_slots = file_slots
+        self.depth_codec = make_codec(depth_codec, png_level)
+        self.ring = None
+        self.publisher = None
+        self.sequence = 0
+        if self.transport == "shm":
+            # Output is the name of the shared memory ring, created on the first frame
+            return
+        if self.transport == "pubsub":
+            # Output is the Unix socket path or [host:]port subscribers connect to
+            self.publisher = FramePublisher(self.output, pubsub_encoding, self.depth_codec, pubsub_queue)
+            return
         if (os.path.isdir(self.output)):
             print('Output stream-directory \'{}\' already existing, continue streaming there'.format(self.output))
         else:
@@ -29,33 +56,76 @@ class AzureKinectStreamer:
             except (PermissionError, FileExistsError):
                 print("Unable to mkdir: " + self.output)
     
+    def publish_files(self, color_frame, depth_frame, timestamp_usec):
+        publish_pair(self.output, self.sequence, self.file_slots, color_frame, depth_frame,
+                     timestamp_usec, self.device, self.depth_codec)
+
+    def publish_shm(self, color_frame, depth_frame, timestamp_usec):
+        if self.ring is None:
+            self.ring = SharedFrameRing(self.output, color_frame.shape, depth_frame.shape,
+                                        slots=self.shm_slots, create=True)
+            print('Streaming to shared memory \'{}\' ({} slots)'.format(self.output, self.shm_slots))
+        self.ring.write(color_frame, depth_frame, timestamp_usec)
+
     def run(self):
-         while True: 
-            rgbd = self.sensor.capture_frame(True)
-            if rgbd is None:
-                continue
-            color_frame = np.asarray(rgbd.color)
-            depth_frame = np.asarray(rgbd.depth)
-            key = cv2.waitKey(30)
-            if key == 27: # pushed Esc
-                break
-            else:
-                cv2.imwrite(self.output + "/" + "color.jpg", color_frame)
-                cv2.imwrite(self.output + "/" + "depth.png", depth_frame)
+        try:
+            while True: 
+                rgbd = self.sensor.capture_frame(True)
+                if rgbd is None:
+                    continue
+                # Open3D doesn't expose the device timestamp, use the host clock at capture
+                timestamp_usec = time.time_ns() // 1000
+                self.sequence += 1
+                color_frame = np.asarray(rgbd.color)
+                depth_frame = np.asarray(rgbd.depth)
+                if self.transport in ("shm", "pubsub"):
+                    # The sensor delivers RGB, ring readers and subscribers expect
+                    # BGR like the files (written by imwrite, read back by PIL)
+                    color_frame = cv2.cvtColor(color_frame, cv2.COLOR_RGB2BGR)
+                key = cv2.waitKey(30)
+                if key == 27: # pushed Esc
+                    break
+                elif self.transport == "shm":
+                    self.publish_shm(color_frame, depth_frame, timestamp_usec)
+                elif self.transport == "pubsub":
+                    self.publisher.publish(self.sequence, timestamp_usec, self.device, color_frame, depth_frame)
+                else:
+                    self.publish_files(color_frame, depth_frame, timestamp_usec)
+        finally:
+            if self.ring is not None:
+                self.ring.unlink()
+                self.ring = None
+            if self.publisher is not None:
+                self.publisher.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Azure kinect recorder.')
     parser.add_argument('--config', type=str, help='input json kinect config')
     parser.add_argument('--list', action='store_true', help='list available azure kinect sensors')
     parser.add_argument('--device', type=int, default=0, help='input kinect device id')
-    parser.add_argument('--output', type=str, default="camera_stream", help='output path to stream color and depth images,  Default: camera_stream')
+    parser.add_argument('--output', type=str, default="camera_stream", help='output path to stream color and depth images (shared memory name for --transport shm, Unix socket path or [host:]port for --transport pubsub),  Default: camera_stream')
+    parser.add_argument('--transport', type=str, default="file", choices=["file", "shm", "pubsub"], help='publish frames as files, into a shared memory ring or to the subscribers of a socket,  Default: file')
+    parser.add_argument('--pubsub_encoding', type=str, default="raw", choices=["raw", "compressed"], help='frames sent to subscribers as arrays, or as jpg color and --depth_codec depth (for subscribers on other machines),  Default: raw')
+    parser.add_argument('--pubsub_queue', type=int, default=2, help='frames queued per subscriber before its oldest ones are dropped,  Default: 2')
+    parser.add_argument('--shm_slots', type=int, default=4, help='number of frames kept in the shared memory ring,  Default: 4')
+    parser.add_argument('--mock', action='store_true', help='use a synthetic sensor producing frames of the --config resolution and rate')
+    parser.add_argument('--file_slots', type=int, default=3, help='number of frame pairs kept in the stream-directory before reusing files, at least 2,  Default: 3')
+    parser.add_argument('--depth_codec', type=str, default="png", choices=["png", "rvl"], help='depth frame format: 16-bit png, or rvl, a faster and smaller lossless depth codec (read with azure_kinect_depth_codec.read_depth),  Default: png')
+    parser.add_argument('--png_level', type=int, default=None, choices=range(10), metavar='[0-9]', help='png compression level of the depth frames,  Default: OpenCV default')
     args = parser.parse_args()
+    if args.file_slots < MIN_SLOTS:
+        parser.error('--file_slots must be at least {}'.format(MIN_SLOTS))
 
     if args.list:
+        import open3d as o3d
         o3d.io.AzureKinectSensor.list_devices()
         exit()
 
-    azure_kinect_streamer = AzureKinectStreamer(device=args.device, config_json=args.config, output=args.output)
+    azure_kinect_streamer = AzureKinectStreamer(device=args.device, config_json=args.config, output=args.output,
+                                                transport=args.transport, shm_slots=args.shm_slots,
+                                                file_slots=args.file_slots, mock=args.mock,
+                                                depth_codec=args.depth_codec, png_level=args.png_level,
+                                                pubsub_encoding=args.pubsub_encoding, pubsub_queue=args.pubsub_queue)
     azure_kinect_streamer.run()
     
     
\ No newline at end of file
@@ -0,0 +1,25 @@
+def match_frames(histories, tolerance_usec):
+    """Pick one entry per history so that all timestamps lie within tolerance.
+
+    The newest frame of the first (master) history that has a match on every
+    other device wins. Returns (entries, spread_usec), entries being None when
+    no matching set exists; spread_usec is then the smallest spread found.
+    A history is a FrameRing or a list of entries starting with the timestamp,
+    e.g. the frames of a completed trigger or the (timestamp, sequence) pairs
+    of a capture process.
+    """
+    snapshots = [history.items() if hasattr(history, "items") else list(history) for history in histories]
+    if any(not entries for entries in snapshots):
+        return None, None
+    best_spread = None
+    for reference in reversed(snapshots[0]):
+        chosen = [reference]
+        for entries in snapshots[1:]:
+            chosen.append(min(entries, key=lambda entry: abs(entry[0] - reference[0])))
+        timestamps = [entry[0] for entry in chosen]
+        spread = max(timestamps) - min(timestamps)
+        if spread <= tolerance_usec:
+            return chosen, spread
+        if best_spread is None or spread < best_spread:
+            best_spread = spread
+    return None, best_spread
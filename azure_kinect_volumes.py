@@ -0,0 +1,173 @@
+import os
+import time
+import errno
+import shutil
+import threading
+import contextlib
+from azure_kinect_manifest import save_volumes
+
+
+ROUND_ROBIN, FREE_SPACE, THROUGHPUT = "round-robin", "free-space", "throughput"
+POLICIES = (ROUND_ROBIN, FREE_SPACE, THROUGHPUT)
+# Weight of the last write in the measured write rate and shot size
+SMOOTHING = 0.2
+
+
+class VolumeFullError(OSError):
+    pass
+
+
+def free_space(path):
+    # Of the file system path will be created on
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+
+def volume_roots(output_dir, volumes=None):
+    """output_dir followed by its counterparts <volume>/<name of output_dir>
+    on the other volumes, so each device of a rig keeps its own folder."""
+    name = os.path.basename(os.path.normpath(output_dir))
+    return [output_dir] + [os.path.join(volume, name) for volume in volumes or ()]
+
+
+class VolumeWrite:
+    # One write in flight on a volume, see VolumeSet.write
+    def __init__(self, index, root):
+        self.index = index
+        self.root = root
+        # Set by the writer, bytes written
+        self.size = 0
+
+
+class VolumeSet:
+    """Output folders of a recorder spread over several disks.
+
+    Every write goes to the folder chosen by the policy: in turn
+    (round-robin), the one with the most free space (free-space), or the one
+    expected to finish it first from the write rate measured on each volume
+    and the bytes already in flight there (throughput). A watchdog thread
+    reads the free space every `check_interval` seconds, written bytes are
+    subtracted in between; a volume with less than `reserve_mb` left is
+    skipped, and once all are, writes fail with VolumeFullError before
+    anything is written instead of filling the disk. reserve_mb 0 turns the
+    watchdog off.
+    """
+
+    def __init__(self, roots, policy=ROUND_ROBIN, reserve_mb=1024, check_interval=2.0):
+        if policy not in POLICIES:
+            raise ValueError("Unknown volume policy '{}', choose from {}".format(policy, ", ".join(POLICIES)))
+        self.roots = list(roots)
+        self.policy = policy
+        self.reserve = int(reserve_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        count = len(self.roots)
+        self.free = [0] * count
+        self.in_flight = [0] * count
+        self.written = [0] * count
+        # Bytes per second, None until a write completes
+        self.rate = [None] * count
+        self.full = [False] * count
+        # Expected size of the next write
+        self.write_size = 0
+        self.next_index = 0
+        self.paused = False
+        self.check()
+        self.stop_event = threading.Event()
+        self.thread = None
+        if check_interval > 0 and self.reserve > 0:
+            self.thread = threading.Thread(target=self._watch, args=(check_interval,), name="volume-watchdog", daemon=True)
+            self.thread.start()
+
+    def make_dirs(self, subdirs):
+        # Same layout in every folder, and the volume list next to the manifest
+        for root in self.roots:
+            for subdir in subdirs:
+                os.makedirs(os.path.join(root, subdir), exist_ok=True)
+        if len(self.roots) > 1:
+            save_volumes(self.roots[0], self.roots)
+
+    def _watch(self, interval):
+        while not self.stop_event.wait(interval):
+            self.check()
+
+    def check(self):
+        """Read the free space of every volume, report the ones filling up."""
+        for i, root in enumerate(self.roots):
+            try:
+                free = free_space(root)
+            except OSError:
+                # Unreachable network share
+                free = 0
+            with self.lock:
+                self.free[i] = free
+                full = self.reserve > 0 and free - self.in_flight[i] < self.reserve
+                changed, self.full[i] = full != self.full[i], full
+            if changed and full:
+                print("Output volume '{}' is full ({} MB left), writing to the others".format(root, free // 2 ** 20))
+            elif changed:
+                print("Output volume '{}' has free space again".format(root))
+        with self.lock:
+            paused, self.paused = self.paused, all(self.full)
+        if self.paused and not paused:
+            print("All output volumes are full, writes are paused")
+        elif paused and not self.paused:
+            print("Writes resumed")
+
+    def _reserve(self):
+        with self.lock:
+            size = self.write_size
+            candidates = [i for i in range(len(self.roots))
+                          if self.reserve <= 0 or self.free[i] - self.in_flight[i] - size >= self.reserve]
+            if not candidates:
+                raise VolumeFullError(errno.ENOSPC, "All output volumes are full (less than {} MB free)".format(self.reserve // 2 ** 20))
+            if self.policy == ROUND_ROBIN:
+                index = min(candidates, key=lambda i: (i - self.next_index) % len(self.roots))
+                self.next_index = index + 1
+            elif self.policy == FREE_SPACE:
+                index = max(candidates, key=lambda i: self.free[i] - self.in_flight[i])
+            else:
+                # Volumes not measured yet first, then the soonest done
+                index = min(candidates, key=lambda i: (self.rate[i] is not None,
+                                                       (self.in_flight[i] + size) / self.rate[i] if self.rate[i] else self.in_flight[i]))
+            self.in_flight[index] += size
+        return index, size
+
+    def _release(self, index, reserved, size, seconds):
+        with self.lock:
+            self.in_flight[index] -= reserved
+            self.free[index] -= size
+            self.written[index] += size
+            if size:
+                self.write_size = size if not self.write_size else int(self.write_size + SMOOTHING * (size - self.write_size))
+                if seconds > 0:
+                    rate = size / seconds
+                    self.rate[index] = rate if self.rate[index] is None else self.rate[index] + SMOOTHING * (rate - self.rate[index])
+
+    @contextlib.contextmanager
+    def write(self):
+        """Choose the volume of one write: yields a VolumeWrite whose root
+        the files go to and whose size the writer sets."""
+        index, reserved = self._reserve()
+        write = VolumeWrite(index, self.roots[index])
+        start = time.perf_counter()
+        try:
+            yield write
+        finally:
+            self._release(index, reserved, write.size, time.perf_counter() - start)
+
+    def stats(self):
+        with self.lock:
+            return [{"root": os.path.abspath(root),
+                     "free_mb": self.free[i] // 2 ** 20,
+                     "written_mb": self.written[i] // 2 ** 20,
+                     "mb_per_s": round(self.rate[i] / 1e6, 1) if self.rate[i] else None,
+                     "full": self.full[i]}
+                    for i, root in enumerate(self.roots)]
+
+    def close(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
@@ -0,0 +1,54 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from azure_kinect_depth_codec import PngCodec, RvlCodec, read_depth
+from azure_kinect_mock import DEPTH_MODES, COLOR_RESOLUTIONS, synthetic_depth
+
+
+def timed(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Encode/decode time and size of the depth codecs.')
+    parser.add_argument('--files', type=str, nargs='*', default=None, help='depth .png/.rvl files to use instead of synthetic frames (e.g. frames/depth/raw/*.png)')
+    parser.add_argument('--png_levels', type=int, nargs='+', default=[1, 3, 6, 9], help='png compression levels compared,  Default: 1 3 6 9')
+    parser.add_argument('--repeat', type=int, default=3, help='best of N runs per measure,  Default: 3')
+    args = parser.parse_args()
+
+    if args.files:
+        paths = [p for pattern in args.files for p in sorted(glob.glob(pattern))]
+        frames = [(os.path.basename(path), read_depth(path)) for path in paths]
+    else:
+        # Native depth modes, then depth aligned to the color resolutions
+        sizes = [("NFOV_UNBINNED", DEPTH_MODES["K4A_DEPTH_MODE_NFOV_UNBINNED"]),
+                 ("WFOV_UNBINNED", DEPTH_MODES["K4A_DEPTH_MODE_WFOV_UNBINNED"]),
+                 ("aligned 1080P", COLOR_RESOLUTIONS["K4A_COLOR_RESOLUTION_1080P"]),
+                 ("aligned 3072P", COLOR_RESOLUTIONS["K4A_COLOR_RESOLUTION_3072P"])]
+        frames = [(name, synthetic_depth(*size)) for name, size in sizes]
+
+    codecs = [("png default", PngCodec())] + [("png {}".format(level), PngCodec(level)) for level in args.png_levels]
+    codecs.append(("rvl", RvlCodec()))
+
+    header = "{:<16} {:>11} {:<12} {:>10} {:>10} {:>8}".format("frame", "size", "codec", "encode", "decode", "ratio")
+    print(header)
+    print("-" * len(header))
+    for name, depth in frames:
+        for codec_name, codec in codecs:
+            encode_time, blob = timed(lambda: codec.encode(depth), args.repeat)
+            decode_time, decoded = timed(lambda: codec.decode(blob), args.repeat)
+            if not np.array_equal(decoded, depth):
+                raise RuntimeError("{} is not lossless on {}".format(codec_name, name))
+            print("{:<16} {:>11} {:<12} {:>7.1f} ms {:>7.1f} ms {:>7.1f}%".format(
+                name, "{}x{}".format(depth.shape[1], depth.shape[0]), codec_name,
+                encode_time * 1e3, decode_time * 1e3, 100.0 * len(blob) / depth.nbytes))
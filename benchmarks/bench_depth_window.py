@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from azure_kinect_depth_window import RunningDepthWindow
+
+
+def legacy_mean(depth_queue):
+    depth_batch = np.asarray(depth_queue)
+    return (depth_batch.sum(axis=0)/depth_batch.shape[0]).astype(np.uint16)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Micro-benchmark of depth averaging: deque re-stacking vs running window.')
+    parser.add_argument('--width', type=int, default=4096, help='depth width,  Default: 4096 (aligned to 3072P color)')
+    parser.add_argument('--height', type=int, default=3072, help='depth height,  Default: 3072')
+    parser.add_argument('--window', type=int, default=30, help='number of averaged frames,  Default: 30')
+    parser.add_argument('--frames', type=int, default=60, help='number of frames fed to the window,  Default: 60')
+    parser.add_argument('--shots', type=int, default=5, help='number of means computed,  Default: 5')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pool = [rng.integers(0, 4000, (args.height, args.width), dtype=np.uint16) for _ in range(8)]
+    for frame in pool:
+        frame[rng.random(frame.shape) < 0.1] = 0
+
+    legacy_queue = deque(maxlen=args.window)
+    window = RunningDepthWindow(maxlen=args.window)
+
+    start = time.perf_counter()
+    for i in range(args.frames):
+        legacy_queue.append(pool[i % len(pool)])
+    legacy_append = (time.perf_counter() - start) / args.frames
+    start = time.perf_counter()
+    for i in range(args.frames):
+        window.append(pool[i % len(pool)])
+    window_append = (time.perf_counter() - start) / args.frames
+
+    start = time.perf_counter()
+    for _ in range(args.shots):
+        expected = legacy_mean(legacy_queue)
+    legacy_shot = (time.perf_counter() - start) / args.shots
+    start = time.perf_counter()
+    for _ in range(args.shots):
+        result = window.mean()
+    window_shot = (time.perf_counter() - start) / args.shots
+
+    print("frame {}x{}, window {}".format(args.width, args.height, args.window))
+    print("append per frame:  deque {:8.2f} ms   running window {:8.2f} ms".format(legacy_append * 1e3, window_append * 1e3))
+    print("mean per shot:     deque {:8.2f} ms   running window {:8.2f} ms".format(legacy_shot * 1e3, window_shot * 1e3))
+    print("bit-identical:", np.array_equal(expected, result))
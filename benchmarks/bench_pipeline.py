@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def run_config(config_path, seconds, shots):
+    # Imported here, the parent process only spawns one child per config
+    from PySide6.QtCore import QCoreApplication, QObject, QTimer, Slot
+    from PySide6.QtGui import QImage
+    from azure_kinect_mock import MockAzureKinectSensor
+    from azure_kinect_recorder import CameraRGBD
+    from azure_kinect_save_pool import write_shot
+    from azure_kinect_depth_filters import apply_filters
+
+    class PreviewProbe(QObject):
+        # Lives in the main thread, like Window, so previews are delivered
+        # through the event loop exactly as in the application
+        def __init__(self, sensor):
+            QObject.__init__(self)
+            self.sensor = sensor
+            self.latencies = []
+            self.count = 0
+            self.first = None
+            self.last = None
+
+        @Slot(QImage)
+        def on_preview(self, image):
+            now = time.perf_counter()
+            if self.sensor.last_capture is not None:
+                self.latencies.append(now - self.sensor.last_capture)
+            if self.first is None:
+                self.first = now
+            self.last = now
+            self.count += 1
+
+    class TimedSensor(MockAzureKinectSensor):
+        last_capture = None
+
+        def capture_frame(self, align_depth_to_color):
+            rgbd = MockAzureKinectSensor.capture_frame(self, align_depth_to_color)
+            self.last_capture = time.perf_counter()
+            return rgbd
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    sensor = TimedSensor(config_path)
+    # Generate the synthetic frames before the clock starts
+    sensor.capture_frame(True)
+    probe = PreviewProbe(sensor)
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as tmp_dir:
+        output_dir = os.path.join(tmp_dir, "frames")
+        camera = CameraRGBD()
+        camera.set_sensor(sensor)
+        camera.set_output_dir(output_dir)
+        camera.updateFrame.connect(probe.on_preview)
+        QTimer.singleShot(int(seconds * 1000), app.quit)
+        camera.start()
+        app.exec()
+        camera.status = False
+        camera.wait()
+
+        save_times = []
+        mean_times = []
+        for i in range(shots):
+            start = time.perf_counter()
+            camera.depth_queue.mean()
+            mean_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            color_frame, depth_raw, depth_window, _ = camera.snapshot()
+            write_shot(output_dir, "bench_{}".format(i), color_frame, depth_raw,
+                       apply_filters(camera.depth_filters, depth_window))
+            save_times.append(time.perf_counter() - start)
+        camera.volumes.close()
+
+    latencies = sorted(probe.latencies) or [float("nan")]
+    preview_seconds = (probe.last - probe.first) if probe.count > 1 else float("nan")
+    return {"config": os.path.basename(config_path),
+            "color": "{}x{}".format(*sensor.color_size),
+            "camera_fps": sensor.fps,
+            "frames": sensor.frame_index,
+            "preview_fps": (probe.count - 1) / preview_seconds if probe.count > 1 else 0.0,
+            "preview_latency_ms_p50": latencies[len(latencies) // 2] * 1e3,
+            "preview_latency_ms_p95": latencies[int(len(latencies) * 0.95)] * 1e3,
+            "save_ms": sum(save_times) / len(save_times) * 1e3,
+            "depth_mean_ms": sum(mean_times) / len(mean_times) * 1e3,
+            # ru_maxrss is in KiB on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Headless capture/preview/save benchmark on the synthetic sensor.')
+    parser.add_argument('--configs', type=str, nargs='*', default=None, help='sensor configs to run,  Default: the azure_kinect_config_*.json of the repository')
+    parser.add_argument('--seconds', type=float, default=10.0, help='capture duration per config,  Default: 10')
+    parser.add_argument('--shots', type=int, default=3, help='number of shots saved per config,  Default: 3')
+    parser.add_argument('--single', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        print(json.dumps(run_config(args.single, args.seconds, args.shots)))
+        sys.exit(0)
+
+    configs = args.configs or sorted(glob.glob(os.path.join(ROOT, "azure_kinect_config_*.json")))
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    results = []
+    for config in configs:
+        # One process per config, so peak RSS isn't carried over
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--single", config,
+                              "--seconds", str(args.seconds), "--shots", str(args.shots)],
+                             capture_output=True, text=True, env=env)
+        if out.returncode != 0:
+            print("{} failed:\n{}".format(config, out.stderr))
+            continue
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    header = "{:<40} {:>10} {:>5} {:>8} {:>9} {:>9} {:>9} {:>10} {:>9}".format(
+        "config", "color", "fps", "preview", "lat p50", "lat p95", "save", "depth avg", "peak RSS")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print("{config:<40} {color:>10} {camera_fps:>5} {preview_fps:>6.1f}/s {preview_latency_ms_p50:>6.1f} ms "
+              "{preview_latency_ms_p95:>6.1f} ms {save_ms:>6.0f} ms {depth_mean_ms:>7.1f} ms {peak_rss_mb:>6.0f} MB".format(**r))
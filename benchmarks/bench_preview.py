@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import argparse
+import cv2
+import numpy as np
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QImage
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from azure_kinect_preview import DEPTH, SIDE_BY_SIDE, PreviewStage
+
+
+def legacy_preview(color):
+    # Per frame work of CameraRGBD.run before the preview stage
+    color_frame = cv2.cvtColor(color, cv2.COLOR_BGR2RGB)
+    h, w, ch = color_frame.shape
+    img = QImage(color_frame.data, w, h, ch * w, QImage.Format_BGR888)
+    return img.scaled(640, 480, Qt.KeepAspectRatio)
+
+
+def naive_depth_preview(depth, near_mm=300, far_mm=4000):
+    # Full resolution colormap, then the same resize
+    scaled = np.clip((depth.astype(np.float32) - near_mm) * (255.0 / (far_mm - near_mm)), 0, 255).astype(np.uint8)
+    colored = cv2.applyColorMap(scaled, cv2.COLORMAP_TURBO)
+    colored[depth == 0] = 0
+    return cv2.resize(colored, (640, 480), interpolation=cv2.INTER_AREA)
+
+
+def cpu_time_per_frame(function, frame, frames):
+    start = time.process_time()
+    for _ in range(frames):
+        function(frame)
+    return (time.process_time() - start) / frames
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CPU time per frame of the preview path, before and after PreviewStage.')
+    parser.add_argument('--width', type=int, default=4096, help='color width,  Default: 4096 (3072P)')
+    parser.add_argument('--height', type=int, default=3072, help='color height,  Default: 3072')
+    parser.add_argument('--depth_width', type=int, default=None, help='depth width,  Default: color width (registered depth)')
+    parser.add_argument('--depth_height', type=int, default=None, help='depth height,  Default: color height')
+    parser.add_argument('--frames', type=int, default=30, help='number of frames rendered,  Default: 30')
+    parser.add_argument('--capture_fps', type=float, default=15.0, help='camera rate used to report the per captured frame cost,  Default: 15')
+    parser.add_argument('--preview_fps', type=float, default=15.0, help='preview rate,  Default: 15')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    color = rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    preview = PreviewStage(640, 480, fps=args.preview_fps, image_format=QImage.Format_RGB888)
+
+    depth_size = (args.depth_height or args.height, args.depth_width or args.width)
+    depth = rng.integers(0, 5000, depth_size, dtype=np.uint16)
+
+    legacy = cpu_time_per_frame(legacy_preview, color, args.frames)
+    staged = cpu_time_per_frame(preview.render, color, args.frames)
+    naive_depth = cpu_time_per_frame(naive_depth_preview, depth, args.frames)
+    preview.configure(DEPTH, 300, 4000)
+    depth_only = cpu_time_per_frame(lambda depth: preview.render(color, depth), depth, args.frames)
+    preview.configure(SIDE_BY_SIDE, 300, 4000)
+    side_by_side = cpu_time_per_frame(lambda depth: preview.render(color, depth), depth, args.frames)
+    # Only one captured frame out of capture_fps/preview_fps is rendered
+    rendered_share = min(1.0, args.preview_fps / args.capture_fps) if args.preview_fps > 0 else 1.0
+
+    print("color {}x{}, depth {}x{} -> 640x480 label".format(args.width, args.height, depth_size[1], depth_size[0]))
+    print("legacy cvtColor + QImage.scaled: {:8.2f} ms CPU per frame".format(legacy * 1e3))
+    print("PreviewStage decimate + area:   {:8.2f} ms CPU per rendered frame".format(staged * 1e3))
+    print("PreviewStage at {:.0f} of {:.0f} FPS: {:8.2f} ms CPU per captured frame".format(
+        args.preview_fps, args.capture_fps, staged * rendered_share * 1e3))
+    print("full resolution depth colormap: {:8.2f} ms CPU per frame".format(naive_depth * 1e3))
+    print("PreviewStage depth (LUT):       {:8.2f} ms CPU per rendered frame".format(depth_only * 1e3))
+    print("PreviewStage side by side:      {:8.2f} ms CPU per rendered frame".format(side_by_side * 1e3))
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from azure_kinect_depth_window import RunningDepthWindow
+from azure_kinect_depth_filters import apply_filters, make_filters
+from azure_kinect_mock import COLOR_RESOLUTIONS, DEPTH_MODES, synthetic_depth
+from azure_kinect_registration import DepthRegistration
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def window_bytes(window):
+    return sum(frame.nbytes for frame in window.frames) + window.sum.nbytes + window.valid_count.nbytes + window._mask.nbytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Always-aligned depth vs native depth registered only for the written shots: window memory and CPU.')
+    parser.add_argument('--color', type=str, default="K4A_COLOR_RESOLUTION_3072P", choices=sorted(COLOR_RESOLUTIONS), help='color resolution,  Default: K4A_COLOR_RESOLUTION_3072P')
+    parser.add_argument('--depth', type=str, default="K4A_DEPTH_MODE_NFOV_UNBINNED", choices=sorted(DEPTH_MODES), help='depth mode,  Default: K4A_DEPTH_MODE_NFOV_UNBINNED')
+    parser.add_argument('--window', type=int, default=30, help='number of depth frames in the window,  Default: 30')
+    parser.add_argument('--fps', type=int, default=30, help='camera frame rate, for the per-second figures,  Default: 30')
+    parser.add_argument('--filters', type=str, nargs='+', default=["mean"], help='depth filters of a shot,  Default: mean')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions of each timed step,  Default: 5')
+    args = parser.parse_args()
+
+    color_size, depth_size = COLOR_RESOLUTIONS[args.color], DEPTH_MODES[args.depth]
+    registration = DepthRegistration()
+    native = [synthetic_depth(*depth_size, index=i) for i in range(4)]
+    # The sensor's aligned frames are stood in for by this engine's output, same size and content
+    aligned = [registration.register(frame, color_size) for frame in native]
+    filters = make_filters(args.filters)
+
+    results = {}
+    for mode, frames in (("always aligned", aligned), ("deferred", native)):
+        window = RunningDepthWindow(args.window)
+        append, _ = timed(lambda: window.append(frames[len(window.frames) % len(frames)]), args.window)
+        for i in range(args.window):
+            window.append(frames[i % len(frames)])
+        filter_time, filtered = timed(lambda: apply_filters(filters, window), args.repeat)
+        register_time = 0.0
+        if mode == "deferred":
+            # Raw frame and every filter output of a shot
+            register_time, _ = timed(lambda: [registration.register(frame, color_size) for frame in [frames[0]] + list(filtered.values())],
+                                     args.repeat)
+        results[mode] = {"window_mb": window_bytes(window) / 2 ** 20, "append_ms": append * 1e3,
+                         "filter_ms": filter_time * 1e3, "register_ms": register_time * 1e3}
+    align_ms = timed(lambda: registration.register(native[0], color_size), args.repeat)[0] * 1e3
+
+    print("color {}x{}, depth {}x{}, window {}, {} fps, filters {}".format(*color_size, *depth_size, args.window, args.fps, " ".join(args.filters)))
+    print("{:<16} {:>10} {:>22} {:>14} {:>16}".format("", "window", "per frame (capture)", "shot filter", "shot register"))
+    for mode, r in results.items():
+        per_frame = r["append_ms"] + (align_ms if mode == "always aligned" else 0.0)
+        print("{:<16} {:>7.0f} MB {:>8.2f} ms {:>5.1f}% CPU {:>11.1f} ms {:>13.1f} ms".format(
+            mode, r["window_mb"], per_frame, per_frame * args.fps / 10.0, r["filter_ms"], r["register_ms"]))
+    print("per frame (capture): window append, plus the registration of every frame when always aligned "
+          "(this engine's {:.1f} ms stands in for the sensor's alignment)".format(align_ms))
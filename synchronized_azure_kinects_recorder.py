@@ -1,95 +1,57 @@
 import os
 import sys
 import time
+import json
+import math
+from dataclasses import replace
+from concurrent.futures import ThreadPoolExecutor
 
-import cv2
 import argparse
-import numpy as np
-from PIL import Image
-from collections import deque
-from PySide6.QtCore import Qt, QThread, Signal, Slot
+import azure_kinect_camera
+from azure_kinect_camera import RecorderSettings, make_exporter
+from azure_kinect_save_pool import SavePool
+from azure_kinect_manifest import Manifest
+from azure_kinect_volumes import POLICIES
+from azure_kinect_preview import PREVIEW_MODES, PreviewControls
+from azure_kinect_sync import match_frames
+from azure_kinect_metrics import REGISTRY, MetricsExporter, MetricsOverlay
+from azure_kinect_capture_process import CaptureProcess, CpuMeter
+from PySide6.QtCore import Qt, QTimer, Signal, Slot
 from PySide6.QtGui import QAction, QImage, QKeySequence, QPixmap
-from PySide6.QtWidgets import (QApplication, QComboBox, QGroupBox,
+from PySide6.QtWidgets import (QApplication, QComboBox, QGridLayout, QGroupBox,
                                QHBoxLayout, QLabel, QMainWindow, QPushButton,
                                QSizePolicy, QVBoxLayout, QWidget, QSlider)
 
 
 
-class CameraRGBD(QThread):
-    updateFrame = Signal(QImage)
-    
+class CameraRGBD(azure_kinect_camera.CameraRGBD):
+    """CameraRGBD of one device of a rig, keeping the recent frames that are
+    matched by timestamp across the devices when a shot is taken."""
+
     def __init__(self, parent=None):
-        QThread.__init__(self, parent)
-        self.status = True
-        self.sensor = None
-        self.color_frame = None
-        self.depth_queue = deque(maxlen=30)
-        self.output_dir = None
-        self.number_last_frame = 1
-        self.align_depth_to_color = True
-
-    def set_input(self, input):
-        self.input = input
-    
-    def set_output_dir(self, output_dir):
-        self.output_dir = output_dir
-        if self.output_dir is None:
-            self.output_dir = "frames"
-
-        if (os.path.isdir(self.output_dir + "/color") and os.path.isdir(self.output_dir + "/depth")):
-            print('Output directory \'{}\' already existing, continue recording there'.format(self.output_dir))
-            for path in os.listdir(self.output_dir + "/color"):
-                # check if current path is a file
-                if os.path.isfile(os.path.join(self.output_dir + "/color", path)):
-                    self.number_last_frame += 1
-        else:
-            try:
-                os.mkdir(self.output_dir)
-                os.mkdir(self.output_dir + "/color")
-                os.mkdir(self.output_dir + "/depth/")
-                os.mkdir(self.output_dir + "/depth/raw")
-                os.mkdir(self.output_dir + "/depth/mean_30")
-            except (PermissionError, FileExistsError):
-                print("Unable to mkdir: " + self.output_dir)
-
-    def run(self):
-        if self.depth_queue:
-            self.depth_queue.clear()
-        while self.status:
-            try:
-                color_frame = Image.open(self.input + "/" + "color.jpg")
-                color_frame = np.asarray(color_frame)
-                depth_frame = Image.open(self.input + "/" + "depth.png")
-                depth_frame = np.asarray(depth_frame, dtype=np.uint16)
-            except:
-                continue
-            self.color_frame = color_frame
-            self.depth_queue.append(depth_frame)
-            # Creating and scaling QImage
-            h, w, ch = self.color_frame.shape
-            img = QImage(self.color_frame.data, w, h, ch * w, QImage.Format_BGR888)
-            scaled_img = img.scaled(640, 480, Qt.KeepAspectRatio)
-            # Emit signal
-            self.updateFrame.emit(scaled_img)
+        azure_kinect_camera.CameraRGBD.__init__(self, parent)
+        self.set_history(4)
 
-    @Slot(int)
-    def adjust_x(self, value):
-        self.set_x(value)
-        
-    @Slot()
-    def save_frames(self):
-        time.sleep(1)
-        depth_batch = np.asarray(self.depth_queue)
-        depth_raw = depth_batch[-1]
-        depth_mean = (depth_batch.sum(axis=0)/depth_batch.shape[0]).astype(np.uint16)
-        cv2.imwrite(self.output_dir + "/color/" + str(self.number_last_frame) + ".jpg", self.color_frame)
-        cv2.imwrite(self.output_dir + "/depth/raw/" + str(self.number_last_frame) + ".png", depth_raw)
-        cv2.imwrite(self.output_dir + "/depth/mean_30/" + str(self.number_last_frame) + ".png", depth_mean)
-        self.number_last_frame += 1
+    def configure(self, settings):
+        self.set_history(settings.sync_history)
+        azure_kinect_camera.CameraRGBD.configure(self, settings)
+
+
+def load_devices(path):
+    """Device list of a rig: JSON list of {"name", "input", "output"}, master first."""
+    with open(path) as f:
+        devices = json.load(f)
+    for device in devices:
+        if "input" not in device or "output" not in device:
+            raise ValueError("Every device in '{}' needs an input and an output".format(path))
+    return devices
 
 
 class Window(QMainWindow):
-    def __init__(self, input_master, input_sub, output_master, output_sub):
+    # Shot whose frames could not be matched across the devices, from the save pool
+    shotUnmatched = Signal(str, str)
+
+    def __init__(self, devices, settings):
         super().__init__()
         # Title and dimensions
         self.setWindowTitle("Patterns detection")
@@ -106,27 +68,107 @@ class Window(QMainWindow):
                         triggered=qApp.aboutQt)
         self.menu_about.addAction(about)
 
-        # Create a label for the display camera
-        self.label_master = QLabel(self)
-        self.label_master.setFixedSize(640, 480)
+        self.menu_view = self.menu.addMenu("View")
+        self.action_metrics = QAction("Metrics overlay", self, checkable=True, checked=settings.metrics_overlay)
+        self.action_metrics.toggled.connect(self.show_metrics)
+        self.menu_view.addAction(self.action_metrics)
+
+        # One label and one thread in charge of updating the image per device,
+        # or one capture process per device, the GUI process then only renders
+        self.devices = devices
+        self.capture_process = settings.capture_process
+        self.cameras = []
+        self.labels = []
+        for i, device in enumerate(self.devices):
+            device.setdefault("name", "master" if i == 0 else "sub{}".format(i))
+            label = QLabel(self)
+            label.setFixedSize(640, 480)
+            device_settings = replace(settings, input=device["input"], output=device["output"], name=device["name"])
+            if self.capture_process:
+                camera = CaptureProcess("synchronized_azure_kinects_recorder", device_settings, self)
+                camera.history.connect(self.history_pinned)
+                camera.saved.connect(self.shot_saved)
+                camera.failed.connect(self.shot_failed)
+                camera.cloudFailed.connect(self.cloud_failed)
+                camera.finished.connect(self.process_finished)
+                camera.finished.connect(self.close)
+                camera.updateFrame.connect(self.set_image)
+                self.cameras.append(camera)
+                self.labels.append(label)
+                continue
+            camera = CameraRGBD(self)
+            camera.set_input(device["input"], settings.transport, settings.replay_options)
+            camera.configure(device_settings)
+            camera.finished.connect(self.close)
+            camera.updateFrame.connect(self.set_image)
+            self.cameras.append(camera)
+            self.labels.append(label)
+
+        # One shot id shared by all devices, following the most advanced output folder
+        self.sync_tolerance_usec = int(settings.sync_tolerance_ms * 1000)
+        if self.capture_process:
+            # Read only, the capture processes own the manifests
+            self.number_last_frame = max(Manifest(device["output"]).next_shot for device in self.devices)
+        else:
+            self.number_last_frame = max(camera.manifest.next_shot for camera in self.cameras)
+        self.unmatched = 0
+        self.failures = 0
+        self.shotUnmatched.connect(self.shot_unmatched)
+        # Frame histories of the shots in progress in capture process mode, per shot id,
+        # then the number of devices still saving them
+        self.pinned = {}
+        self.saving = {}
+
+        # Pool matching the frames of each shot off the GUI thread, and writers
+        # saving the matched frames of all devices in parallel
+        self.saver = SavePool(max_workers=settings.save_workers, max_pending=settings.save_queue, parent=self)
+        self.saver.saved.connect(self.shot_saved)
+        self.saver.failed.connect(self.shot_failed)
+        self.saver.backlogChanged.connect(self.set_backlog)
+        self.writers = ThreadPoolExecutor(max_workers=len(self.cameras), thread_name_prefix="write")
+        self.label_backlog = QLabel("Queued: 0", self)
 
-        # Create a label for the display camera
-        self.label_sub = QLabel(self)
-        self.label_sub.setFixedSize(640, 480)
+        # Optional point cloud export of every shot, in a process pool
+        self.exporter = None
+        self.label_clouds = QLabel("Clouds: 0", self)
+        if not self.capture_process:
+            self.exporter = make_exporter(settings, self)
+        if self.exporter is not None:
+            self.exporter.failed.connect(self.cloud_failed)
+            self.exporter.backlogChanged.connect(self.set_cloud_backlog)
+            for camera in self.cameras:
+                camera.exporter = self.exporter
+        self.label_clouds.setVisible(self.exporter is not None)
+        self.label_unmatched = QLabel("Unmatched: 0", self)
+        self.label_failed = QLabel("Failed: 0", self)
 
-        # Thread in charge of updating the image
-        self.camera_master = CameraRGBD(self)
-        self.camera_master.set_input(input_master)
-        self.camera_master.set_output_dir(output_master)
-        self.camera_master.finished.connect(self.close)
-        self.camera_master.updateFrame.connect(self.set_image_master)
+        # CPU use of the GUI process and of every capture process
+        self.cpu = CpuMeter()
+        self.label_cpu = QLabel("CPU: -", self)
+        self.cpu_timer = QTimer(self)
+        self.cpu_timer.timeout.connect(self.update_cpu)
+        self.cpu_timer.timeout.connect(self.update_metrics)
+        self.cpu_timer.start(1000)
 
-        # Thread in charge of updating the image
-        self.camera_sub = CameraRGBD(self)
-        self.camera_sub.set_input(input_sub)
-        self.camera_sub.set_output_dir(output_sub)
-        self.camera_sub.finished.connect(self.close)
-        self.camera_sub.updateFrame.connect(self.set_image_sub)
+        # Stage latencies and queue depths, over the previews and/or exported;
+        # the save and cloud queues are shared by the devices, listed under the master
+        master = self.devices[0]["name"]
+        if not self.capture_process:
+            # The capture processes report their own save queues
+            REGISTRY.gauge("kinect_queue_depth", "Items waiting in the queues of the pipeline", fn=self.saver.backlog, camera=master, queue="save")
+        if self.exporter is not None:
+            REGISTRY.gauge("kinect_queue_depth", "Items waiting in the queues of the pipeline", fn=self.exporter.backlog, camera=master, queue="cloud")
+        self.overlays = [MetricsOverlay(device["name"], label) for device, label in zip(self.devices, self.labels)]
+        for overlay in self.overlays:
+            overlay.setVisible(settings.metrics_overlay)
+        self.metrics_exporter = None
+        if settings.metrics_file is not None or settings.metrics_port is not None:
+            self.metrics_exporter = MetricsExporter(self.metrics_snapshot, settings.metrics_file, settings.metrics_port,
+                                                    settings.metrics_interval)
+
+        # Color, depth or both in the previews of all devices, and the depth colour range
+        self.preview_controls = PreviewControls(settings.preview_mode, settings.preview_near_mm, settings.preview_far_mm, self)
+        self.preview_controls.changed.connect(self.set_preview)
 
         # Buttons layout
         horizontal_buttons_layout = QHBoxLayout()
@@ -139,10 +181,11 @@ class Window(QMainWindow):
         horizontal_buttons_layout.addWidget(self.button_start)
         horizontal_buttons_layout.addWidget(self.button_stop)
 
-        # Align verticaly label_layout lauout with horizontal_buttons_layout
-        cameras_layout = QHBoxLayout()
-        cameras_layout.addWidget(self.label_master)
-        cameras_layout.addWidget(self.label_sub)
+        # Previews in a grid as square as possible, buttons below
+        cameras_layout = QGridLayout()
+        columns = math.ceil(math.sqrt(len(self.labels)))
+        for i, label in enumerate(self.labels):
+            cameras_layout.addWidget(label, i // columns, i % columns)
         vertical_align_layout = QVBoxLayout()
         vertical_align_layout.addLayout(cameras_layout)
         vertical_align_layout.addLayout(horizontal_buttons_layout)
@@ -151,19 +194,22 @@ class Window(QMainWindow):
         widget = QWidget(self)
 
         # Connections
-        self.button_start.clicked.connect(self.start_master)
-        self.button_start.clicked.connect(self.start_sub)
-        self.button_stop.clicked.connect(self.kill_thread_master)
-        self.button_stop.clicked.connect(self.kill_thread_sub)
+        self.button_start.clicked.connect(self.start)
+        self.button_stop.clicked.connect(self.kill_thread)
         self.button_stop.setEnabled(False)
-        self.button_photo.clicked.connect(self.save_frames_master)
-        self.button_photo.clicked.connect(self.save_frames_sub)
+        self.button_photo.clicked.connect(self.save_frames)
         self.button_photo.setEnabled(False)
 
         # Layout for button_photo
         vertical_buttons_layout = QVBoxLayout()
         vertical_buttons_layout.setAlignment(Qt.AlignTop)
         vertical_buttons_layout.addWidget(self.button_photo) 
+        vertical_buttons_layout.addWidget(self.label_backlog)
+        vertical_buttons_layout.addWidget(self.label_clouds)
+        vertical_buttons_layout.addWidget(self.label_unmatched)
+        vertical_buttons_layout.addWidget(self.label_failed)
+        vertical_buttons_layout.addWidget(self.label_cpu)
+        vertical_buttons_layout.addWidget(self.preview_controls)
         
         # Main layout to align left layout and right layout
         main_layout = QHBoxLayout()
@@ -173,82 +219,294 @@ class Window(QMainWindow):
         widget.setLayout(main_layout)
         self.setCentralWidget(widget)
 
+    @Slot(QImage)
+    def set_image(self, image):
+        # Queued from the camera threads, sender() tells which preview to update
+        camera = self.sender()
+        if not self.capture_process:
+            camera.metrics.observe("deliver", time.perf_counter() - camera.emitted_at)
+        label = self.labels[self.cameras.index(camera)]
+        label.setPixmap(QPixmap.fromImage(image))
+
+    @Slot(str, int, int)
+    def set_preview(self, mode, near_mm, far_mm):
+        for camera in self.cameras:
+            if self.capture_process:
+                camera.set_preview(mode, near_mm, far_mm)
+            else:
+                camera.preview.configure(mode, near_mm, far_mm)
+
     @Slot()
-    def kill_thread_master(self):
-        print("Finishing...")
-        self.button_stop.setEnabled(False)
-        self.button_photo.setEnabled(False)
-        self.button_start.setEnabled(True)
-        self.camera_master.status = False
-        # Give time for the camera to finish
-        time.sleep(1)
-        self.camera_master.terminate()
-        # Give time for the thread to finish
-        time.sleep(2)
-    
-    @Slot()
-    def kill_thread_sub(self):
+    def kill_thread(self):
         print("Finishing...")
         self.button_stop.setEnabled(False)
         self.button_photo.setEnabled(False)
         self.button_start.setEnabled(True)
-        self.camera_sub.status = False
-        # Give time for the camera to finish
+        if self.capture_process:
+            for camera in self.cameras:
+                camera.stop()
+            return
+        for camera in self.cameras:
+            camera.status = False
+        # Give time for the cameras to finish
         time.sleep(1)
-        self.camera_sub.terminate()
-        # Give time for the thread to finish
+        for camera in self.cameras:
+            camera.terminate()
+        # Give time for the threads to finish
         time.sleep(2)
 
     @Slot()
-    def start_master(self):
-        print("Starting...")
-        self.button_stop.setEnabled(True)
-        self.button_photo.setEnabled(True)
-        self.button_start.setEnabled(False)
-        self.camera_master.start()
-    
-    @Slot()
-    def start_sub(self):
+    def start(self):
         print("Starting...")
         self.button_stop.setEnabled(True)
         self.button_photo.setEnabled(True)
         self.button_start.setEnabled(False)
-        self.camera_sub.start()
-    
+        for camera in self.cameras:
+            camera.start()
+
     @Slot()
-    def save_frames_master(self):
+    def save_frames(self):
+        if self.backlog() >= self.saver.max_pending:
+            print("Save queue is full ({} shots), photo skipped".format(self.saver.max_pending))
+            return
         print("Saving frames...")
-        self.button_photo.setEnabled(False)
-        self.camera_master.save_frames()
-        self.button_photo.setEnabled(True)
-        print("Saved")
-    
+        number = self.number_last_frame
+        self.number_last_frame += 1
+        if self.capture_process:
+            # Every process arms its trigger and replies with the frames on screen once complete
+            self.pinned[number] = [None] * len(self.cameras)
+            for camera in self.cameras:
+                camera.pin(number)
+            self.set_backlog(self.backlog())
+            return
+        # Armed now, on the frames on screen, rather than by the save pool
+        triggers = [camera.arm_trigger() for camera in self.cameras]
+        self.saver.submit(str(number), self.save_shot, number, triggers)
+
+    @Slot(int, list)
+    def history_pinned(self, number, entries):
+        # Timestamps of the pinned frames of one device, the frames stay in its process
+        histories = self.pinned.get(number)
+        if histories is None:
+            # Failed meanwhile, see process_finished
+            self.sender().release(number)
+            return
+        histories[self.cameras.index(self.sender())] = entries
+        if any(history is None for history in histories):
+            return
+        del self.pinned[number]
+        chosen, spread = match_frames(histories, self.sync_tolerance_usec)
+        if chosen is None:
+            for camera in self.cameras:
+                camera.release(number)
+            self.shot_unmatched(str(number), self.unmatched_reason(spread))
+            self.set_backlog(self.backlog())
+            return
+        self.saving[number] = len(self.cameras)
+        for camera, entry in zip(self.cameras, chosen):
+            camera.save(number, entry[0])
+        self.write_sync_record(number, chosen, spread)
+
     @Slot()
-    def save_frames_sub(self):
-        print("Saving frames...")
-        self.button_photo.setEnabled(False)
-        self.camera_sub.save_frames()
-        self.button_photo.setEnabled(True)
-        print("Saved")
+    def process_finished(self):
+        # A capture process stopped or died: its histories and saves never come back
+        name = self.devices[self.cameras.index(self.sender())]["name"]
+        numbers = sorted(set(self.pinned) | set(self.saving))
+        self.pinned.clear()
+        self.saving.clear()
+        for number in numbers:
+            for camera in self.cameras:
+                if camera.is_running():
+                    camera.release(number)
+            self.shot_failed(str(number), "capture process of {} finished".format(name))
+        self.set_backlog(self.backlog())
 
-    @Slot(QImage)
-    def set_image_master(self, image):
-        self.label_master.setPixmap(QPixmap.fromImage(image))
-    
-    @Slot(QImage)
-    def set_image_sub(self, image):
-        self.label_sub.setPixmap(QPixmap.fromImage(image))
+    def backlog(self):
+        # Shots in the save pool, or pinned or being saved by the capture processes
+        if self.capture_process:
+            return len(self.pinned) + len(self.saving)
+        return self.saver.backlog()
+
+    def device_done(self, name):
+        # Every capture process answers once per shot it was asked to save
+        if not self.capture_process or not name.isdigit() or int(name) not in self.saving:
+            return
+        number = int(name)
+        self.saving[number] -= 1
+        if self.saving[number] == 0:
+            del self.saving[number]
+        self.set_backlog(self.backlog())
+
+    def save_shot(self, number, triggers):
+        # Runs in the save pool, until post_frames frames arrived on every device
+        try:
+            for camera, trigger in zip(self.cameras, triggers):
+                camera.wait_trigger(trigger)
+        except RuntimeError:
+            for camera, trigger in zip(self.cameras, triggers):
+                camera.ring.cancel(trigger)
+            raise
+        # Matched among the frames on screen at the request
+        entries, spread = match_frames([trigger.shot_frames() for trigger in triggers], self.sync_tolerance_usec)
+        if entries is None:
+            self.shotUnmatched.emit(str(number), self.unmatched_reason(spread))
+            return False
+        futures = [self.writers.submit(camera.save_matched, number, entry, trigger.depth_window)
+                   for camera, entry, trigger in zip(self.cameras, entries, triggers)]
+        if self.cameras[0].burst:
+            futures += [self.writers.submit(camera.save_burst, number, str(number), trigger)
+                        for camera, trigger in zip(self.cameras, triggers)]
+        for future in futures:
+            future.result()
+        for camera, trigger in zip(self.cameras, triggers):
+            camera.metrics.observe("shot", time.perf_counter() - trigger.armed_at)
+        self.write_sync_record(number, entries, spread)
+
+    def unmatched_reason(self, spread):
+        if spread is None:
+            return "no frame received yet from every device"
+        return "no frames within {:.3f} ms on all devices (closest set {:.3f} ms apart)".format(
+            self.sync_tolerance_usec / 1000, spread / 1000)
+
+    def write_sync_record(self, number, entries, spread):
+        # Frames each shot is made of, to check the synchronization afterwards
+        record = {"shot": number, "spread_usec": spread,
+                  "devices": [{"name": device["name"], "sequence": entry[1], "timestamp_usec": entry[0]}
+                              for device, entry in zip(self.devices, entries)]}
+        with open(os.path.join(self.devices[0]["output"], "sync.jsonl"), "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    @Slot(str)
+    def shot_saved(self, name):
+        print("Saved", name)
+        self.device_done(name)
+
+    @Slot(str, str)
+    def shot_unmatched(self, name, error):
+        self.unmatched += 1
+        self.label_unmatched.setText("Unmatched: {}".format(self.unmatched))
+        print("Shot {} not matched: {}".format(name, error))
+
+    @Slot(str, str)
+    def shot_failed(self, name, error):
+        self.failures += 1
+        self.label_failed.setText("Failed: {}".format(self.failures))
+        print("Shot {} not saved: {}".format(name, error.strip().splitlines()[-1]))
+        self.device_done(name)
+
+    @Slot()
+    def update_cpu(self):
+        text = "CPU: GUI {:.0f}%".format(self.cpu.sample())
+        if self.capture_process:
+            text += "".join("\n{} {:.0f}%".format(device["name"], camera.cpu)
+                            for device, camera in zip(self.devices, self.cameras))
+        self.label_cpu.setText(text)
+
+    def metrics_snapshot(self):
+        # Metrics of this process, and of the capture processes if any
+        snapshot = REGISTRY.snapshot()
+        if self.capture_process:
+            for camera in self.cameras:
+                snapshot += camera.metrics
+        return snapshot
+
+    @Slot()
+    def update_metrics(self):
+        snapshot = self.metrics_snapshot()
+        for overlay in self.overlays:
+            overlay.update_metrics(snapshot)
+
+    @Slot(bool)
+    def show_metrics(self, checked):
+        for overlay in self.overlays:
+            overlay.setVisible(checked)
+        self.update_metrics()
+
+    @Slot(int)
+    def set_backlog(self, pending):
+        self.label_backlog.setText("Queued: {}".format(pending))
+
+    @Slot(int)
+    def set_cloud_backlog(self, pending):
+        self.label_clouds.setText("Clouds: {}".format(pending))
+
+    @Slot(str, str)
+    def cloud_failed(self, name, error):
+        print("Point cloud of {} not exported: {}".format(name, error.strip()))
+
+    def closeEvent(self, event):
+        # Let queued shots reach the disk
+        self.saver.shutdown(wait=True)
+        if self.exporter is not None:
+            self.exporter.shutdown(wait=True)
+        self.writers.shutdown(wait=True)
+        for camera in self.cameras:
+            if self.capture_process:
+                camera.stop()
+            else:
+                camera.close_output()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.close()
+        event.accept()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Azure kinect recorder.')
+    parser.add_argument('--devices', type=str, default=None, help='JSON list of {"name", "input", "output"} of every device, master first; replaces the --input/--output options')
     parser.add_argument('--input_master', type=str, default="camera_stream_master", help='master input path to catch color and depth images,  Default: camera_stream_master')
-    parser.add_argument('--input_sub', type=str, default="camera_stream_sub", help='subordinate input path to catch color and depth images,  Default: camera_stream_sub')
+    parser.add_argument('--input_sub', type=str, nargs='+', default=["camera_stream_sub"], help='subordinate input paths to catch color and depth images, one per subordinate,  Default: camera_stream_sub')
+    parser.add_argument('--transport', type=str, default="file", choices=["file", "shm", "pubsub", "replay"], help='read frames from files or from the shared memory rings of the streamers (inputs are then ring names), subscribe to the sockets of the streamers (inputs are then Unix socket paths or [host:]port), or replay folders recorded by the recorders (inputs are then the folders),  Default: file')
+    parser.add_argument('--replay_timing', type=str, default="original", choices=["original", "fixed", "fast"], help='with --transport replay, play the recorded frames at their recorded timestamps, at --replay_fps or as fast as they decode,  Default: original')
+    parser.add_argument('--replay_fps', type=float, default=30.0, help='frame rate of --replay_timing fixed,  Default: 30')
+    parser.add_argument('--replay_loop', action='store_true', help='with --transport replay, start over at the end of the recording')
     parser.add_argument('--output_master', type=str, default="frames_master", help='master output path to store color/ and depth/ images,  Default: frames_master')
-    parser.add_argument('--output_sub', type=str, default="frames_sub", help='subordinate output path to store color/ and depth/ images,  Default: frames_sub')
+    parser.add_argument('--output_sub', type=str, nargs='+', default=["frames_sub"], help='subordinate output paths to store color/ and depth/ images, one per subordinate,  Default: frames_sub')
+    parser.add_argument('--output_volumes', type=str, nargs='+', default=None, help='further disks to spread the shots over, each gets a folder named like the output folder of each device, whose manifest stays in its output folder,  Default: output folders only')
+    parser.add_argument('--volume_policy', type=str, default="round-robin", choices=POLICIES, help='volume of each shot: in turn, the one with the most free space, or the one expected to write it first from the measured write rates,  Default: round-robin')
+    parser.add_argument('--min_free_mb', type=int, default=1024, help='free space kept on every volume: full volumes are skipped, shots are refused once all are (0 disables the watchdog),  Default: 1024')
+    parser.add_argument('--save_workers', type=int, default=2, help='number of threads matching and saving shots, in every capture process with --capture_process,  Default: 2')
+    parser.add_argument('--save_queue', type=int, default=8, help='maximum number of shots per camera waiting to be saved,  Default: 8')
+    parser.add_argument('--preview_fps', type=float, default=15.0, help='maximum preview refresh rate, independent of the capture rate,  Default: 15')
+    parser.add_argument('--preview', type=str, default="color", choices=PREVIEW_MODES, help='preview the color frames, the depth frames coloured from --preview_near_mm to --preview_far_mm, or both side by side, also switchable in the window,  Default: color')
+    parser.add_argument('--preview_near_mm', type=int, default=300, help='depth shown at the start of the colormap, closer is white, no depth black,  Default: 300')
+    parser.add_argument('--preview_far_mm', type=int, default=4000, help='depth shown at the end of the colormap, further is grey,  Default: 4000')
+    parser.add_argument('--depth_window', type=int, default=30, help='number of depth frames the filters run over,  Default: 30')
+    parser.add_argument('--depth_filters', type=str, nargs='+', default=["mean"], choices=["mean", "valid_mean", "median", "robust_mean"], help='temporal depth filters, each written to depth/<filter>_<window>/,  Default: mean')
+    parser.add_argument('--outlier_mm', type=int, default=30, help='distance to the temporal median beyond which robust_mean rejects a sample,  Default: 30')
+    parser.add_argument('--sync_tolerance_ms', type=float, default=10.0, help='maximum timestamp difference between the frames of the devices in one shot,  Default: 10')
+    parser.add_argument('--sync_history', type=int, default=4, help='number of recent frames per device searched for a matching set,  Default: 4')
+    parser.add_argument('--output_format', type=str, default="folder", choices=["folder", "pack", "pack-raw"], help='write shots as files in color/ and depth/, or append them to one container per session with encoded (pack) or raw (pack-raw) frames,  Default: folder')
+    parser.add_argument('--depth_codec', type=str, default="png", choices=["png", "rvl"], help='depth frame format: 16-bit png, or rvl, a faster and smaller lossless depth codec (read with azure_kinect_depth_codec.read_depth),  Default: png')
+    parser.add_argument('--png_level', type=int, default=None, choices=range(10), metavar='[0-9]', help='png compression level of the depth frames,  Default: OpenCV default')
+    parser.add_argument('--cloud_format', type=str, default=None, choices=["ply", "pcd"], help='also export a colored point cloud of every shot to cloud/, built from the first depth filter,  Default: no export')
+    parser.add_argument('--cloud_workers', type=int, default=2, help='number of point cloud export processes,  Default: 2')
+    parser.add_argument('--cloud_voxel', type=float, default=0.0, help='voxel size in meters of the point cloud downsampling, 0 to keep every point,  Default: 0')
+    parser.add_argument('--intrinsics', type=str, default=None, help='color camera intrinsics of the point clouds, JSON of o3d.io.write_pinhole_camera_intrinsic,  Default: nominal intrinsics')
+    parser.add_argument('--depth_trunc', type=float, default=3.0, help='points further than this distance in meters are left out of the point clouds,  Default: 3')
+    parser.add_argument('--pre_frames', type=int, default=1, help='frames kept from the moment a shot is requested, saved with --burst,  Default: 1')
+    parser.add_argument('--post_frames', type=int, default=0, help='frames captured after a shot is requested before it is written, saved too with --burst,  Default: 0')
+    parser.add_argument('--burst', action='store_true', help='also save the color and raw depth of all pre and post trigger frames of a shot, as <shot>_b<index>')
+    parser.add_argument('--metrics_overlay', action='store_true', help='show the stage latencies, frame rate, drops and queue depths over the preview (View menu)')
+    parser.add_argument('--metrics_file', type=str, default=None, help='write the metrics in Prometheus text format to this file every --metrics_interval seconds,  Default: no file')
+    parser.add_argument('--metrics_port', type=int, default=None, help='serve the metrics in Prometheus text format on http://127.0.0.1:<port>/metrics,  Default: no server')
+    parser.add_argument('--metrics_interval', type=float, default=5.0, help='seconds between two writes of --metrics_file,  Default: 5')
+    parser.add_argument('--capture_process', action='store_true', help='capture, filter and save every device in its own process, the GUI process only renders the previews')
     args = parser.parse_args()
+    if not 0 <= args.preview_near_mm < args.preview_far_mm <= 65535:
+        parser.error('--preview_near_mm must be below --preview_far_mm, both within 0-65535')
+
+    if args.devices is not None:
+        devices = load_devices(args.devices)
+    else:
+        if len(args.input_sub) != len(args.output_sub):
+            parser.error("--input_sub and --output_sub need the same number of paths")
+        devices = [{"name": "master", "input": args.input_master, "output": args.output_master}]
+        for i, (input_sub, output_sub) in enumerate(zip(args.input_sub, args.output_sub)):
+            name = "sub" if len(args.input_sub) == 1 else "sub{}".format(i + 1)
+            devices.append({"name": name, "input": input_sub, "output": output_sub})
 
+    replay = {"timing": args.replay_timing, "fps": args.replay_fps, "loop": args.replay_loop}
     app = QApplication()
-    w = Window(args.input_master, args.input_sub, args.output_master, args.output_sub)
+    w = Window(devices, RecorderSettings.from_args(args, replay_options=replay, preview_mode=args.preview))
     w.show()
     sys.exit(app.exec())
\ No newline at end of file
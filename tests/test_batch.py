@@ -0,0 +1,72 @@
+import os
+import json
+import cv2
+import numpy as np
+from azure_kinect_batch import CACHE_NAME, STATS_NAME, ConvertDepth, DepthStats, Thumbnails, jpeg_size, run_batch
+from azure_kinect_depth_codec import read_depth
+
+
+def capture_folder(folder, shots=3):
+    for subdir in ("color", "depth/raw", "depth/mean_30"):
+        os.makedirs(os.path.join(folder, subdir))
+    for shot in range(1, shots + 1):
+        cv2.imwrite(os.path.join(folder, "color", "{}.jpg".format(shot)), np.full((120, 160, 3), shot * 20, dtype=np.uint8))
+        for stream in ("raw", "mean_30"):
+            depth = np.full((60, 80), 1000 + shot, dtype=np.uint16)
+            depth[0] = 0
+            cv2.imwrite(os.path.join(folder, "depth", stream, "{}.png".format(shot)), depth)
+
+
+def tasks():
+    return [Thumbnails(40), ConvertDepth("rvl"), DepthStats()]
+
+
+def test_outputs_of_every_task(tmp_path):
+    folder = str(tmp_path)
+    capture_folder(folder)
+    assert run_batch(folder, tasks(), workers=1) == (3, 0, 0, 0)
+    assert cv2.imread(os.path.join(folder, "thumbnails", "1.jpg")).shape == (30, 40, 3)
+    depth = read_depth(os.path.join(folder, "converted", "depth", "mean_30", "2.rvl"))
+    np.testing.assert_array_equal(depth, cv2.imread(os.path.join(folder, "depth", "mean_30", "2.png"), cv2.IMREAD_UNCHANGED))
+    with open(os.path.join(folder, STATS_NAME)) as f:
+        stats = [json.loads(line) for line in f]
+    assert [record["shot"] for record in stats] == ["1", "2", "3"]
+    assert stats[0]["depth"]["raw"] == {"valid": round(59 / 60, 4), "min": 1001, "max": 1001, "mean": 1001.0}
+
+
+def test_second_run_skips_processed_shots(tmp_path):
+    folder = str(tmp_path)
+    capture_folder(folder)
+    run_batch(folder, tasks(), workers=1)
+    assert run_batch(folder, tasks(), workers=1) == (0, 3, 0, 0)
+    # Copied or touched: hashed again, found unchanged
+    os.utime(os.path.join(folder, "color", "1.jpg"), (1, 1))
+    # Rewritten with other content
+    depth = np.full((60, 80), 2000, dtype=np.uint16)
+    cv2.imwrite(os.path.join(folder, "depth", "raw", "2.png"), depth)
+    # Output removed
+    os.remove(os.path.join(folder, "thumbnails", "3.jpg"))
+    assert run_batch(folder, tasks(), workers=1) == (3, 0, 1, 0)
+    with open(os.path.join(folder, STATS_NAME)) as f:
+        assert json.loads(f.readlines()[1])["depth"]["raw"]["min"] == 2000
+    assert os.path.isfile(os.path.join(folder, "thumbnails", "3.jpg"))
+    # Other parameters: processed again, the other tasks stay cached
+    assert run_batch(folder, [Thumbnails(80), DepthStats()], workers=1) == (3, 0, 0, 0)
+    assert run_batch(folder, tasks(), workers=1, force=True) == (3, 0, 0, 0)
+
+
+def test_failed_shots_are_retried(tmp_path):
+    folder = str(tmp_path)
+    capture_folder(folder, shots=2)
+    with open(os.path.join(folder, "color", "2.jpg"), "wb") as f:
+        f.write(b"not a jpeg")
+    assert run_batch(folder, [Thumbnails(40)], workers=1) == (1, 0, 0, 1)
+    with open(os.path.join(folder, CACHE_NAME)) as f:
+        assert list(json.load(f).popitem()[1]) == ["1"]
+    assert run_batch(folder, [Thumbnails(40)], workers=1) == (0, 1, 0, 1)
+
+
+def test_jpeg_size():
+    ok, blob = cv2.imencode(".jpg", np.zeros((48, 64, 3), dtype=np.uint8))
+    assert jpeg_size(blob.tobytes()) == (64, 48)
+    assert jpeg_size(b"\xff\xd8\x00") is None
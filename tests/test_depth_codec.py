@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from azure_kinect_depth_codec import PngCodec, RvlCodec, read_depth
+
+
+def full_range():
+    # Largest deltas both ways, and invalid pixels between valid ones
+    depth = np.zeros((4, 6), dtype=np.uint16)
+    depth[0] = [1, 65535, 1, 65535, 0, 65535]
+    depth[1] = np.arange(65530, 65536)
+    depth[3, 5] = 65535
+    return depth
+
+
+FRAMES = {
+    "all-zero": np.zeros((48, 64), dtype=np.uint16),
+    "full-range": full_range(),
+    "random": np.random.default_rng(0).integers(0, 65536, (48, 64), dtype=np.uint16),
+    "1x1": np.array([[1234]], dtype=np.uint16),
+    "1x1-zero": np.zeros((1, 1), dtype=np.uint16),
+    "empty": np.zeros((0, 0), dtype=np.uint16),
+    "empty-rows": np.zeros((0, 64), dtype=np.uint16),
+}
+
+
+@pytest.mark.parametrize("name", FRAMES)
+def test_rvl_round_trip(name):
+    depth = FRAMES[name]
+    codec = RvlCodec()
+    decoded = codec.decode(codec.encode(depth))
+    assert decoded.dtype == np.uint16
+    np.testing.assert_array_equal(decoded, depth)
+
+
+@pytest.mark.parametrize("codec", [PngCodec(), RvlCodec()])
+def test_read_depth(tmp_path, codec):
+    depth = FRAMES["full-range"]
+    path = str(tmp_path / ("depth" + codec.extension))
+    codec.write(path, depth)
+    np.testing.assert_array_equal(read_depth(path), depth)
+
+
+def test_rvl_rejects_other_frames():
+    codec = RvlCodec()
+    with pytest.raises(ValueError):
+        codec.encode(np.zeros((4, 4), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        codec.decode(PngCodec().encode(FRAMES["1x1"]).ljust(RvlCodec.HEADER.size, b"\0"))
@@ -0,0 +1,82 @@
+import warnings
+import numpy as np
+import pytest
+import azure_kinect_depth_filters
+from azure_kinect_depth_filters import apply_filters, make_filters
+from azure_kinect_depth_window import RunningDepthWindow
+
+
+def window_of(frames, maxlen):
+    window = RunningDepthWindow(maxlen)
+    for frame in frames:
+        window.append(frame)
+    return window
+
+
+def random_frames(count, seed, shape=(24, 32)):
+    # Valid depth around 1 m with noise, outliers and invalid (0) samples
+    rng = np.random.default_rng(seed)
+    frames = rng.normal(1000, 20, (count,) + shape)
+    frames[rng.random(frames.shape) < 0.05] = 3000
+    frames[rng.random(frames.shape) < 0.3] = 0
+    # Pixels without any valid sample
+    frames[:, 0, :4] = 0
+    return list(frames.astype(np.uint16))
+
+
+def reference(name, stack, threshold):
+    # Straight numpy over the stacked window, invalid samples as NaN
+    valid = stack != 0
+    samples = np.where(valid, stack, np.nan)
+    with warnings.catch_warnings():
+        # All-NaN pixels, 0 below
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(samples, axis=0)
+    if name == "mean":
+        result = stack.sum(axis=0) / len(stack)
+    elif name == "valid_mean":
+        result = np.nansum(samples, axis=0) / np.maximum(valid.sum(axis=0), 1)
+    elif name == "median":
+        result = median
+    else:
+        inliers = valid & (np.abs(stack - median) <= threshold)
+        result = np.where(inliers, stack, 0).sum(axis=0) / np.maximum(inliers.sum(axis=0), 1)
+    return np.nan_to_num(np.floor(result)).astype(np.uint16)
+
+
+@pytest.mark.parametrize("name", ["mean", "valid_mean", "median", "robust_mean"])
+@pytest.mark.parametrize("count, maxlen", [(1, 5), (4, 5), (5, 5), (12, 5), (9, 8)])
+def test_filters_match_numpy(name, count, maxlen):
+    frames = random_frames(count, seed=count * 10 + maxlen)
+    window = window_of(frames, maxlen)
+    stack = np.stack(frames[-maxlen:]).astype(np.float64)
+    result = apply_filters(make_filters([name], outlier_threshold=30), window)
+    assert list(result) == ["{}_{}".format(name, maxlen)]
+    np.testing.assert_array_equal(result["{}_{}".format(name, maxlen)], reference(name, stack, 30))
+
+
+@pytest.mark.parametrize("name", ["median", "robust_mean"])
+def test_chunked_filters_match_numpy(monkeypatch, name):
+    # A few rows per chunk, the last one shorter
+    monkeypatch.setattr(azure_kinect_depth_filters, "CHUNK_BYTES", 7 * 6 * 32 * 2)
+    frames = random_frames(6, seed=1)
+    window = window_of(frames, 6)
+    result = make_filters([name], outlier_threshold=10)[0].compute(window)
+    np.testing.assert_array_equal(result, reference(name, np.stack(frames).astype(np.float64), 10))
+
+
+@pytest.mark.parametrize("name", ["mean", "valid_mean"])
+def test_frozen_window_keeps_its_frames(name):
+    frames = random_frames(8, seed=2)
+    window = window_of(frames[:6], 5)
+    frozen = window.freeze()
+    # Later frames only move the live window
+    window.append(frames[6])
+    window.append(frames[7])
+    result = make_filters([name])[0].compute(frozen)
+    np.testing.assert_array_equal(result, reference(name, np.stack(frames[1:6]).astype(np.float64), 30))
+
+
+def test_unknown_filter():
+    with pytest.raises(ValueError):
+        make_filters(["mode"])
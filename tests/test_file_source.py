@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from PySide6.QtCore import QCoreApplication
+from azure_kinect_file_source import FileFrameSource
+from azure_kinect_stream_files import publish_pair, read_metadata
+
+
+@pytest.fixture(scope="module")
+def app():
+    # QFileSystemWatcher needs an application object
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def publish(folder, sequence, slots):
+    color = np.full((8, 8, 3), sequence, dtype=np.uint8)
+    depth = np.full((8, 8), sequence * 100, dtype=np.uint16)
+    return publish_pair(str(folder), sequence, slots, color, depth, sequence * 1000, 0)
+
+
+def test_reads_new_pairs_with_two_slots(app, tmp_path):
+    source = FileFrameSource(str(tmp_path))
+    publish(tmp_path, 1, 2)
+    sequence, timestamp_usec, color, depth = source.read_frame()
+    assert (sequence, timestamp_usec) == (1, 1000)
+    assert depth[0, 0] == 100 and depth.dtype == np.uint16
+    # Same pair again: nothing new
+    assert source.read_pair(read_metadata(str(tmp_path))) is None
+    publish(tmp_path, 2, 2)
+    publish(tmp_path, 3, 2)
+    assert source.read_pair(read_metadata(str(tmp_path)))[0] == 3
+    assert source.dropped == 1
+
+
+def test_rejects_pair_the_streamer_may_be_rewriting(app, tmp_path):
+    source = FileFrameSource(str(tmp_path))
+    first = publish(tmp_path, 1, 3)
+    publish(tmp_path, 2, 3)
+    # One frame behind with 3 slots: the slot of 1 is not reused yet
+    assert source.read_pair(first)[0] == 1
+    source.last_sequence = 0
+    publish(tmp_path, 3, 3)
+    # Two frames behind: the streamer may be writing into it
+    assert source.read_pair(first) is None
+
+
+@pytest.mark.parametrize("slots", [0, 1])
+def test_too_few_slots(tmp_path, slots):
+    with pytest.raises(ValueError):
+        publish(tmp_path, 1, slots)
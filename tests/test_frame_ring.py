@@ -0,0 +1,104 @@
+import pytest
+from azure_kinect_frame_ring import FrameRing
+
+
+def fill(ring, first, count):
+    completed = []
+    for sequence in range(first, first + count):
+        completed += ring.append(sequence * 1000, sequence, "color", "depth")
+    return completed
+
+
+def sequences(entries):
+    return [entry[1] for entry in entries]
+
+
+def test_ring_keeps_the_newest_frames():
+    ring = FrameRing(3)
+    assert ring.items() == [] and ring.latest() == []
+    fill(ring, 1, 5)
+    assert sequences(ring.items()) == [3, 4, 5]
+    assert sequences(ring.latest(2)) == [4, 5]
+    ring.clear()
+    assert ring.items() == []
+
+
+def test_trigger_completes_after_post_frames():
+    ring = FrameRing(4)
+    fill(ring, 1, 3)
+    trigger = ring.arm(pre=2, post=3)
+    assert sequences(trigger.pre) == [2, 3]
+    assert fill(ring, 4, 2) == [] and not trigger.done()
+    assert fill(ring, 6, 1) == [trigger]
+    # Completed by whoever appended the last frame
+    trigger.complete(ring.items(), None)
+    assert trigger.wait(0) is trigger
+    assert sequences(trigger.recent) == [3, 4, 5, 6]
+    # Not counted any more
+    assert fill(ring, 7, 5) == []
+
+
+def test_burst_keeps_the_post_frames():
+    ring = FrameRing(2)
+    fill(ring, 1, 2)
+    trigger = ring.arm(pre=2, post=4, keep_post=True)
+    fill(ring, 3, 4)
+    assert sequences(trigger.frames()) == [1, 2, 3, 4, 5, 6]
+
+
+def test_immediate_and_cancelled_triggers():
+    ring = FrameRing(2)
+    fill(ring, 1, 1)
+    # Completed by the caller, never by the ring
+    assert ring.arm(pre=1, post=0).pre == ring.latest()
+    assert ring.triggers == []
+    trigger = ring.arm(pre=1, post=2)
+    ring.cancel(trigger)
+    assert fill(ring, 2, 2) == []
+
+
+def test_flushed_triggers_stop_counting():
+    ring = FrameRing(2)
+    trigger = ring.arm(pre=1, post=5)
+    fill(ring, 1, 2)
+    assert ring.flush() == [trigger] and ring.triggers == []
+    assert fill(ring, 3, 5) == [] and trigger.remaining == 3
+
+
+def test_trigger_times_out():
+    ring = FrameRing(2)
+    trigger = ring.arm(pre=1, post=2)
+    fill(ring, 1, 1)
+    with pytest.raises(RuntimeError, match="1 frames still missing"):
+        trigger.wait(0.01)
+
+
+def test_shot_is_taken_from_the_frames_on_screen():
+    ring = FrameRing(3)
+    fill(ring, 1, 4)
+    trigger = ring.arm(pre=1, post=2)
+    fill(ring, 5, 2)
+    trigger.complete(ring.items(), None)
+    # The newest frame at the press, not the ones received after it
+    assert sequences(trigger.shot_frames()) == [2, 3, 4]
+    # Nothing on screen yet: the first frames received
+    empty = FrameRing(3)
+    trigger = empty.arm(pre=1, post=1)
+    fill(empty, 1, 1)
+    trigger.complete(empty.items(), None)
+    assert sequences(trigger.shot_frames()) == [1]
+
+
+def test_depth_window_ends_at_the_frames_on_screen():
+    ring = FrameRing(3)
+    fill(ring, 1, 2)
+    trigger = ring.arm(pre=1, post=2, depth_window="window at the press")
+    fill(ring, 3, 2)
+    trigger.complete(ring.items(), "window at completion")
+    assert trigger.depth_window == "window at the press"
+    # Nothing on screen yet: the window of the first frames received
+    empty = FrameRing(3)
+    trigger = empty.arm(pre=1, post=1, depth_window="empty window")
+    fill(empty, 1, 1)
+    trigger.complete(empty.items(), "window at completion")
+    assert trigger.depth_window == "window at completion"
@@ -0,0 +1,170 @@
+import threading
+import pytest
+from PySide6.QtCore import QCoreApplication
+from azure_kinect_camera import CameraRGBD
+from azure_kinect_control import send
+from azure_kinect_depth_window import RunningDepthWindow
+from azure_kinect_frame_ring import FrameRing
+from azure_kinect_headless import HeadlessRecorder
+from azure_kinect_metrics import CameraMetrics, Metrics
+from azure_kinect_volumes import VolumeSet
+
+
+@pytest.fixture(scope="module")
+def app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+class Camera:
+    # The parts of CameraRGBD the recorder drives
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.volumes = VolumeSet([output_dir], reserve_mb=0)
+        self.metrics = CameraMetrics("headless", Metrics())
+        self.running = False
+        self.shots = 0
+        self.saved = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def isRunning(self):
+        return self.running
+
+    def start(self):
+        self.running = True
+
+    def wait(self, timeout=None):
+        self.running = False
+        return True
+
+    def reserve_frame_number(self):
+        self.shots += 1
+        return self.shots
+
+    def arm_trigger(self):
+        return None
+
+    def save_frames(self, number, trigger):
+        self.release.wait()
+        if number == 2:
+            raise IOError("disk full")
+        self.saved.append(number)
+
+    def flush_triggers(self):
+        pass
+
+    def close_output(self):
+        self.volumes.close()
+
+
+class TriggeredCamera(Camera):
+    # Shots waiting for frames on a real ring
+    flush_triggers = CameraRGBD.flush_triggers
+    wait_trigger = CameraRGBD.wait_trigger
+
+    def __init__(self, output_dir):
+        Camera.__init__(self, output_dir)
+        self.lock = threading.Lock()
+        self.ring = FrameRing(2)
+        self.depth_queue = RunningDepthWindow(5)
+
+    def arm_trigger(self):
+        return self.ring.arm(pre=1, post=30)
+
+    def save_frames(self, number, trigger):
+        self.saved.append([entry[1] for entry in self.wait_trigger(trigger).shot_frames()])
+
+
+@pytest.fixture
+def recorder(app, tmp_path):
+    recorder = HeadlessRecorder(Camera(str(tmp_path)), save_queue=2)
+    yield recorder
+    recorder.close()
+
+
+def command(recorder, app, line):
+    # Answer of one command, running the event loop until it is sent
+    replies = []
+    recorder.handle(line.split(), replies.append)
+    while not replies:
+        app.processEvents()
+    return replies[0]
+
+
+def test_trigger_needs_a_running_capture(recorder, app):
+    assert command(recorder, app, "trigger") == {"ok": False, "error": "not capturing, send start first"}
+    assert command(recorder, app, "start") == {"ok": True, "running": True}
+    assert command(recorder, app, "trigger") == {"ok": True, "shot": 1}
+    assert command(recorder, app, "stop") == {"ok": True, "running": False}
+    assert not command(recorder, app, "status")["running"]
+
+
+def test_trigger_wait_answers_once_saved_or_failed(recorder, app):
+    command(recorder, app, "start")
+    assert command(recorder, app, "trigger wait") == {"ok": True, "shot": 1}
+    reply = command(recorder, app, "trigger wait")
+    assert (reply["ok"], reply["shot"], reply["error"]) == (False, 2, "OSError: disk full")
+    status = command(recorder, app, "status")
+    assert (status["saved"], status["failed"], status["last_saved"]) == (1, 1, "1")
+    assert status["last_error"] == "2: OSError: disk full"
+
+
+def test_stop_saves_the_shots_waiting_for_frames(app, tmp_path):
+    recorder = HeadlessRecorder(TriggeredCamera(str(tmp_path)))
+    camera = recorder.camera
+    command(recorder, app, "start")
+    camera.ring.append(1000, 1, "color", "depth")
+    replies = []
+    recorder.handle(["trigger", "wait"], replies.append)
+    # Taken from the frames received, without waiting for the missing ones
+    assert command(recorder, app, "stop") == {"ok": True, "running": False}
+    while not replies:
+        app.processEvents()
+    assert replies == [{"ok": True, "shot": 1}] and camera.saved == [[1]]
+    recorder.close()
+
+
+def test_full_save_queue_is_refused(recorder, app):
+    command(recorder, app, "start")
+    recorder.camera.release.clear()
+    command(recorder, app, "trigger")
+    command(recorder, app, "trigger")
+    assert command(recorder, app, "trigger") == {"ok": False, "error": "save queue is full (2 shots)"}
+    recorder.camera.release.set()
+
+
+def test_trigger_refused_when_the_volumes_are_full(recorder, app):
+    command(recorder, app, "start")
+    recorder.camera.volumes.paused = True
+    assert command(recorder, app, "trigger") == {"ok": False, "error": "all output volumes are full"}
+    assert command(recorder, app, "status")["volumes"][0]["full"] is False
+
+
+def test_unknown_command_and_quit(recorder, app):
+    assert not command(recorder, app, "shoot")["ok"]
+    # Case insensitive
+    assert command(recorder, app, "START")["ok"]
+    assert command(recorder, app, "quit") == {"ok": True}
+    assert command(recorder, app, "status") == {"ok": False, "error": "quitting"}
+    app.processEvents()
+    assert recorder.closed and not recorder.camera.isRunning()
+
+
+def test_control_client_reaches_every_rig(app, tmp_path):
+    socket_path = str(tmp_path / "kinect.sock")
+    first = HeadlessRecorder(Camera(str(tmp_path)), socket_path=socket_path)
+    second = HeadlessRecorder(Camera(str(tmp_path)), port=0)
+    port = second.server.servers[0].serverPort()
+    rigs = [socket_path, str(port), str(tmp_path / "gone.sock")]
+    replies = {}
+    client = threading.Thread(target=lambda: replies.update(send(rigs, ["start"], timeout=5)))
+    client.start()
+    while client.is_alive():
+        app.processEvents()
+    client.join()
+    assert replies[socket_path] == {"ok": True, "running": True}
+    assert replies[str(port)] == {"ok": True, "running": True}
+    assert not replies[rigs[2]]["ok"] and "unable to connect" in replies[rigs[2]]["error"]
+    assert first.camera.isRunning() and second.camera.isRunning()
+    first.close()
+    second.close()
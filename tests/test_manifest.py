@@ -0,0 +1,66 @@
+import os
+from azure_kinect_manifest import MANIFEST_NAME, TAIL_BYTES, Manifest, list_shots, load_manifest, shot_files
+
+
+def append(manifest, shot):
+    return manifest.append(shot, shot_files(str(shot), ["color", "depth/raw"]))
+
+
+def test_resume_after_highest_shot(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    assert [manifest.reserve() for _ in range(3)] == [1, 2, 3]
+    # Saved by a pool: records out of order
+    for shot in (2, 3, 1):
+        append(manifest, shot)
+
+    resumed = Manifest(str(tmp_path))
+    assert resumed.next_shot == 4
+    assert [record["shot"] for record in load_manifest(str(tmp_path))] == [2, 3, 1]
+    assert [name for _, name in list_shots(str(tmp_path))] == ["2", "3", "1"]
+
+
+def test_resume_after_torn_record(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    append(manifest, 1)
+    append(manifest, 2)
+    # Interrupted while writing the next record
+    with open(os.path.join(str(tmp_path), MANIFEST_NAME), "a") as f:
+        f.write('{"shot": 3, "fi')
+
+    assert Manifest(str(tmp_path)).next_shot == 3
+    assert len(load_manifest(str(tmp_path))) == 2
+
+
+def test_append_after_torn_record(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    append(manifest, 1)
+    with open(manifest.path, "a") as f:
+        f.write('{"shot": 2, "fi')
+
+    resumed = Manifest(str(tmp_path))
+    append(resumed, resumed.reserve())
+    append(resumed, resumed.reserve())
+    assert [record["shot"] for record in load_manifest(str(tmp_path))] == [1, 2, 3]
+
+
+def test_resume_reads_only_the_tail(tmp_path):
+    manifest = Manifest(str(tmp_path))
+    shot = 0
+    while not os.path.isfile(manifest.path) or os.path.getsize(manifest.path) < 3 * TAIL_BYTES:
+        shot += 1
+        append(manifest, shot)
+
+    assert Manifest(str(tmp_path)).next_shot == shot + 1
+
+
+def test_resume_without_manifest(tmp_path):
+    # Recorded before the manifest existed
+    os.makedirs(str(tmp_path / "color"))
+    for name in ("1", "2"):
+        (tmp_path / "color" / (name + ".jpg")).write_bytes(b"")
+
+    manifest = Manifest(str(tmp_path))
+    assert manifest.next_shot == 3
+    # Ids chosen by the caller move the counter
+    append(manifest, 7)
+    assert manifest.reserve() == 8
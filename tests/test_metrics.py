@@ -0,0 +1,83 @@
+import urllib.request
+import pytest
+from azure_kinect_metrics import BUCKETS, CameraMetrics, Metrics, MetricsExporter, overlay_text, quantile, render
+
+
+def test_render_counters_gauges_and_histograms():
+    registry = Metrics()
+    registry.counter("kinect_frames_total", "Frames", camera="master").inc(3)
+    registry.gauge("kinect_queue_depth", "Queues", fn=lambda: 2, camera='a "b"', queue="save")
+    histogram = registry.histogram("kinect_stage_seconds", "Stages", camera="master", stage="save")
+    histogram.observe(0.0002)
+    histogram.observe(0.003)
+    lines = render(registry.snapshot()).splitlines()
+
+    assert 'kinect_frames_total{camera="master"} 3' in lines
+    assert 'kinect_queue_depth{camera="a \\"b\\"",queue="save"} 2' in lines
+    assert "# TYPE kinect_stage_seconds histogram" in lines
+    buckets = [line for line in lines if line.startswith("kinect_stage_seconds_bucket")]
+    assert len(buckets) == len(BUCKETS) + 1
+    # Cumulative counts, the last bucket holding every observation
+    assert buckets[0].endswith(" 1") and buckets[-1] == 'kinect_stage_seconds_bucket{camera="master",stage="save",le="+Inf"} 2'
+    assert 'kinect_stage_seconds_count{camera="master",stage="save"} 2' in lines
+
+
+def test_snapshots_of_several_processes_are_merged():
+    first, second = Metrics(), Metrics()
+    CameraMetrics("master", first).frames.inc()
+    CameraMetrics("sub", second).frames.inc(2)
+    text = render(first.snapshot(), second.snapshot())
+    assert text.count("# TYPE kinect_frames_total counter") == 1
+    assert 'kinect_frames_total{camera="master"} 1' in text and 'kinect_frames_total{camera="sub"} 2' in text
+
+
+def test_metric_kinds_and_gone_owners():
+    registry = Metrics()
+    registry.counter("kinect_shots_total", "Shots")
+    with pytest.raises(ValueError):
+        registry.gauge("kinect_shots_total", "Shots")
+
+    def gone():
+        raise AttributeError("closed")
+
+    registry.gauge("kinect_queue_depth", "Queues", fn=gone, queue="record")
+    assert dict((name, samples) for name, _, _, samples in registry.snapshot())["kinect_queue_depth"] == []
+
+
+def test_quantile():
+    counts = [0] * (len(BUCKETS) + 1)
+    assert quantile(counts, 0.5) is None
+    counts[4] = 10
+    assert BUCKETS[3] < quantile(counts, 0.5) < quantile(counts, 0.99) <= BUCKETS[4]
+
+
+def test_overlay_shows_the_last_interval():
+    registry = Metrics()
+    metrics = CameraMetrics("master", registry)
+    metrics.queue("save", lambda: 1)
+    metrics.observe("capture", 0.5)
+    metrics.frames.inc(10)
+    previous = registry.snapshot()
+    for _ in range(30):
+        metrics.observe("capture", 0.002)
+    metrics.frames.inc(30)
+    text = overlay_text("master", registry.snapshot(), previous, 1.0)
+    capture = [line for line in text.splitlines() if line.startswith("capture")][0]
+    # The slow frame before the interval is left out
+    assert float(capture.split()[2]) < 3
+    assert "30.0 fps, 0 dropped" in text and "save 1" in text
+
+
+def test_exporter_file_and_http(tmp_path):
+    registry = Metrics()
+    registry.counter("kinect_shots_total", "Shots", camera="master").inc()
+    path = str(tmp_path / "kinect.prom")
+    exporter = MetricsExporter(registry.snapshot, path=path, port=0, interval=60)
+    try:
+        url = "http://127.0.0.1:{}/metrics".format(exporter.server.server_address[1])
+        with urllib.request.urlopen(url) as response:
+            assert 'kinect_shots_total{camera="master"} 1' in response.read().decode()
+    finally:
+        exporter.close()
+    with open(path) as f:
+        assert f.read() == exporter.text()
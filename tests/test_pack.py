@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from azure_kinect_depth_codec import RvlCodec
+from azure_kinect_pack import PackReader, PackWriter
+
+
+def frames(seed):
+    rng = np.random.default_rng(seed)
+    color = rng.integers(0, 255, (48, 64, 3), dtype=np.uint8)
+    depth = rng.integers(0, 5000, (48, 64), dtype=np.uint16)
+    return color, depth, {"mean_30": depth // 2}
+
+
+@pytest.mark.parametrize("raw, depth_codec", [(True, None), (False, None), (False, RvlCodec())])
+def test_round_trip(tmp_path, raw, depth_codec):
+    base = str(tmp_path / "session")
+    writer = PackWriter(base, raw=raw, depth_codec=depth_codec)
+    for i in range(3):
+        assert writer.write_shot(str(i), *frames(i)) > 0
+    writer.close()
+
+    reader = PackReader(base + ".pack")
+    assert reader.names() == ["0", "1", "2"]
+    for i in range(3):
+        color, depth, filtered = frames(i)
+        shot = reader.get(str(i))
+        assert sorted(shot) == ["color", "depth/mean_30", "depth/raw"]
+        # Depth is lossless in every encoding, color only raw
+        np.testing.assert_array_equal(shot["depth/raw"], depth)
+        np.testing.assert_array_equal(shot["depth/mean_30"], filtered["mean_30"])
+        if raw:
+            np.testing.assert_array_equal(shot["color"], color)
+        else:
+            assert shot["color"].shape == color.shape
+    reader.close()
+
+
+def test_close_with_live_raw_arrays(tmp_path):
+    base = str(tmp_path / "session")
+    writer = PackWriter(base, raw=True)
+    writer.write_shot("1", *frames(1))
+    writer.close()
+
+    reader = PackReader(base)
+    shot = reader.get("1")
+    # Views of the mapping are alive: close must still release the file
+    reader.close()
+    assert reader.file.closed
+    np.testing.assert_array_equal(shot["depth/raw"], frames(1)[1])
+
+
+def test_unindexed_tail_is_ignored(tmp_path):
+    base = str(tmp_path / "session")
+    writer = PackWriter(base, raw=True)
+    writer.write_shot("1", *frames(1))
+    writer.close()
+    # Crash while writing the next shot: partial index record
+    with open(base + ".idx", "ab") as f:
+        f.write(b"\0" * 10)
+
+    reader = PackReader(base)
+    assert reader.names() == ["1"]
+    reader.close()
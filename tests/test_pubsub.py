@@ -0,0 +1,96 @@
+import threading
+import numpy as np
+import pytest
+from azure_kinect_depth_codec import RvlCodec
+from azure_kinect_pubsub import HEADER, FramePublisher, FrameSubscriber, Subscriber, decode_payload, encode_frame
+
+
+def frames():
+    # Smooth color, which jpeg keeps close
+    y, x = np.mgrid[0:24, 0:32]
+    color = np.dstack([x * 8, y * 10, x * 4 + y * 4]).astype(np.uint8)
+    depth = np.random.default_rng(0).integers(0, 5000, (12, 16), dtype=np.uint16)
+    return color, depth
+
+
+def decode(message):
+    header, color_payload, depth_payload = (bytes(part) for part in message)
+    fields = HEADER.unpack(header)
+    (_, color_encoding, depth_encoding, channels, sequence, timestamp_usec, device,
+     color_width, color_height, depth_width, depth_height, color_size, depth_size) = fields
+    assert (color_size, depth_size) == (len(color_payload), len(depth_payload))
+    return (sequence, timestamp_usec, device,
+            decode_payload(color_payload, color_encoding, color_width, color_height, channels),
+            decode_payload(depth_payload, depth_encoding, depth_width, depth_height))
+
+
+@pytest.mark.parametrize("encoding, depth_codec", [("raw", None), ("compressed", None), ("compressed", RvlCodec())])
+def test_frame_round_trip(encoding, depth_codec):
+    color, depth = frames()
+    sequence, timestamp_usec, device, decoded_color, decoded_depth = decode(
+        encode_frame(7, 123456, None, color, depth, encoding, depth_codec))
+    assert (sequence, timestamp_usec, device) == (7, 123456, -1)
+    # Depth is lossless in every encoding, color only raw
+    np.testing.assert_array_equal(decoded_depth, depth)
+    if encoding == "raw":
+        np.testing.assert_array_equal(decoded_color, color)
+    else:
+        assert decoded_color.shape == color.shape
+        assert np.abs(decoded_color.astype(int) - color).mean() < 4
+
+
+class StalledConnection:
+    # A subscriber that stopped reading: sendall blocks until released
+    def __init__(self):
+        self.sending = threading.Event()
+        self.release = threading.Event()
+
+    def sendall(self, data):
+        self.sending.set()
+        self.release.wait()
+
+    def shutdown(self, how):
+        pass
+
+    def close(self):
+        self.release.set()
+
+
+def test_slow_subscriber_loses_its_oldest_frames():
+    connection = StalledConnection()
+    subscriber = Subscriber(connection, "slow", queue_size=2)
+    subscriber.put([b"1"])
+    assert connection.sending.wait(5)
+    for sequence in (2, 3, 4, 5):
+        # Never waits for the subscriber
+        subscriber.put([str(sequence).encode()])
+    assert subscriber.dropped == 2
+    assert list(subscriber.queue) == [[b"4"], [b"5"]]
+    subscriber.close()
+    subscriber.thread.join(5)
+
+
+def test_publisher_serves_every_subscriber(tmp_path):
+    address = str(tmp_path / "kinect.sock")
+    publisher = FramePublisher(address)
+    subscribers = [FrameSubscriber(address, retry_interval=0.01) for _ in range(2)]
+    color, depth = frames()
+    received = [None, None]
+    sequence = 0
+    while None in received and sequence < 1000:
+        sequence += 1
+        publisher.publish(sequence, sequence * 1000, 2, color, depth)
+        for i, subscriber in enumerate(subscribers):
+            received[i] = received[i] or subscriber.read_frame(timeout=0.01)
+    for subscriber in subscribers:
+        subscriber.close()
+    publisher.close()
+    for frame, subscriber in zip(received, subscribers):
+        assert frame[1] == frame[0] * 1000 and subscriber.device == 2
+        np.testing.assert_array_equal(frame[2], color)
+        np.testing.assert_array_equal(frame[3], depth)
+
+
+def test_unknown_encoding(tmp_path):
+    with pytest.raises(ValueError):
+        FramePublisher(str(tmp_path / "kinect.sock"), encoding="h264")
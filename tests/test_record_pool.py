@@ -0,0 +1,73 @@
+import os
+import threading
+import numpy as np
+import pytest
+from azure_kinect_record_pool import BLOCK, DROP_OLDEST, RecordingEncoder
+
+
+def frame(index):
+    return np.full((8, 8, 3), index, dtype=np.uint8), np.full((8, 8), index, dtype=np.uint16)
+
+
+def test_every_frame_is_encoded(tmp_path):
+    encoder = RecordingEncoder(str(tmp_path), workers=2, queue_size=4, drop_policy=BLOCK)
+    encoder.start()
+    for index in range(10):
+        assert encoder.put(*frame(index))
+    stats = encoder.stop()
+    assert (stats["captured"], stats["encoded"], stats["dropped"], stats["queued"]) == (10, 10, 0, 0)
+    assert len(os.listdir(os.path.join(encoder.session_dir, "color"))) == 10
+    assert len(os.listdir(os.path.join(encoder.session_dir, "depth"))) == 10
+
+
+def test_drop_oldest_keeps_the_newest_frames(tmp_path):
+    encoder = RecordingEncoder(str(tmp_path), workers=1, queue_size=2, drop_policy=DROP_OLDEST)
+    # Encoders not running yet: the queue fills up
+    assert [encoder.put(*frame(index)) for index in range(5)] == [True, True, False, False, False]
+    assert encoder.stats()["dropped"] == 3
+    encoder.start()
+    stats = encoder.stop()
+    assert (stats["captured"], stats["encoded"], stats["dropped"]) == (5, 2, 3)
+    assert sorted(os.listdir(os.path.join(encoder.session_dir, "color"))) == ["000004.jpg", "000005.jpg"]
+
+
+def test_unknown_drop_policy(tmp_path):
+    with pytest.raises(ValueError):
+        RecordingEncoder(str(tmp_path), drop_policy="drop-newest")
+
+
+@pytest.mark.parametrize("drop_policy", [DROP_OLDEST, BLOCK])
+def test_every_captured_frame_is_encoded_or_dropped(tmp_path, drop_policy):
+    encoder = RecordingEncoder(str(tmp_path), workers=2, queue_size=2, drop_policy=drop_policy)
+    encoder.start()
+    color = np.zeros((8, 8, 3), dtype=np.uint8)
+    depth = np.zeros((8, 8), dtype=np.uint16)
+    done = threading.Event()
+
+    def capture():
+        # Keeps putting while and after the recorder stops, like the capture thread
+        while not done.is_set():
+            encoder.put(color, depth)
+
+    threads = [threading.Thread(target=capture) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    while encoder.stats()["encoded"] < 20:
+        pass
+    encoder.stop()
+    done.set()
+    for thread in threads:
+        thread.join()
+    stats = encoder.stats()
+    assert stats["queued"] == 0
+    assert stats["captured"] == stats["encoded"] + stats["dropped"]
+
+
+def test_sessions_started_together_get_their_own_folder(tmp_path):
+    first = RecordingEncoder(str(tmp_path), workers=1)
+    second = RecordingEncoder(str(tmp_path), workers=1)
+    first.start()
+    second.start()
+    assert first.session_dir != second.session_dir
+    first.stop()
+    second.stop()
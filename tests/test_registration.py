@@ -0,0 +1,90 @@
+import math
+import cv2
+import numpy as np
+import pytest
+from azure_kinect_calibration import Calibration, Intrinsics, nominal_calibration, rotation_x
+from azure_kinect_mock import synthetic_depth
+from azure_kinect_registration import DepthRegistration
+
+
+def calibrated(depth_size, color_size):
+    # Distorted cameras and an off-axis mounting, unlike the nominal calibration
+    nominal = nominal_calibration(depth_size, color_size)
+    depth, color = nominal.depth, nominal.color
+    angle = math.radians(2.0)
+    rotation = [math.cos(angle), 0.0, math.sin(angle)] + [0.0, 1.0, 0.0] + [-math.sin(angle), 0.0, math.cos(angle)]
+    rotation = (np.array(rotation).reshape(3, 3) @ np.array(rotation_x(-6.0)).reshape(3, 3)).ravel().tolist()
+    return Calibration(depth._replace(cx=depth.cx + 1.5), color._replace(fy=color.fy * 1.02), rotation, [-32.0, 1.5, 4.0],
+                       [0.1, -0.05, 0.001, 0.0, 0.01], [0.05, -0.02, 0.0, 0.001])
+
+
+def reference(depth, color_size, calibration):
+    # Straight per-pixel loop over OpenCV, same cells, z-buffer and hole filling
+    d, c = calibration.depth, calibration.color
+    k = max(1, int(c.fx / d.fx))
+    grid_width, grid_height = -(-color_size[0] // k), -(-color_size[1] // k)
+    depth_matrix = np.array([[d.fx, 0, d.cx], [0, d.fy, d.cy], [0, 0, 1]])
+    grid_matrix = np.array([[c.fx / k, 0, (c.cx - (k - 1) / 2.0) / k], [0, c.fy / k, (c.cy - (k - 1) / 2.0) / k], [0, 0, 1]])
+    rotation = np.array(calibration.rotation).reshape(3, 3)
+    translation = np.array(calibration.translation)
+    rvec = cv2.Rodrigues(rotation)[0]
+    grid = np.full((grid_height, grid_width), 65535, dtype=np.int64)
+    for v, u in zip(*np.nonzero(depth)):
+        z = float(depth[v, u])
+        ray = cv2.undistortPoints(np.array([[[u, v]]], dtype=np.float64), depth_matrix,
+                                  np.array(calibration.depth_distortion) if calibration.depth_distortion else None)[0, 0]
+        point = np.array([ray[0] * z, ray[1] * z, z])
+        z_color = (rotation @ point + translation)[2]
+        projected = cv2.projectPoints(point.reshape(1, 1, 3), rvec, translation, grid_matrix,
+                                      np.array(calibration.color_distortion) if calibration.color_distortion else None)[0][0, 0]
+        cell_u, cell_v = int(math.floor(projected[0] + 0.5)), int(math.floor(projected[1] + 0.5))
+        if z_color >= 1.0 and 0 <= cell_u < grid_width and 0 <= cell_v < grid_height:
+            grid[cell_v, cell_u] = min(grid[cell_v, cell_u], int(min(z_color + 0.5, 65534)))
+    filled = grid.copy()
+    for v, u in zip(*np.nonzero(grid == 65535)):
+        filled[v, u] = grid[max(v - 1, 0):v + 2, max(u - 1, 0):u + 2].min()
+    filled[filled == 65535] = 0
+    filled = np.repeat(np.repeat(filled, k, axis=0), k, axis=1)
+    return filled[:color_size[1], :color_size[0]].astype(np.uint16)
+
+
+def assert_close(result, expected):
+    assert result.shape == expected.shape and result.dtype == np.uint16
+    # float32 against float64: a point on a cell border may land in the next one
+    assert np.mean(result != expected) < 0.01
+    both = (result > 0) & (expected > 0)
+    assert np.abs(result[both].astype(np.int64) - expected[both]).max() <= 1
+
+
+@pytest.mark.parametrize("depth_size, color_size", [((64, 58), (64, 36)), ((32, 29), (256, 144)), ((32, 32), (160, 120))])
+def test_nominal_registration_matches_the_reference(depth_size, color_size):
+    depth = synthetic_depth(*depth_size)
+    result = DepthRegistration().register(depth, color_size)
+    assert_close(result, reference(depth, color_size, nominal_calibration(depth_size, color_size)))
+
+
+def test_calibrated_registration_matches_the_reference():
+    depth = synthetic_depth(32, 29, index=3)
+    # Holes of invalid depth
+    depth[::5, ::3] = 0
+    calibration = calibrated((32, 29), (256, 144))
+    result = DepthRegistration(calibration).register(depth, (256, 144))
+    assert_close(result, reference(depth, (256, 144), calibration))
+
+
+def test_calibration_is_scaled_to_the_frames():
+    calibration = calibrated((64, 58), (512, 288))
+    registration = DepthRegistration(calibration)
+    depth = synthetic_depth(32, 29)
+    assert_close(registration.register(depth, (256, 144)),
+                 reference(depth, (256, 144), calibration.scaled((32, 29), (256, 144))))
+    # Setups are kept per resolution
+    registration.register(depth, (256, 144))
+    assert list(registration.setups) == [((29, 32), (256, 144))]
+    with pytest.raises(ValueError):
+        registration.register(synthetic_depth(32, 32), (256, 144))
+
+
+def test_no_depth():
+    result = DepthRegistration().register(np.zeros((29, 32), dtype=np.uint16), (256, 144))
+    assert result.shape == (144, 256) and not result.any()
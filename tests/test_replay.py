@@ -0,0 +1,89 @@
+import os
+import cv2
+import numpy as np
+import pytest
+from azure_kinect_depth_codec import RvlCodec
+from azure_kinect_manifest import Manifest, save_volumes, shot_files
+from azure_kinect_replay import FAST, ReplaySource, list_frames
+
+
+def write_frame(folder, depth_subdir, name, value, codec=None):
+    for subdir in ("color", depth_subdir):
+        os.makedirs(os.path.join(folder, subdir), exist_ok=True)
+    cv2.imwrite(os.path.join(folder, "color", name + ".jpg"), np.full((8, 8, 3), value, dtype=np.uint8))
+    depth = np.full((8, 8), value * 10, dtype=np.uint16)
+    if codec is None:
+        cv2.imwrite(os.path.join(folder, depth_subdir, name + ".png"), depth)
+    else:
+        codec.write(os.path.join(folder, depth_subdir, name + codec.extension), depth)
+
+
+def test_frames_of_a_manifest_in_capture_order(tmp_path):
+    folder = str(tmp_path)
+    manifest = Manifest(folder)
+    # Saved by a pool: out of order
+    for shot, timestamp_usec in ((1, 2000), (2, 1000), (3, 3000)):
+        write_frame(folder, "depth/raw", str(shot), shot)
+        manifest.append(shot, shot_files(str(shot), ["color", "depth/raw"]), timestamp_usec, device=0)
+    manifest.append(4, shot_files("4", [], pack="session.pack"), 4000)
+    frames = list_frames(folder)
+    assert [(timestamp_usec, os.path.basename(color)) for timestamp_usec, color, _, _ in frames] == \
+        [(1000, "2.jpg"), (2000, "1.jpg"), (3000, "3.jpg")]
+    assert frames[0][2] == os.path.join(folder, "depth/raw/2.png") and frames[0][3] == 0
+
+
+def test_frames_of_a_recording_by_modification_time(tmp_path):
+    folder = str(tmp_path)
+    # record/<session> layout: depth/ next to color/
+    for name, mtime in (("000001", 30), ("000002", 10), ("000003", 20)):
+        write_frame(folder, "depth", name, 1, RvlCodec())
+        os.utime(os.path.join(folder, "color", name + ".jpg"), (mtime, mtime))
+    # Color without depth
+    cv2.imwrite(os.path.join(folder, "color", "000004.jpg"), np.zeros((8, 8, 3), dtype=np.uint8))
+    frames = list_frames(folder)
+    assert [os.path.basename(color) for _, color, _, _ in frames] == ["000002.jpg", "000003.jpg", "000001.jpg"]
+    assert frames[0][0] == 10 * 10 ** 6 and frames[0][2].endswith(".rvl")
+
+
+def test_frames_striped_over_volumes(tmp_path):
+    folder, other = str(tmp_path / "disk1" / "frames"), str(tmp_path / "disk2" / "frames")
+    for root, name in ((folder, "1"), (other, "2")):
+        write_frame(root, "depth/raw", name, 1)
+        os.utime(os.path.join(root, "color", name + ".jpg"), (int(name), int(name)))
+    save_volumes(folder, [folder, other])
+    expected = [os.path.join(folder, "color", "1.jpg"), os.path.join(other, "color", "2.jpg")]
+    assert [color for _, color, _, _ in list_frames(folder)] == expected
+    manifest = Manifest(folder)
+    manifest.append(2, shot_files("2", ["color", "depth/raw"]), 2000, volume=1)
+    manifest.append(1, shot_files("1", ["color", "depth/raw"]), 1000)
+    assert [color for _, color, _, _ in list_frames(folder)] == expected
+
+
+def test_replay_as_fast_as_possible(tmp_path):
+    folder = str(tmp_path)
+    for name, mtime in (("1", 1), ("2", 2)):
+        write_frame(folder, "depth/raw", name, int(name))
+        os.utime(os.path.join(folder, "color", name + ".jpg"), (mtime, mtime))
+    source = ReplaySource(folder, FAST, loop=True, workers=1)
+    frames = [source.read_frame() for _ in range(4)]
+    source.close()
+    assert [frame[0] for frame in frames] == [1, 2, 3, 4]
+    # Looping keeps the timestamps increasing, one frame interval between passes
+    assert [frame[1] - frames[0][1] for frame in frames] == [0, 10 ** 6, 2 * 10 ** 6, 3 * 10 ** 6]
+    assert [int(frame[3][0, 0]) for frame in frames] == [10, 20, 10, 20]
+    assert frames[0][2].shape == (8, 8, 3)
+
+
+def test_replay_finishes(tmp_path):
+    write_frame(str(tmp_path), "depth/raw", "1", 1)
+    source = ReplaySource(str(tmp_path), FAST)
+    assert source.read_frame() is not None
+    assert source.read_frame(timeout=0) is None and source.finished
+    source.close()
+
+
+def test_nothing_to_replay(tmp_path):
+    with pytest.raises(RuntimeError):
+        ReplaySource(str(tmp_path))
+    with pytest.raises(ValueError):
+        ReplaySource(str(tmp_path), timing="slow")
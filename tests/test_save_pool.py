@@ -0,0 +1,59 @@
+import threading
+import pytest
+from PySide6.QtCore import QCoreApplication
+from azure_kinect_save_pool import SavePool
+
+
+@pytest.fixture(scope="module")
+def app():
+    # Signals of the writer threads are delivered by the event loop
+    return QCoreApplication.instance() or QCoreApplication([])
+
+
+def collect(pool):
+    events = []
+    pool.saved.connect(lambda name: events.append(("saved", name)))
+    pool.failed.connect(lambda name, error: events.append(("failed", name)))
+    return events
+
+
+def test_jobs_report_saved_or_failed(app):
+    pool = SavePool(max_workers=2)
+    events = collect(pool)
+
+    def fail():
+        raise IOError("disk full")
+
+    assert pool.submit("1", lambda: None)
+    assert pool.submit("2", fail)
+    pool.shutdown()
+    app.processEvents()
+    assert sorted(events) == [("failed", "2"), ("saved", "1")]
+    assert pool.backlog() == 0
+
+
+def test_backlog_is_capped(app):
+    pool = SavePool(max_workers=1, max_pending=2)
+    backlog = []
+    pool.backlogChanged.connect(backlog.append)
+    release = threading.Event()
+    assert pool.submit("1", release.wait)
+    assert pool.submit("2", release.wait)
+    # Full: the caller is told instead of queueing without limit
+    assert not pool.submit("3", release.wait)
+    release.set()
+    pool.shutdown()
+    app.processEvents()
+    assert pool.backlog() == 0
+    assert backlog[:2] == [1, 2] and backlog[-1] == 0
+
+
+def test_job_giving_up_is_neither_saved_nor_failed(app):
+    pool = SavePool(max_workers=1)
+    events = collect(pool)
+    # An unmatched shot: the job reported it itself
+    assert pool.submit("1", lambda: False)
+    pool.shutdown()
+    app.processEvents()
+    assert events == []
+    assert pool.backlog() == 0
@@ -0,0 +1,93 @@
+import os
+import types
+import numpy as np
+import pytest
+import azure_kinect_shared_memory
+from azure_kinect_shared_memory import HEADER_LAST_SEQUENCE, HEADER_PID, WRITING, SharedFrameRing, SharedMemoryFrameSource
+
+COLOR_SHAPE = (6, 8, 3)
+DEPTH_SHAPE = (6, 8)
+
+
+def frame(sequence):
+    return np.full(COLOR_SHAPE, sequence, dtype=np.uint8), np.full(DEPTH_SHAPE, sequence * 100, dtype=np.uint16)
+
+
+@pytest.fixture
+def ring(request, monkeypatch):
+    # Readers attached in this process must keep the registration of the writer
+    monkeypatch.setattr(azure_kinect_shared_memory, "resource_tracker", types.SimpleNamespace(unregister=lambda name, rtype: None))
+    name = "kinect_test_{}_{}".format(os.getpid(), request.node.name[-24:])
+    ring = SharedFrameRing(name, COLOR_SHAPE, DEPTH_SHAPE, slots=3, create=True)
+    yield ring
+    if ring.header is not None:
+        ring.unlink()
+
+
+def test_reader_gets_the_newest_frame(ring):
+    source = SharedMemoryFrameSource(ring.name)
+    assert source.read_frame(timeout=0) is None
+    for sequence in (1, 2, 3, 4):
+        ring.write(*frame(sequence), timestamp_usec=sequence * 1000)
+    sequence, timestamp_usec, color, depth = source.read_frame()
+    assert (sequence, timestamp_usec) == (4, 4000)
+    assert color.shape == COLOR_SHAPE and depth.dtype == np.uint16
+    assert color[0, 0, 0] == 4 and depth[0, 0] == 400
+    # Nothing newer yet
+    assert source.read_frame(timeout=0) is None
+    ring.write(*frame(5))
+    ring.write(*frame(6))
+    assert source.read_frame()[0] == 6
+    assert source.dropped == 1
+    source.close()
+
+
+def test_lapped_views_are_invalid(ring):
+    ring.write(*frame(1))
+    sequence, _, color, _ = ring.read_latest(copy=False)
+    assert ring.is_valid(sequence)
+    # The writer comes back to the slot of the view
+    for next_sequence in range(2, 2 + ring.slots):
+        ring.write(*frame(next_sequence))
+    assert not ring.is_valid(sequence)
+    assert color[0, 0, 0] == 1 + ring.slots
+
+
+def test_torn_frame_is_not_returned(ring):
+    ring.write(*frame(1))
+    # Writer preempted in the middle of the next slot
+    ring.header[HEADER_LAST_SEQUENCE] = 2
+    ring.slot_table[2 % ring.slots, 0] = WRITING
+    assert ring.read_latest() is None
+
+
+def test_readers_follow_a_restarted_streamer(ring):
+    source = SharedMemoryFrameSource(ring.name)
+    ring.write(*frame(1))
+    ring.write(*frame(2))
+    assert source.read_frame()[0] == 2
+    # Streamer restarted: new segment under the same name, sequences from 1
+    ring.unlink()
+    restarted = SharedFrameRing(ring.name, COLOR_SHAPE, DEPTH_SHAPE, slots=3, create=True)
+    restarted.write(*frame(1))
+    assert source.read_frame()[0] == 1
+    source.close()
+    restarted.unlink()
+
+
+def test_stale_segment_is_replaced(ring):
+    ring.write(*frame(1))
+    # Left behind by a crashed streamer
+    ring.close()
+    replaced = SharedFrameRing(ring.name, COLOR_SHAPE, DEPTH_SHAPE, slots=3, create=True)
+    assert replaced.last_sequence() == 0
+    replaced.unlink()
+
+
+def test_live_segment_is_kept(ring):
+    assert ring.header[HEADER_PID] == os.getpid()
+    # Owned by another streamer still running
+    ring.header[HEADER_PID] = os.getppid()
+    with pytest.raises(FileExistsError):
+        SharedFrameRing(ring.name, COLOR_SHAPE, DEPTH_SHAPE, slots=3, create=True)
+    assert ring.is_alive()
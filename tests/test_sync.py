@@ -0,0 +1,41 @@
+from azure_kinect_frame_ring import FrameRing
+from azure_kinect_sync import match_frames
+
+
+def history(*timestamps):
+    frames = FrameRing(len(timestamps))
+    for sequence, timestamp_usec in enumerate(timestamps):
+        frames.append(timestamp_usec, sequence, None, None)
+    return frames
+
+
+def test_newest_master_frame_with_a_match_wins():
+    master = history(1000, 34000, 67000)
+    # The subordinate missed the newest master frame
+    subordinate = history(1200, 34300, 90000)
+    chosen, spread = match_frames([master, subordinate], tolerance_usec=500)
+    assert [entry[0] for entry in chosen] == [34000, 34300]
+    assert spread == 300
+
+
+def test_no_match_reports_the_smallest_spread():
+    chosen, spread = match_frames([history(1000, 34000), history(17000), history(20000)], tolerance_usec=500)
+    assert chosen is None
+    assert spread == 17000
+
+
+def test_empty_history():
+    assert match_frames([history(1000), history()], tolerance_usec=500) == (None, None)
+
+
+def test_single_device():
+    chosen, spread = match_frames([history(1000, 34000)], tolerance_usec=0)
+    assert chosen[0][:2] == (34000, 1)
+    assert spread == 0
+
+
+def test_plain_lists_of_entries():
+    # (timestamp, sequence) pairs of capture processes
+    chosen, spread = match_frames([[(1000, 1), (34000, 2)], [(33800, 7)]], tolerance_usec=500)
+    assert chosen == [(34000, 2), (33800, 7)]
+    assert spread == 200
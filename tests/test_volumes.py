@@ -0,0 +1,72 @@
+import os
+import pytest
+from azure_kinect_manifest import load_volumes
+from azure_kinect_volumes import FREE_SPACE, ROUND_ROBIN, THROUGHPUT, VolumeFullError, VolumeSet, volume_roots
+
+MB = 2 ** 20
+
+
+def volume_set(tmp_path, policy, free_mb, reserve_mb=100):
+    # Free space stood in for, the watchdog off
+    volumes = VolumeSet([str(tmp_path / str(i)) for i in range(len(free_mb))], policy, reserve_mb=reserve_mb, check_interval=0)
+    volumes.free = [mb * MB for mb in free_mb]
+    return volumes
+
+
+def write(volumes, size):
+    with volumes.write() as write:
+        write.size = size
+    return write.index
+
+
+def test_round_robin_skips_full_volumes(tmp_path):
+    volumes = volume_set(tmp_path, ROUND_ROBIN, [1000, 50, 1000])
+    assert [write(volumes, MB) for _ in range(4)] == [0, 2, 0, 2]
+
+
+def test_free_space_picks_the_emptiest_volume(tmp_path):
+    volumes = volume_set(tmp_path, FREE_SPACE, [300, 500, 400])
+    # Written bytes count until the next check
+    assert [write(volumes, 150 * MB) for _ in range(3)] == [1, 2, 1]
+    assert [stats["written_mb"] for stats in volumes.stats()] == [0, 300, 150]
+
+
+def test_throughput_prefers_the_fastest_volume(tmp_path):
+    volumes = volume_set(tmp_path, THROUGHPUT, [1000, 1000], reserve_mb=0)
+    # Measured first, then the soonest done
+    assert [write(volumes, MB) for _ in range(2)] == [0, 1]
+    volumes.rate = [10 * MB, 100 * MB]
+    assert write(volumes, MB) == 1
+    # Bytes in flight on the fast one
+    volumes.rate = [10 * MB, 100 * MB]
+    volumes.in_flight[1] = 50 * MB
+    assert write(volumes, MB) == 0
+
+
+def test_writes_fail_before_anything_is_written_when_all_are_full(tmp_path):
+    volumes = volume_set(tmp_path, ROUND_ROBIN, [150, 150])
+    write(volumes, 40 * MB)
+    write(volumes, 40 * MB)
+    # The next write is expected to be as large as the last ones
+    with pytest.raises(VolumeFullError):
+        with volumes.write():
+            pytest.fail("no volume should be chosen")
+    assert volumes.in_flight == [0, 0]
+
+
+def test_check_reports_full_volumes(tmp_path):
+    volumes = VolumeSet([str(tmp_path)], reserve_mb=10 ** 12, check_interval=0)
+    assert volumes.paused and volumes.stats()[0]["full"]
+    with pytest.raises(VolumeFullError):
+        write(volumes, MB)
+
+
+def test_layout_and_volume_list(tmp_path):
+    roots = volume_roots(str(tmp_path / "disk1" / "frames"), [str(tmp_path / "disk2"), str(tmp_path / "disk3")])
+    assert roots[1:] == [str(tmp_path / "disk2" / "frames"), str(tmp_path / "disk3" / "frames")]
+    volumes = VolumeSet(roots, check_interval=0)
+    volumes.make_dirs(["color", "depth/raw"])
+    assert all(os.path.isdir(os.path.join(root, "depth", "raw")) for root in roots)
+    assert load_volumes(roots[0]) == roots
+    with pytest.raises(ValueError):
+        VolumeSet(roots, policy="random")